@@ -0,0 +1,363 @@
+"""
+bench_pipeline.py
+=================
+
+This script benchmarks every stage of the pipeline end to end on synthetic
+data, so changes to the scripts in `src` can be checked for regressions.
+
+1. Generated RSS feeds and silent MP3s are served from a local HTTP server.
+2. `extract_metadata`, `download_audio` and `transcribe_audio` run against
+them in a temporary working directory. Transcription uses a fake model with
+deterministic timing instead of WhisperX.
+3. If a Postgres DSN is given (or `--docker` starts a throwaway container),
+the four loaders write the results into it.
+
+Each stage runs in its own process, and its throughput and peak RSS are
+printed and saved to `benchmarks/results` as JSON. Passing an earlier results
+file to `--compare` prints the change in throughput for each stage.
+
+Usage
+-----
+
+To execute this script, run:
+    python3 benchmarks/bench_pipeline.py --feeds 10 --episodes 40
+
+To also benchmark the loaders against a local Postgres, run:
+    python3 benchmarks/bench_pipeline.py --dsn "host=localhost dbname=csmap ..."
+
+"""
+
+import argparse
+import contextlib
+import multiprocessing
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, os.path.join(REPO_DIR, "src"))
+sys.path.insert(0, BENCH_DIR)
+
+import fixtures  # noqa: E402
+
+# The directory benchmark results are saved to
+RESULTS_DIR = os.path.join(BENCH_DIR, "results")
+# The year the generated feeds are filtered by
+TARGET_YEAR = 2024
+
+
+def parse_arguments() -> argparse.Namespace:
+    """Parses command-line arguments for the benchmark size and targets.
+
+    Returns
+    -------
+    argparse.Namespace
+        An object containing the benchmark settings.
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--feeds", type=int, default=10, help="Number of feeds.")
+    parser.add_argument(
+        "--episodes", type=int, default=40, help="Number of episodes per feed."
+    )
+    parser.add_argument(
+        "--audio-seconds",
+        type=float,
+        default=600.0,
+        help="Length of each generated MP3 in seconds.",
+    )
+    parser.add_argument(
+        "--realtime-factor",
+        type=float,
+        default=fixtures.FAKE_REALTIME_FACTOR,
+        help="Seconds of fake inference per second of audio.",
+    )
+    parser.add_argument(
+        "--dsn", help="DSN of a Postgres database named csmap to load into."
+    )
+    parser.add_argument(
+        "--docker",
+        action="store_true",
+        help="Start a throwaway Postgres container to load into.",
+    )
+    parser.add_argument(
+        "--compare", help="A previous results file to compare throughput against."
+    )
+    parser.add_argument(
+        "--verbose", action="store_true", help="Show the output of each stage."
+    )
+
+    return parser.parse_args()
+
+
+def stage_extract(context: Dict[str, Any]) -> Dict[str, Any]:
+    """Extracts metadata from the served feeds and saves it."""
+    import extract_metadata
+    import utils
+
+    all_show_metadata, all_episode_metadata = extract_metadata.extract_all_metadata(
+        context["feed_urls"], target_year=TARGET_YEAR
+    )
+
+    utils.save_data(
+        all_show_metadata, utils.get_stage_path("show_metadata"), "show_metadata"
+    )
+    utils.save_data(
+        all_episode_metadata,
+        utils.get_stage_path("episode_metadata"),
+        "episode_metadata",
+    )
+
+    return {"items": len(context["feed_urls"]), "unit": "feeds"}
+
+
+def stage_download(context: Dict[str, Any]) -> Dict[str, Any]:
+    """Downloads the audio for every extracted episode."""
+    import download_audio
+    import utils
+
+    episode_metadata = utils.read_data(utils.get_stage_path("episode_metadata"))
+    download_audio.download_audio_parallel(episode_metadata)
+
+    total_bytes = sum(
+        os.path.getsize(os.path.join("episode_audio", f))
+        for f in os.listdir("episode_audio")
+        if f.endswith(".mp3")
+    )
+
+    return {"items": total_bytes / 1e6, "unit": "MB"}
+
+
+def stage_transcribe(context: Dict[str, Any]) -> Dict[str, Any]:
+    """Transcribes the downloaded audio with the fake model."""
+    import transcribe_audio
+
+    fixtures.FAKE_REALTIME_FACTOR = context["realtime_factor"]
+    transcribe_audio.transcribe_audio_parallel(
+        transcribe_audio.AUDIO_DIR,
+        transcribe_audio.TRANSCRIPT_DIR,
+        initializer=fixtures.init_fake_worker,
+    )
+    transcribe_audio.save_transcriptions(transcribe_audio.TRANSCRIPT_DIR)
+
+    audio_seconds = sum(
+        fixtures.get_mp3_duration(os.path.join(transcribe_audio.AUDIO_DIR, f))
+        for f in os.listdir(transcribe_audio.AUDIO_DIR)
+    )
+
+    return {"items": audio_seconds, "unit": "audio-seconds"}
+
+
+def stage_load(context: Dict[str, Any]) -> Dict[str, Any]:
+    """Writes every stage's output into Postgres with the four loaders."""
+    import insert_data_into_postgres_episode
+    import insert_data_into_postgres_full_text
+    import insert_data_into_postgres_segmented_text
+    import insert_data_into_postgres_show
+    import utils
+
+    rows = 0
+    for loader in (
+        insert_data_into_postgres_show,
+        insert_data_into_postgres_episode,
+        insert_data_into_postgres_full_text,
+        insert_data_into_postgres_segmented_text,
+    ):
+        data = utils.read_data(loader.data_file_path)
+        if loader is insert_data_into_postgres_segmented_text:
+            rows += sum(len(row["segmented_text"]) for row in data)
+        else:
+            rows += len(data)
+        loader.write_to_postgres(context["dsn"], data)
+
+    return {"items": rows, "unit": "rows"}
+
+
+STAGES = [
+    ("extract", stage_extract),
+    ("download", stage_download),
+    ("transcribe", stage_transcribe),
+    ("load", stage_load),
+]
+
+
+def _run_stage_in_child(
+    func: Callable[[Dict[str, Any]], Dict[str, Any]],
+    context: Dict[str, Any],
+    conn: Any,
+):
+    """Runs a stage in the current process and sends its metrics back."""
+    os.chdir(context["work_dir"])
+
+    try:
+        with contextlib.ExitStack() as stack:
+            # The scripts print a line per row or file, so hide it by default
+            if not context["verbose"]:
+                devnull = stack.enter_context(open(os.devnull, "w"))
+                stack.enter_context(contextlib.redirect_stdout(devnull))
+
+            start = time.perf_counter()
+            metrics = func(context)
+            metrics["seconds"] = time.perf_counter() - start
+    except Exception as e:
+        conn.send({"error": repr(e)})
+        return
+
+    # ru_maxrss is in kilobytes on Linux; take the larger of this process and
+    # any worker processes it started
+    peak_rss = max(
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+    )
+    metrics["peak_rss_mb"] = peak_rss / 1024
+    conn.send(metrics)
+
+
+def run_stage(
+    name: str,
+    func: Callable[[Dict[str, Any]], Dict[str, Any]],
+    context: Dict[str, Any],
+) -> Dict[str, Any]:
+    """Runs a stage in a fresh process so its peak RSS is measured on its own.
+
+    Parameters
+    ----------
+    name : str
+        The stage's name.
+    func : callable
+        The stage function, which returns the amount of work it did.
+    context : dict
+        Settings shared by every stage.
+
+    Returns
+    -------
+    result : dict
+        The stage's timing, throughput and peak RSS.
+    """
+    mp_context = multiprocessing.get_context("spawn")
+    parent_conn, child_conn = mp_context.Pipe(duplex=False)
+    process = mp_context.Process(
+        target=_run_stage_in_child, args=(func, context, child_conn)
+    )
+    process.start()
+    metrics = parent_conn.recv()
+    process.join()
+
+    result = {"stage": name, **metrics}
+    if "error" not in result:
+        result["rate"] = result["items"] / result["seconds"]
+
+    return result
+
+
+def get_git_commit() -> str:
+    """Returns the current commit's short hash, or "unknown" outside git."""
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=REPO_DIR,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def print_results(results: List[Dict[str, Any]], previous: Optional[Dict[str, Any]]):
+    """Prints each stage's results, with the change since a previous run."""
+    previous_rates = {}
+    if previous:
+        previous_rates = {
+            r["stage"]: r["rate"] for r in previous["stages"] if "rate" in r
+        }
+
+    print(
+        f"\n{'stage':<12}{'seconds':>10}{'throughput':>24}{'peak RSS MB':>14}"
+        f"{'vs previous':>14}"
+    )
+    for result in results:
+        if "error" in result:
+            print(f"{result['stage']:<12}  failed: {result['error']}")
+            continue
+
+        change = ""
+        if result["stage"] in previous_rates:
+            ratio = result["rate"] / previous_rates[result["stage"]] - 1
+            change = f"{ratio:+.1%}"
+
+        throughput = f"{result['rate']:.1f} {result['unit']}/s"
+        print(
+            f"{result['stage']:<12}{result['seconds']:>10.2f}{throughput:>24}"
+            f"{result['peak_rss_mb']:>14.1f}{change:>14}"
+        )
+
+
+def main():
+    args = parse_arguments()
+
+    import utils
+
+    dsn = args.dsn
+    if args.docker and not dsn:
+        dsn = fixtures.start_postgres_container(os.path.join(REPO_DIR, "ddl"))
+        if dsn is None:
+            print("Docker is not available, so the load stage will be skipped.")
+    elif dsn:
+        fixtures.create_tables(dsn, os.path.join(REPO_DIR, "ddl"))
+
+    results = []
+    try:
+        with fixtures.FeedServer(
+            args.feeds, args.episodes, args.audio_seconds, TARGET_YEAR
+        ) as server, tempfile.TemporaryDirectory() as work_dir:
+            os.makedirs(os.path.join(work_dir, utils.DATA_DIR))
+            context = {
+                "work_dir": work_dir,
+                "feed_urls": server.feed_urls,
+                "realtime_factor": args.realtime_factor,
+                "dsn": dsn,
+                "verbose": args.verbose,
+            }
+
+            for name, func in STAGES:
+                if name == "load" and not dsn:
+                    continue
+                print(f"Running {name}...")
+                results.append(run_stage(name, func, context))
+    finally:
+        if args.docker and not args.dsn and dsn:
+            fixtures.stop_postgres_container()
+
+    previous = utils.read_data_from_json(args.compare) if args.compare else None
+    print_results(results, previous)
+
+    # Save the results so later commits can be compared against them
+    commit = get_git_commit()
+    timestamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    path = os.path.join(RESULTS_DIR, f"{timestamp}-{commit}.json")
+    utils.save_data_to_json(
+        {
+            "commit": commit,
+            "timestamp": timestamp,
+            "settings": {
+                "feeds": args.feeds,
+                "episodes_per_feed": args.episodes,
+                "audio_seconds": args.audio_seconds,
+                "realtime_factor": args.realtime_factor,
+            },
+            "stages": results,
+        },
+        path,
+    )
+    print(f"\nSaved results to {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+"""
+bench_row_encoding.py
+=====================
+
+This script compares the ways the show loader can turn records into query
+parameters, using the shows in `data/show_metadata.json`:
+
+1. `legacy`: the loaders' old path. Each nested field is encoded with
+`json.dumps` in place, missing keys are filled in a second loop, and the row
+is hashed from the resulting dictionary.
+2. `compiled`: the encoder from `row_encoder.compile_row_encoder`, once for
+each JSON backend.
+
+Both include psycopg adapting the parameters for the wire, which is where the
+`Jsonb` values from the compiled encoder are sent in binary. No database is
+needed.
+
+Usage
+-----
+
+To execute this script, run:
+    python3 benchmarks/bench_row_encoding.py --copies 100
+
+"""
+
+import argparse
+import copy
+import json
+import os
+import sys
+import time
+from typing import Any, Callable, Dict, List
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(REPO_DIR, "src"))
+
+from psycopg.adapt import PyFormat, Transformer  # noqa: E402
+
+import insert_data_into_postgres_show as loader  # noqa: E402
+import row_encoder as row_encoder  # noqa: E402
+import utils as utils  # noqa: E402
+
+BACKENDS = ["json", "orjson", "msgspec"]
+
+
+def parse_arguments() -> argparse.Namespace:
+    """Parses command-line arguments for the payload size.
+
+    Returns
+    -------
+    argparse.Namespace
+        An object containing the data path, copies and repeats.
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--path",
+        default=os.path.join(REPO_DIR, "data", "show_metadata.json"),
+        help="The show metadata to encode.",
+    )
+    parser.add_argument(
+        "--copies",
+        type=int,
+        default=100,
+        help="How many times the shows are repeated, for a measurable run.",
+    )
+    parser.add_argument(
+        "--repeat", type=int, default=3, help="Runs per measurement (best is kept)."
+    )
+
+    return parser.parse_args()
+
+
+def encode_legacy(rows: List[Dict[str, Any]]) -> List[List[Any]]:
+    """Prepares rows the way the loaders did before the compiled encoder."""
+    params = []
+    for row in rows:
+        for field in loader.json_fields:
+            if field in row and row[field] is not None:
+                row[field] = json.dumps(row[field])
+            else:
+                row[field] = None
+        for key in loader.expected_keys:
+            if key not in row:
+                row[key] = None
+        row["row_hash"] = utils.get_row_hash(row, loader.expected_keys)
+
+        # psycopg reads named parameters out of the dictionary in query order
+        params.append([row[column] for column in loader.columns])
+
+    return params
+
+
+def adapt(params: List[Any], transformer: Transformer):
+    """Dumps each row's parameters to the bytes psycopg sends."""
+    formats = [PyFormat.AUTO] * len(loader.columns)
+    for row in params:
+        transformer.dump_sequence(row, formats)
+
+
+def best_time(func: Callable[[], Any], setup: Callable[[], Any], repeat: int) -> float:
+    """Runs a function several times and returns the fastest time in seconds."""
+    times = []
+    for _ in range(repeat):
+        argument = setup()
+        start = time.perf_counter()
+        func(argument)
+        times.append(time.perf_counter() - start)
+
+    return min(times)
+
+
+def main():
+    args = parse_arguments()
+    shows = utils.read_data(args.path) * args.copies
+    transformer = Transformer()
+
+    # The legacy path modifies the records, so each run gets its own copy of
+    # every one (the repeated shows are otherwise the same objects)
+    def fresh_copies():
+        return [copy.deepcopy(show) for show in shows]
+
+    legacy = best_time(
+        lambda rows: adapt(encode_legacy(rows), transformer),
+        fresh_copies,
+        args.repeat,
+    )
+
+    print(f"\n{len(shows)} show rows")
+    print(f"{'encoder':<20}{'seconds':>10}{'rows/s':>12}{'speedup':>10}")
+    print(f"{'legacy':<20}{legacy:>10.3f}{len(shows) / legacy:>12,.0f}{1:>10.2f}")
+
+    for backend in BACKENDS:
+        try:
+            encode_row = row_encoder.compile_row_encoder(
+                loader.expected_keys, loader.json_fields, backend=backend
+            )
+        except ImportError:
+            print(f"{'compiled ' + backend:<20}{'(not installed)':>10}")
+            continue
+
+        compiled = best_time(
+            lambda rows: adapt([encode_row(row) for row in rows], transformer),
+            lambda: shows,
+            args.repeat,
+        )
+        print(
+            f"{'compiled ' + backend:<20}{compiled:>10.3f}"
+            f"{len(shows) / compiled:>12,.0f}{legacy / compiled:>10.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+"""
+bench_serialization.py
+======================
+
+This script compares the JSON backends in `utils` on synthetic payloads shaped
+like the pipeline's real data: episode metadata records as produced by
+feedparser, and segmented transcripts as produced by WhisperX.
+
+For each backend, it reports the encoded size and the time to encode, decode
+and (optionally) zstd-compress the payload.
+
+Usage
+-----
+
+To execute this script, run:
+    python3 benchmarks/bench_serialization.py --episodes 2000 --segments 600
+
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+from typing import Any, Callable, Dict, List
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+import utils as utils  # noqa: E402
+
+BACKENDS = ["json", "orjson", "msgspec"]
+
+
+def parse_arguments() -> argparse.Namespace:
+    """Parses command-line arguments for the payload sizes.
+
+    Returns
+    -------
+    argparse.Namespace
+        An object containing the number of episodes and segments per episode.
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--episodes", type=int, default=2000, help="Number of episodes to generate."
+    )
+    parser.add_argument(
+        "--segments",
+        type=int,
+        default=600,
+        help="Number of transcript segments per episode.",
+    )
+    parser.add_argument(
+        "--repeat", type=int, default=3, help="Runs per measurement (best is kept)."
+    )
+
+    return parser.parse_args()
+
+
+def make_episode(index: int) -> Dict[str, Any]:
+    """Builds an episode record shaped like feedparser's output."""
+    base = f"https://feeds.example.com/show{index % 10}"
+    title = f"Episode {index}: a conversation about the news"
+    summary = "<p>" + "An in-depth look at this week's stories. " * 8 + "</p>"
+
+    return {
+        "id": f"episode-{index:06d}",
+        "title": title,
+        "title_detail": {
+            "type": "text/plain",
+            "language": None,
+            "base": base,
+            "value": title,
+        },
+        "links": [
+            {"rel": "alternate", "type": "text/html", "href": f"{base}/{index}"},
+            {
+                "length": "52345678",
+                "type": "audio/mpeg",
+                "href": f"https://cdn.example.com/audio/{index}.mp3",
+                "rel": "enclosure",
+            },
+        ],
+        "link": f"{base}/{index}",
+        "summary": summary,
+        "summary_detail": {
+            "type": "text/html",
+            "language": None,
+            "base": base,
+            "value": summary,
+        },
+        "published": "Tue, 05 Nov 2024 10:00:00 -0000",
+        "published_parsed": [2024, 11, 5, 10, 0, 0, 1, 310, 0],
+        "itunes_episodetype": "full",
+        "itunes_duration": "3600",
+        "authors": [{"name": "Example Media"}],
+        "author": "Example Media",
+        "author_detail": {"name": "Example Media"},
+        "image": {"href": f"https://cdn.example.com/images/{index}.jpg"},
+        "guidislink": False,
+    }
+
+
+def make_segmented_transcript(index: int, num_segments: int) -> Dict[str, Any]:
+    """Builds a segmented transcript record shaped like WhisperX's output."""
+    rng = random.Random(index)
+    words = ["the", "election", "campaign", "voters", "said", "today", "Trump"]
+    segments = []
+    start = 0.0
+
+    for _ in range(num_segments):
+        end = start + rng.uniform(2.0, 10.0)
+        text = " " + " ".join(rng.choice(words) for _ in range(rng.randint(8, 30)))
+        segments.append({"start": round(start, 3), "end": round(end, 3), "text": text})
+        start = end
+
+    return {"id": f"episode-{index:06d}", "segmented_text": segments}
+
+
+def best_time(func: Callable[[], Any], repeat: int) -> float:
+    """Runs a function several times and returns the fastest time in seconds."""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+
+    return min(times)
+
+
+def bench_payload(name: str, data: List[Dict[str, Any]], repeat: int):
+    """Prints encode/decode/compress timings for each backend on a payload."""
+    import zstandard
+
+    print(f"\n{name}")
+    print(
+        f"{'backend':<10}{'mode':<9}{'size MB':>10}{'zst MB':>9}"
+        f"{'encode s':>10}{'decode s':>10}{'zst s':>8}"
+    )
+
+    for backend in BACKENDS:
+        for compact in (False, True):
+            raw = utils.dumps_json(data, backend=backend, compact=compact)
+            assert utils.loads_json(raw, backend=backend) == utils.loads_json(
+                raw, backend="json"
+            )
+
+            encode = best_time(
+                lambda: utils.dumps_json(data, backend=backend, compact=compact),
+                repeat,
+            )
+            decode = best_time(lambda: utils.loads_json(raw, backend=backend), repeat)
+            compressor = zstandard.ZstdCompressor(level=utils.ZSTD_LEVEL)
+            compressed = compressor.compress(raw)
+            compress = best_time(lambda: compressor.compress(raw), repeat)
+
+            print(
+                f"{backend:<10}{'compact' if compact else 'indent':<9}"
+                f"{len(raw) / 1e6:>10.2f}{len(compressed) / 1e6:>9.2f}"
+                f"{encode:>10.3f}{decode:>10.3f}{compress:>8.3f}"
+            )
+
+
+def main():
+    args = parse_arguments()
+
+    episodes = [make_episode(i) for i in range(args.episodes)]
+    transcripts = [
+        make_segmented_transcript(i, args.segments)
+        for i in range(max(1, args.episodes // 10))
+    ]
+
+    bench_payload(f"Episode metadata ({len(episodes)} episodes)", episodes, args.repeat)
+    bench_payload(
+        f"Segmented transcripts ({len(transcripts)} x {args.segments} segments)",
+        transcripts,
+        args.repeat,
+    )
+
+
+if __name__ == "__main__":
+    main()
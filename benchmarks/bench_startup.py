@@ -0,0 +1,145 @@
+"""
+bench_startup.py
+================
+
+This script measures how long the pipeline's commands take to start, by
+running `src/cli.py` under `python -X importtime` in a fresh interpreter.
+
+For each command, it reports the fastest wall time, the time spent importing
+modules and the imports that took longest. A bare interpreter is measured
+too, since part of every command's time is Python's own startup. The
+commands are quick ones that exit before doing any work (`status`, a
+`--dry-run` and each command's `--help`), so they measure startup only.
+
+Usage
+-----
+
+To execute this script, run:
+    python3 benchmarks/bench_startup.py --repeat 5 --top 5
+
+"""
+
+import argparse
+import os
+import re
+import subprocess
+import sys
+import time
+from typing import Dict, List, Tuple
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CLI_PATH = os.path.join(REPO_DIR, "src", "cli.py")
+
+# The command lines to time, as arguments to `src/cli.py`. None times a bare
+# interpreter instead
+COMMANDS = {
+    "python (bare)": None,
+    "status": ["status"],
+    "pipeline --dry-run": ["pipeline", "--dry-run"],
+    "extract --help": ["extract", "--help"],
+    "download --help": ["download", "--help"],
+    "transcribe --help": ["transcribe", "--help"],
+    "load-show --help": ["load-show", "--help"],
+    "load-segmented-text --help": ["load-segmented-text", "--help"],
+    "ingest --help": ["ingest", "--help"],
+    "query --help": ["query", "--help"],
+}
+
+# A line of `-X importtime` output: self and cumulative microseconds, and the
+# module indented by its depth in the import tree
+IMPORTTIME_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)")
+
+
+def parse_arguments() -> argparse.Namespace:
+    """Parses command-line arguments for the measurements.
+
+    Returns
+    -------
+    argparse.Namespace
+        An object containing the repeats and the number of imports to list.
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--repeat", type=int, default=5, help="Runs per command (best is kept)."
+    )
+    parser.add_argument(
+        "--top", type=int, default=3, help="How many of the slowest imports to list."
+    )
+
+    return parser.parse_args()
+
+
+def parse_importtime(stderr: str) -> Tuple[float, List[Tuple[str, float]]]:
+    """Sums up `-X importtime` output.
+
+    Parameters
+    ----------
+    stderr : str
+        The interpreter's stderr.
+
+    Returns
+    -------
+    total : float
+        The seconds spent importing, over every module.
+    top_level : list of (str, float)
+        The modules imported directly (not by another module) and their
+        cumulative seconds, slowest first.
+    """
+    total = 0.0
+    top_level = []
+    for match in IMPORTTIME_LINE.finditer(stderr):
+        self_us, cumulative_us, indent, module = match.groups()
+        total += int(self_us) / 1e6
+        if len(indent) == 0:
+            top_level.append((module, int(cumulative_us) / 1e6))
+
+    return total, sorted(top_level, key=lambda item: item[1], reverse=True)
+
+
+def measure(arguments, repeat: int) -> Dict[str, object]:
+    """Runs a command several times and keeps its fastest run.
+
+    Parameters
+    ----------
+    arguments : list of str or None
+        The arguments to `src/cli.py`, or None for a bare interpreter.
+    repeat : int
+        How many times to run it.
+
+    Returns
+    -------
+    dict
+        The fastest run's wall time, import time and slowest imports.
+    """
+    command = [sys.executable, "-X", "importtime"]
+    command += ["-c", "pass"] if arguments is None else [CLI_PATH, *arguments]
+
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = subprocess.run(
+            command, cwd=REPO_DIR, capture_output=True, text=True, check=True
+        )
+        wall = time.perf_counter() - start
+        if best is None or wall < best["wall"]:
+            total, top_level = parse_importtime(result.stderr)
+            best = {"wall": wall, "imports": total, "top_level": top_level}
+
+    return best
+
+
+def main():
+    args = parse_arguments()
+
+    print(f"\n{'command':<30}{'wall (s)':>10}{'imports (s)':>13}  slowest imports")
+    for name, arguments in COMMANDS.items():
+        result = measure(arguments, args.repeat)
+        slowest = ", ".join(
+            f"{module} {seconds * 1000:.0f}ms"
+            for module, seconds in result["top_level"][: args.top]
+        )
+        print(f"{name:<30}{result['wall']:>10.3f}{result['imports']:>13.3f}  {slowest}")
+
+
+if __name__ == "__main__":
+    main()
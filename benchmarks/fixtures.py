@@ -0,0 +1,322 @@
+"""
+fixtures.py
+===========
+
+This script contains the synthetic inputs used by the pipeline benchmarks:
+generated RSS feeds and MP3s served from a local HTTP server, a fake
+transcription model with deterministic timing, and a helper that starts a
+throwaway Postgres container to load into.
+
+"""
+
+import os
+import shutil
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+from xml.sax.saxutils import escape
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+# One silent MPEG-1 Layer III frame: 128 kbps, 44.1 kHz, stereo, no padding.
+# Each frame holds 1152 samples, so it lasts 1152 / 44100 seconds
+MP3_FRAME = b"\xff\xfb\x90\x64" + b"\x00" * 413
+MP3_FRAME_SECONDS = 1152 / 44100
+
+# Seconds of fake inference per second of audio, set before starting workers
+FAKE_REALTIME_FACTOR = 0.001
+# Length of each fake transcript segment in seconds
+FAKE_SEGMENT_SECONDS = 6.0
+
+WORDS = ["the", "election", "campaign", "voters", "said", "today", "Trump", "Biden"]
+
+
+def make_mp3(duration: float) -> bytes:
+    """Builds a silent MP3 of roughly the given duration.
+
+    Parameters
+    ----------
+    duration : float
+        The length of the audio in seconds.
+
+    Returns
+    -------
+    bytes
+        The MP3 file contents.
+    """
+    return MP3_FRAME * max(1, int(duration / MP3_FRAME_SECONDS))
+
+
+def get_mp3_duration(path: str) -> float:
+    """Computes the duration of an MP3 built by `make_mp3`.
+
+    Parameters
+    ----------
+    path : str
+        The path to the MP3.
+
+    Returns
+    -------
+    float
+        The length of the audio in seconds.
+    """
+    return os.path.getsize(path) // len(MP3_FRAME) * MP3_FRAME_SECONDS
+
+
+def make_feed(
+    feed_index: int,
+    num_episodes: int,
+    base_url: str,
+    target_year: int,
+) -> str:
+    """Builds an RSS feed whose newest half of episodes is in `target_year`.
+
+    Parameters
+    ----------
+    feed_index : int
+        The feed's position, used to make titles and IDs unique.
+    num_episodes : int
+        The number of `<item>` elements in the feed.
+    base_url : str
+        The local server's URL, used for enclosure links.
+    target_year : int
+        The year the newest half of the episodes are published in.
+
+    Returns
+    -------
+    str
+        The feed's XML.
+    """
+    newest = datetime(target_year, 12, 1, 10, tzinfo=timezone.utc)
+    # Spread the episodes so about half fall before the target year
+    spacing = timedelta(days=max(1, 2 * 334 // max(1, num_episodes)))
+    items = []
+
+    for episode_index in range(num_episodes):
+        episode_id = f"feed{feed_index}-episode{episode_index}"
+        published = newest - spacing * episode_index
+        items.append(f"""
+    <item>
+      <title>Episode {episode_index} of show {feed_index}</title>
+      <description>{escape("<p>" + "A look at the week's news. " * 10 + "</p>")}</description>
+      <guid isPermaLink="false">{episode_id}</guid>
+      <pubDate>{format_datetime(published)}</pubDate>
+      <itunes:episodeType>full</itunes:episodeType>
+      <itunes:duration>3600</itunes:duration>
+      <itunes:author>Benchmark Media</itunes:author>
+      <enclosure url="{base_url}/audio/{episode_id}.mp3" type="audio/mpeg" length="0"/>
+    </item>""")
+
+    return f"""<?xml version="1.0" encoding="UTF-8"?>
+<rss version="2.0" xmlns:itunes="http://www.itunes.com/dtds/podcast-1.0.dtd">
+  <channel>
+    <title>Benchmark show {feed_index}</title>
+    <link>{base_url}/show/{feed_index}</link>
+    <language>en</language>
+    <itunes:author>Benchmark Media</itunes:author>
+    <itunes:type>episodic</itunes:type>{"".join(items)}
+  </channel>
+</rss>
+"""
+
+
+class FeedServer:
+    """A local HTTP server for generated feeds and MP3s.
+
+    Feeds are served at `/feed/<index>.xml` and every `/audio/<name>.mp3`
+    path returns a silent MP3 of `audio_seconds`.
+
+    Parameters
+    ----------
+    num_feeds : int
+        The number of feeds to serve.
+    episodes_per_feed : int
+        The number of episodes in each feed.
+    audio_seconds : float
+        The length of every MP3.
+    target_year : int
+        The year the newest half of each feed's episodes are published in.
+    """
+
+    def __init__(
+        self,
+        num_feeds: int,
+        episodes_per_feed: int,
+        audio_seconds: float,
+        target_year: int,
+    ):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self._make_handler())
+        self.server.daemon_threads = True
+        self.base_url = f"http://127.0.0.1:{self.server.server_port}"
+        self.feeds = [
+            make_feed(i, episodes_per_feed, self.base_url, target_year).encode()
+            for i in range(num_feeds)
+        ]
+        self.audio = make_mp3(audio_seconds)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def feed_urls(self) -> List[str]:
+        """The URL of every served feed."""
+        return [f"{self.base_url}/feed/{i}.xml" for i in range(len(self.feeds))]
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.startswith("/feed/"):
+                    index = int(self.path[len("/feed/") :].split(".")[0])
+                    body, content_type = server.feeds[index], "application/rss+xml"
+                elif self.path.startswith("/audio/"):
+                    body, content_type = server.audio, "audio/mpeg"
+                else:
+                    self.send_error(404)
+                    return
+
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def __enter__(self) -> "FeedServer":
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class FakeModel:
+    """A stand-in for the WhisperX model with deterministic output and timing.
+
+    It sleeps for `FAKE_REALTIME_FACTOR` seconds per second of audio and
+    returns one segment per `FAKE_SEGMENT_SECONDS`.
+    """
+
+    def transcribe(self, audio_file: str, language: str = "en") -> Dict[str, Any]:
+        duration = get_mp3_duration(audio_file)
+        time.sleep(duration * FAKE_REALTIME_FACTOR)
+
+        segments = []
+        start = 0.0
+        index = 0
+        while start < duration:
+            end = min(duration, start + FAKE_SEGMENT_SECONDS)
+            text = " " + " ".join(
+                WORDS[(index + offset) % len(WORDS)] for offset in range(12)
+            )
+            segments.append({"start": start, "end": end, "text": text})
+            start = end
+            index += 1
+
+        return {"segments": segments, "language": language}
+
+
+def init_fake_worker():
+    """Installs a `FakeModel` as the transcription model in a worker."""
+    import transcribe_audio
+
+    transcribe_audio.model = FakeModel()
+
+
+def start_postgres_container(ddl_dir: str, port: int = 55432) -> Optional[str]:
+    """Starts a throwaway Postgres container with the pipeline's tables.
+
+    Parameters
+    ----------
+    ddl_dir : str
+        The directory containing the table DDLs.
+    port : int, optional
+        The local port to expose Postgres on.
+
+    Returns
+    -------
+    str or None
+        A DSN for the container, or None if Docker isn't available.
+    """
+    if shutil.which("docker") is None:
+        return None
+
+    subprocess.run(
+        [
+            "docker",
+            "run",
+            "--rm",
+            "-d",
+            "--name",
+            "csmap-bench-postgres",
+            "-e",
+            "POSTGRES_PASSWORD=bench",
+            "-e",
+            "POSTGRES_DB=csmap",
+            "-p",
+            f"{port}:5432",
+            "postgres:16",
+        ],
+        check=True,
+        stdout=subprocess.DEVNULL,
+    )
+    dsn = f"host=127.0.0.1 dbname=csmap user=postgres password=bench port={port}"
+
+    import psycopg
+
+    # Wait for the server to accept connections
+    for _ in range(60):
+        try:
+            with psycopg.connect(dsn):
+                break
+        except psycopg.OperationalError:
+            time.sleep(1)
+
+    create_tables(dsn, ddl_dir)
+
+    return dsn
+
+
+def stop_postgres_container():
+    """Stops the container started by `start_postgres_container`."""
+    subprocess.run(
+        ["docker", "stop", "csmap-bench-postgres"],
+        check=False,
+        stdout=subprocess.DEVNULL,
+    )
+
+
+def create_tables(dsn: str, ddl_dir: str):
+    """Creates the pipeline's schemas and tables, dropping any existing ones.
+
+    The database in `dsn` must be named `csmap`, since the loaders use
+    fully-qualified `csmap.<schema>.<table>` names.
+
+    Parameters
+    ----------
+    dsn : str
+        A formatted string containing variables to make the Postgres
+        connection.
+    ddl_dir : str
+        The directory containing the table DDLs.
+    """
+    import psycopg
+
+    with psycopg.connect(dsn) as conn:
+        for schema in ("information", "transcript"):
+            conn.execute(f"DROP SCHEMA IF EXISTS {schema} CASCADE")
+            conn.execute(f"CREATE SCHEMA {schema}")
+
+        for name in sorted(os.listdir(ddl_dir)):
+            if name.endswith(".ddl"):
+                with open(os.path.join(ddl_dir, name), encoding="utf-8") as f:
+                    conn.execute(f.read())
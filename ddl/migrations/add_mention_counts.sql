@@ -0,0 +1,13 @@
+-- Adds the per-episode keyword counts the segmented text loader maintains to
+-- databases created before the table existed. The table starts out empty, so
+-- the loader's next run counts every stored episode before loading (the same
+-- as running it with --recount-mentions), which can take a while on a large
+-- segmented table. `segment_count` is the number of segments that mention the
+-- keyword, not the number of mentions.
+CREATE TABLE IF NOT EXISTS csmap.transcript.mention_counts (
+    id TEXT,
+    keyword TEXT,
+    segment_count INT,
+    first_time FLOAT8,
+    PRIMARY KEY (id, keyword)
+);
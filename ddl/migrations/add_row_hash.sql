@@ -0,0 +1,6 @@
+-- Adds the content hash the loaders use to skip unchanged rows to tables
+-- created before it existed. Existing rows are rewritten once on the next load.
+ALTER TABLE csmap.information.show ADD COLUMN IF NOT EXISTS row_hash TEXT;
+ALTER TABLE csmap.information.episode ADD COLUMN IF NOT EXISTS row_hash TEXT;
+ALTER TABLE csmap.transcript.full ADD COLUMN IF NOT EXISTS row_hash TEXT;
+ALTER TABLE csmap.transcript.segmented ADD COLUMN IF NOT EXISTS row_hash TEXT;
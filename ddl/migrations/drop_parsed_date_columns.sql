@@ -0,0 +1,20 @@
+-- Drops feedparser's parsed copies of the dates, which the loaders stopped
+-- writing in project_feed_fields.sql. Optional, and it can't be undone: the
+-- values in rows loaded before that change are deleted. They repeat the
+-- `published` and `updated` columns, so nothing else is lost.
+--
+-- To be able to roll back, copy the values first:
+--     CREATE TABLE csmap.information.episode_published_parsed AS
+--         SELECT id, published_parsed FROM csmap.information.episode
+--         WHERE published_parsed IS NOT NULL;
+--     CREATE TABLE csmap.information.show_updated_parsed AS
+--         SELECT title, updated_parsed FROM csmap.information.show
+--         WHERE updated_parsed IS NOT NULL;
+--
+-- To roll back, add the columns back as JSONB and copy the values in:
+--     ALTER TABLE csmap.information.episode ADD COLUMN published_parsed JSONB;
+--     UPDATE csmap.information.episode e SET published_parsed = b.published_parsed
+--         FROM csmap.information.episode_published_parsed b WHERE e.id = b.id;
+-- (and the same for `show.updated_parsed`, joined on `title`).
+ALTER TABLE csmap.information.episode DROP COLUMN IF EXISTS published_parsed;
+ALTER TABLE csmap.information.show DROP COLUMN IF EXISTS updated_parsed;
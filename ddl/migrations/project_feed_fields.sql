@@ -0,0 +1,17 @@
+-- Updates tables created before extraction kept only the fields in
+-- src/schema.py. The loaders write each episode's duration in seconds.
+--
+-- Two other changes need no DDL, but change what's stored:
+--
+-- * The loaders no longer write feedparser's parsed copies of the dates
+--   (`episode.published_parsed` and `show.updated_parsed`), which repeat the
+--   `published` and `updated` columns. The columns are kept, so rows loaded
+--   from now on leave them NULL. Dropping them loses the older rows' values
+--   for good, so it's a separate step: drop_parsed_date_columns.sql.
+-- * The `*_detail` JSONB columns (`title_detail`, `subtitle_detail`,
+--   `rights_detail`, `summary_detail`) no longer have a "value" key, since it
+--   repeats the plain column. Each row changes shape when it's next loaded.
+--   Queries reading e.g. `title_detail->>'value'` should read `title`
+--   instead, or rebuild the old shape with
+--   `title_detail || jsonb_build_object('value', title)`.
+ALTER TABLE csmap.information.episode ADD COLUMN IF NOT EXISTS duration_seconds FLOAT8;
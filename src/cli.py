@@ -0,0 +1,143 @@
+"""
+cli.py
+======
+
+This script is one entry point for all of the pipeline's scripts. Each
+command runs a script in `src` with the arguments it takes when run directly
+(see `python3 src/cli.py COMMAND --help`).
+
+Only the command's own module is imported, and the modules import their heavy
+dependencies (psycopg, feedparser, whisperx, etc.) only where they use them,
+so quick commands like `status` or a pipeline `--dry-run` start in a fraction
+of a second.
+
+Usage
+-----
+
+To run a command, run:
+    python3 src/cli.py COMMAND [ARGUMENTS]
+
+For example:
+    python3 src/cli.py status
+    python3 src/cli.py pipeline --from transcribe --dry-run
+    python3 src/cli.py load-segmented-text --profile
+
+"""
+
+import argparse
+import importlib
+import os
+import sys
+from datetime import datetime
+from typing import List, Optional
+
+# Each command's module and description, in the order they're listed in the
+# help. Modules are only imported when their command runs
+COMMANDS = {
+    "pipeline": ("pipeline", "Run the whole pipeline, or some of its stages."),
+    "extract": ("extract_metadata", "Extract show and episode metadata from feeds."),
+    "download": ("download_audio", "Download the episodes' audio."),
+    "transcribe": ("transcribe_audio", "Transcribe the downloaded audio."),
+    "load-show": ("insert_data_into_postgres_show", "Load shows into Postgres."),
+    "load-episode": (
+        "insert_data_into_postgres_episode",
+        "Load episodes into Postgres.",
+    ),
+    "load-full-text": (
+        "insert_data_into_postgres_full_text",
+        "Load full transcripts into Postgres.",
+    ),
+    "load-segmented-text": (
+        "insert_data_into_postgres_segmented_text",
+        "Load transcript segments into Postgres.",
+    ),
+    "ingest": ("ingest_daemon", "Ingest new episodes as they're published."),
+    "query": ("query_service", "Search the transcripts for keyword mentions."),
+    "status": (None, "Show what each stage has written so far."),
+}
+
+
+def parse_arguments(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    """Parses the command, leaving its arguments for the command's script.
+
+    Parameters
+    ----------
+    argv : list of str, optional
+        The arguments. Defaults to the command line's.
+
+    Returns
+    -------
+    argparse.Namespace
+        An object containing the command and its arguments.
+    """
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="commands:\n"
+        + "\n".join(
+            f"  {name:<22}{description}" for name, (_, description) in COMMANDS.items()
+        ),
+    )
+    parser.add_argument(
+        "command",
+        choices=COMMANDS,
+        metavar="COMMAND",
+        help="The command to run (listed below).",
+    )
+    parser.add_argument(
+        "arguments",
+        nargs=argparse.REMAINDER,
+        help="The command's arguments (see COMMAND --help).",
+    )
+
+    return parser.parse_args(argv)
+
+
+def get_status() -> List[str]:
+    """Describes each stage's output in `data` and the files between stages.
+
+    Returns
+    -------
+    list of str
+        A line for each stage output and working directory.
+    """
+    import transcribe_audio as transcribe_audio
+    import utils as utils
+
+    lines = []
+    for stage in utils.STAGE_FORMATS:
+        path = utils.get_stage_path(stage)
+        if os.path.exists(path):
+            modified = datetime.fromtimestamp(os.path.getmtime(path))
+            lines.append(
+                f"{stage:<32}{path} ({os.path.getsize(path):,} bytes, "
+                f"modified {modified:%Y-%m-%d %H:%M})"
+            )
+        else:
+            lines.append(f"{stage:<32}{path} (missing)")
+
+    for label, directory in (
+        ("audio", transcribe_audio.AUDIO_DIR),
+        ("transcripts", transcribe_audio.TRANSCRIPT_DIR),
+    ):
+        count = len(os.listdir(directory)) if os.path.isdir(directory) else 0
+        lines.append(f"{label:<32}{directory} ({count} files)")
+
+    return lines
+
+
+def main(argv: Optional[List[str]] = None):
+    args = parse_arguments(argv)
+
+    if args.command == "status":
+        print("\n".join(get_status()))
+        return
+
+    # The command's script parses the rest of the arguments itself, and its
+    # help names the command
+    module_name, _ = COMMANDS[args.command]
+    sys.argv = [f"{os.path.basename(sys.argv[0])} {args.command}", *args.arguments]
+    importlib.import_module(module_name).main()
+
+
+if __name__ == "__main__":
+    main()
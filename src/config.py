@@ -0,0 +1,158 @@
+"""
+config.py
+=========
+
+This script loads the pipeline's settings once per process.
+
+Settings come from environment variables, with the `.env` file in the repo's
+root directory filling in any that aren't set, so the database connection and the
+tunables below can all live in one place. `load` reads them the first time
+it's called and returns the same `Config` after that. The modules that use a
+setting copy it into their usual constant when they're imported (e.g.
+`utils.JSON_BACKEND`), so it can still be overridden per module.
+
+The `.env` file is copied into the environment too, so worker processes and
+settings read elsewhere (like `<STAGE>_FORMAT`) see the same values.
+
+"""
+
+import os
+from dataclasses import dataclass, field, fields
+from typing import Any, Callable, Mapping, Optional
+
+# The file settings are read from, besides the environment
+ENV_FILE = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".env"
+)
+
+_config: Optional["Config"] = None
+
+
+def _flag(value: str) -> bool:
+    """Reads a true/false setting."""
+    return value.lower() in ("1", "true", "yes")
+
+
+def _limit(value: str) -> Optional[int]:
+    """Reads an optional limit, where 0 means no limit."""
+    return int(value) or None
+
+
+def _setting(default: Any, parse: Callable[[str], Any] = str) -> Any:
+    """Declares a setting with its default and how to parse it from a string."""
+    return field(default=default, metadata={"parse": parse})
+
+
+@dataclass(frozen=True)
+class Config:
+    """The pipeline's settings.
+
+    Each one is read from the environment variable with its name in upper case.
+
+    Attributes
+    ----------
+    db_host, db_read_host, db_name, db_user, db_password, db_port : str or None
+        The Postgres connection. `db_read_host` is an optional read replica.
+    json_backend : str
+        The JSON library to encode and decode with: "json", "orjson" or
+        "msgspec".
+    json_compact : bool
+        Whether to write JSON without indentation.
+    metrics_textfile : str or None
+        Where to write Prometheus metrics at the end of a run.
+    metrics_port : int or None
+        The port to serve Prometheus metrics on while a script runs.
+    progress_every : int
+        How often to log progress, in units of work.
+    download_engine : str
+        The download implementation: "threads" or "async".
+    download_priority : str or None
+        The order episodes are downloaded in.
+    max_in_flight_bytes, max_backlog_bytes, max_backlog_files, min_free_disk_bytes : int or None
+        The download admission limits. Unset limits are off.
+    download_concurrency, per_host_concurrency : int
+        The async engine's connection limits.
+    """
+
+    db_host: Optional[str] = None
+    db_read_host: Optional[str] = None
+    db_name: Optional[str] = None
+    db_user: Optional[str] = None
+    db_password: Optional[str] = None
+    db_port: Optional[str] = None
+    json_backend: str = "json"
+    json_compact: bool = _setting(False, _flag)
+    metrics_textfile: Optional[str] = None
+    metrics_port: Optional[int] = _setting(None, int)
+    progress_every: int = _setting(1000, int)
+    download_engine: str = "threads"
+    download_priority: Optional[str] = None
+    max_in_flight_bytes: Optional[int] = _setting(None, _limit)
+    max_backlog_bytes: Optional[int] = _setting(None, _limit)
+    max_backlog_files: Optional[int] = _setting(None, _limit)
+    min_free_disk_bytes: Optional[int] = _setting(None, _limit)
+    download_concurrency: int = _setting(512, int)
+    per_host_concurrency: int = _setting(16, int)
+
+    @classmethod
+    def from_environ(cls, environ: Mapping[str, str]) -> "Config":
+        """Reads the settings from environment variables.
+
+        Parameters
+        ----------
+        environ : mapping
+            The environment, e.g. `os.environ`.
+
+        Returns
+        -------
+        Config
+            The settings, with defaults for the variables that aren't set.
+        """
+        values = {}
+        for setting in fields(cls):
+            value = environ.get(setting.name.upper())
+            # Empty variables are treated as unset
+            if value:
+                values[setting.name] = setting.metadata.get("parse", str)(value)
+
+        return cls(**values)
+
+    def get_postgres_dsn(self, replica: bool = False) -> str:
+        """Builds the Postgres connection string.
+
+        Parameters
+        ----------
+        replica : bool, optional
+            Whether to connect to the read replica, for read-only queries.
+            Falls back to `db_host` if there isn't one.
+
+        Returns
+        -------
+        str
+            A formatted string containing variables to make the Postgres
+            table connection.
+        """
+        host = (replica and self.db_read_host) or self.db_host
+
+        return f"host={host} dbname={self.db_name} user={self.db_user} password={self.db_password} port={self.db_port}"
+
+
+def load() -> Config:
+    """Loads the settings the first time it's called, and returns them.
+
+    Returns
+    -------
+    Config
+        The settings from the environment and the `.env` file.
+    """
+    global _config
+
+    if _config is None:
+        # Only pay for importing python-dotenv when there's a file to read
+        if os.path.exists(ENV_FILE):
+            from dotenv import load_dotenv
+
+            load_dotenv(ENV_FILE)
+        _config = Config.from_environ(os.environ)
+
+    return _config
@@ -6,25 +6,569 @@ This script downloads podcast episodes as MP3 audio files from URLs listed in
 a episode-level metadata file, `data/episode_metadata.json`. These audio files
 are saved into a separate directory, `episode_audio`.
 
+The same audio is often listed more than once, e.g. when an episode is
+cross-posted to several feeds or its GUID changes. A download index in
+`episode_audio/download_index.jsonl` maps each normalized audio URL, and each
+host, ETag and Content-Length, to the file already saved for it, and repeats
+are hard-linked to that file instead of being downloaded again. The index is
+appended to, one line per saved file, so recording a download doesn't
+rewrite it.
+
+Downloads can also be held back so they don't get too far ahead of
+transcription (see `AdmissionController`), and ordered so the newest or
+shortest episodes are fetched first.
+
 Usage
 -----
 
 To execute this script, run:
     python3 src/download_audio.py
 
+To download with the asyncio engine instead of a thread pool, run:
+    DOWNLOAD_ENGINE=async python3 src/download_audio.py
+
 """
 
+import argparse
+import logging
 import os
+import re
+import shutil
 import subprocess
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from typing import Any, Dict, List
-
-import requests
-
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Mapping, Optional
+from urllib.parse import urlsplit
+
+import config as config
+import metrics as metrics
 import utils as utils
 
 # Thread count for downloading audio in parallel
 MAX_WORKERS = 10
+# Which download engine to use: "threads", or "async" for thousands of
+# concurrent downloads with `download_audio_async.py`
+DOWNLOAD_ENGINE = config.load().download_engine
+# The order to download episodes in: "recency" (newest first), "duration"
+# (shortest first), or unset to keep the metadata's order
+DOWNLOAD_PRIORITY = config.load().download_priority
+# Admission control limits, each off when unset or 0: the most bytes to have
+# downloading at once, the most untranscribed audio to keep on disk (in bytes
+# and in files), and the least free disk space to leave
+MAX_IN_FLIGHT_BYTES = config.load().max_in_flight_bytes
+MAX_BACKLOG_BYTES = config.load().max_backlog_bytes
+MAX_BACKLOG_FILES = config.load().max_backlog_files
+MIN_FREE_DISK_BYTES = config.load().min_free_disk_bytes
+# The size assumed for episodes whose feed doesn't list one
+DEFAULT_EPISODE_BYTES = 50 * 1024 * 1024
+# How often to re-measure the untranscribed audio on disk, in seconds
+BACKLOG_REFRESH_SECONDS = 5.0
+# How long to wait before checking again while downloads are paused
+ADMISSION_POLL_SECONDS = 1.0
+# How long downloads can stay paused, with the backlog not moving, before
+# giving up, e.g. when nothing is transcribing the audio
+MAX_ADMISSION_WAIT_SECONDS = 30 * 60
+# The download index's file name, inside the download directory
+DOWNLOAD_INDEX_FILE = "download_index.jsonl"
+# Analytics services that prefix the real audio URL with a redirect, e.g.
+# https://dts.podtrac.com/redirect.mp3/traffic.megaphone.fm/ABC123.mp3
+TRACKING_PREFIX = re.compile(
+    r"^(?:"
+    r"(?:dts|www)\.podtrac\.com/(?:pts/)?redirect\.\w+"
+    r"|chrt\.fm/track/[^/]+"
+    r"|chtbl\.com/track/[^/]+"
+    r"|pdst\.fm/e"
+    r"|op3\.dev/e(?:,[^/]*)?"
+    r"|mgln\.ai/e/[^/]+"
+    r"|arttrk\.com/p/[^/]+"
+    r"|pfx\.vpixl\.com/[^/]+"
+    r"|prfx\.byspotify\.com/e"
+    r"|(?:verifi\.podscribe\.com|pscrb\.fm)/rss/p"
+    r"|claritaspod\.com/measure"
+    r"|clrtpod\.com/m/[^/]+"
+    r"|tracking\.swap\.fm/track/[^/]+"
+    r")/(?:https?:/+)?",
+    re.IGNORECASE,
+)
+
+# Download indexes loaded so far, by download directory
+_indexes: Dict[str, Dict[str, Dict[str, str]]] = {}
+_index_lock = threading.Lock()
+
+
+def normalize_audio_url(url: str) -> str:
+    """Reduces an audio URL to the file it points to.
+
+    The scheme and any analytics redirect prefixes are stripped, and the host
+    is lowercased. The query string is kept, since some hosts use it to pick
+    the file.
+
+    Parameters
+    ----------
+    url : str
+        The audio URL from an episode's metadata.
+
+    Returns
+    -------
+    str
+        The normalized URL, e.g. "traffic.megaphone.fm/ABC123.mp3".
+    """
+    parts = urlsplit(url.strip())
+    location = parts.netloc + parts.path
+
+    # Prefixes can be chained, e.g. podtrac redirecting through chartable
+    while True:
+        stripped = TRACKING_PREFIX.sub("", location, count=1)
+        if stripped == location:
+            break
+        location = stripped
+
+    host, _, path = location.partition("/")
+    normalized = f"{host.lower()}/{path}"
+    if parts.query:
+        normalized += f"?{parts.query}"
+
+    return normalized
+
+
+def get_download_index(download_dir: str) -> Dict[str, Dict[str, str]]:
+    """Returns the download index for a directory, loading it on first use.
+
+    Parameters
+    ----------
+    download_dir : str
+        The directory the MP3 files are saved in.
+
+    Returns
+    -------
+    dict
+        A dictionary with "urls" and "resources" keys, mapping normalized
+        URLs and resource keys from `get_resource_key` to saved file names.
+    """
+    with _index_lock:
+        if download_dir not in _indexes:
+            index = {"urls": {}, "resources": {}}
+            path = os.path.join(download_dir, DOWNLOAD_INDEX_FILE)
+            if os.path.exists(path):
+                with open(path, "r+b") as f:
+                    for line in f:
+                        # A crash mid-append can leave the last line partial,
+                        # so cut it off before anything is appended after it
+                        if not line.endswith(b"\n"):
+                            f.truncate(f.tell() - len(line))
+                            break
+                        entry = utils.loads_json(line)
+                        _add_to_index(
+                            index, entry["name"], entry["urls"], entry["resource_key"]
+                        )
+            _indexes[download_dir] = index
+
+        return _indexes[download_dir]
+
+
+def _add_to_index(
+    index: Dict[str, Dict[str, str]],
+    name: str,
+    urls: List[str],
+    resource_key: Optional[str],
+):
+    """Points a file's URLs and resource key at it in a loaded index."""
+    for url in urls:
+        index["urls"][url] = name
+    if resource_key:
+        index["resources"][resource_key] = name
+
+
+def get_resource_key(headers: Mapping[str, str], url: str) -> Optional[str]:
+    """Identifies a file by its host, ETag and Content-Length.
+
+    ETags are only unique within a server, so the key is scoped to the host
+    the file was served from.
+
+    Parameters
+    ----------
+    headers : mapping
+        The response headers.
+    url : str
+        The normalized URL the file was served from, after redirects.
+
+    Returns
+    -------
+    str or None
+        The "<host>|<ETag>|<Content-Length>" value, or None unless both
+        headers are set.
+    """
+    etag = headers.get("ETag")
+    length = headers.get("Content-Length")
+    if not etag or not length:
+        return None
+
+    host = url.partition("/")[0]
+    return f"{host}|{etag}|{length}"
+
+
+def find_downloaded(
+    download_dir: str, urls: List[str], resource_key: Optional[str] = None
+) -> Optional[str]:
+    """Finds a saved file for any of the given URLs or resource key.
+
+    Parameters
+    ----------
+    download_dir : str
+        The directory the MP3 files are saved in.
+    urls : list of str
+        Normalized URLs the audio is known by.
+    resource_key : str, optional
+        The audio's key from `get_resource_key`.
+
+    Returns
+    -------
+    str or None
+        The path to the saved file, if there is one.
+    """
+    index = get_download_index(download_dir)
+
+    with _index_lock:
+        names = [index["urls"].get(url) for url in urls]
+        if resource_key:
+            names.append(index["resources"].get(resource_key))
+
+    for name in names:
+        if name and os.path.exists(os.path.join(download_dir, name)):
+            return os.path.join(download_dir, name)
+
+    return None
+
+
+def record_download(
+    download_dir: str,
+    filepath: str,
+    urls: List[str],
+    resource_key: Optional[str] = None,
+):
+    """Adds a newly saved file to the download index.
+
+    The file is appended to the index on disk as one JSON line, so each
+    download only writes its own entry.
+
+    Parameters
+    ----------
+    download_dir : str
+        The directory the MP3 files are saved in.
+    filepath : str
+        The path the audio was saved to.
+    urls : list of str
+        Normalized URLs the audio is known by.
+    resource_key : str, optional
+        The audio's key from `get_resource_key`.
+    """
+    index = get_download_index(download_dir)
+    name = os.path.basename(filepath)
+
+    entry = {"name": name, "urls": urls, "resource_key": resource_key}
+    line = utils.get_json_encoder()(entry) + b"\n"
+
+    with _index_lock:
+        _add_to_index(index, name, urls, resource_key)
+        with open(os.path.join(download_dir, DOWNLOAD_INDEX_FILE), "ab") as f:
+            f.write(line)
+
+
+def remove_partial(path: str):
+    """Deletes a partly written download, if there is one."""
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def link_download(source: str, filepath: str) -> str:
+    """Reuses an already saved file for another episode.
+
+    The file is hard-linked, so it takes no extra disk space, or copied if
+    the filesystem doesn't support hard links.
+
+    Parameters
+    ----------
+    source : str
+        The path to the saved file.
+    filepath : str
+        The path the episode's MP3 should be at.
+
+    Returns
+    -------
+    str
+        A string indicating the status of the audio download.
+    """
+    try:
+        os.link(source, filepath)
+    except OSError:
+        shutil.copyfile(source, filepath)
+
+    metrics.increment("downloads_deduplicated")
+    metrics.increment("download_bytes_saved", os.path.getsize(filepath))
+    return f"Linked {filepath} to existing download: {source}\n"
+
+
+class AdmissionController:
+    """Decides when another download can start, so downloads don't outrun
+    transcription or fill the disk.
+
+    A download is admitted only while:
+
+    * the bytes being downloaded stay under `MAX_IN_FLIGHT_BYTES`,
+    * the MP3s waiting to be transcribed, plus those being downloaded, stay
+    under `MAX_BACKLOG_BYTES` and `MAX_BACKLOG_FILES`, and
+    * the disk keeps more than `MIN_FREE_DISK_BYTES` free.
+
+    An episode's size is taken from its enclosure, or `DEFAULT_EPISODE_BYTES`
+    if the feed doesn't list one. Each check is skipped if its setting isn't
+    given. A size limit never blocks a download when there's nothing else in
+    flight or waiting, so a single large episode can't stall everything. If
+    nothing is admitted and the backlog doesn't move for
+    `MAX_ADMISSION_WAIT_SECONDS`, `check_stalled` fails instead of waiting
+    forever.
+
+    Parameters
+    ----------
+    download_dir : str
+        The directory the MP3 files are saved in.
+    transcript_dir : str, optional
+        The directory transcripts are saved in, used to tell which MP3s are
+        still waiting to be transcribed. Defaults to
+        `transcribe_audio.TRANSCRIPT_DIR`.
+    """
+
+    def __init__(self, download_dir: str, transcript_dir: Optional[str] = None):
+        self.download_dir = download_dir
+        self.transcript_dir = transcript_dir
+        self.in_flight_bytes = 0
+        self.in_flight_files = 0
+        self.backlog_bytes = 0
+        self.backlog_files = 0
+        self.paused_reason: Optional[str] = None
+        self._refreshed_at = float("-inf")
+        # When the current pause started, and the backlog it started with
+        self._paused_since: Optional[float] = None
+        self._paused_backlog = (0, 0)
+        self._lock = threading.Lock()
+
+    def refresh_backlog(self):
+        """Measures the MP3s on disk that haven't been transcribed yet."""
+        import transcribe_audio
+
+        transcript_dir = self.transcript_dir or transcribe_audio.TRANSCRIPT_DIR
+        backlog_bytes = backlog_files = 0
+        seen_inodes = set()
+
+        with os.scandir(self.download_dir) as entries:
+            for entry in entries:
+                if not entry.name.endswith(".mp3"):
+                    continue
+                episode_id = entry.name[: -len(".mp3")]
+                transcript_path = transcribe_audio.get_transcript_path(
+                    episode_id, transcript_dir
+                )
+                if os.path.exists(transcript_path):
+                    continue
+
+                # Hard-linked duplicates only take up disk space once
+                stat = entry.stat()
+                backlog_files += 1
+                if stat.st_ino not in seen_inodes:
+                    seen_inodes.add(stat.st_ino)
+                    backlog_bytes += stat.st_size
+
+        with self._lock:
+            self.backlog_bytes = backlog_bytes
+            self.backlog_files = backlog_files
+            self._refreshed_at = time.monotonic()
+
+    def get_blocker(self, size: int) -> Optional[str]:
+        """Finds the limit that a download of `size` bytes would break.
+
+        Parameters
+        ----------
+        size : int
+            The download's expected size in bytes.
+
+        Returns
+        -------
+        str or None
+            The name of the limit, or None if the download can start.
+        """
+        uses_backlog = MAX_BACKLOG_BYTES is not None or MAX_BACKLOG_FILES is not None
+        if uses_backlog and (
+            time.monotonic() - self._refreshed_at > BACKLOG_REFRESH_SECONDS
+        ):
+            self.refresh_backlog()
+
+        with self._lock:
+            pending_files = self.backlog_files + self.in_flight_files
+            pending_bytes = self.backlog_bytes + self.in_flight_bytes
+
+            if (
+                MAX_IN_FLIGHT_BYTES is not None
+                and self.in_flight_files
+                and self.in_flight_bytes + size > MAX_IN_FLIGHT_BYTES
+            ):
+                return "in_flight_bytes"
+            if (
+                MAX_BACKLOG_BYTES is not None
+                and pending_files
+                and pending_bytes + size > MAX_BACKLOG_BYTES
+            ):
+                return "backlog_bytes"
+            if MAX_BACKLOG_FILES is not None and pending_files >= MAX_BACKLOG_FILES:
+                return "backlog_files"
+
+        if MIN_FREE_DISK_BYTES is not None:
+            free = shutil.disk_usage(self.download_dir).free
+            if free - self.in_flight_bytes - size < MIN_FREE_DISK_BYTES:
+                return "free_disk"
+
+        return None
+
+    def try_admit(self, episode: Dict[str, Any]) -> Optional[int]:
+        """Reserves room for an episode's download, if there is any.
+
+        Parameters
+        ----------
+        episode : dict
+            A dictionary containing metadata for a single episode.
+
+        Returns
+        -------
+        int or None
+            The bytes reserved, to pass to `release` when the download ends
+            (0 if the MP3 already exists), or None if the download has to
+            wait.
+        """
+        # Existing MP3s are skipped by the download, so they take no room
+        if os.path.exists(os.path.join(self.download_dir, f"{episode.get('id')}.mp3")):
+            return 0
+
+        size = utils.get_audio_length(episode) or DEFAULT_EPISODE_BYTES
+        blocker = self.get_blocker(size)
+
+        # Log once when downloads pause and once when they resume
+        if blocker != self.paused_reason:
+            if blocker:
+                metrics.increment("downloads_paused")
+                metrics.log_event(
+                    "downloads_paused",
+                    reason=blocker,
+                    in_flight_bytes=self.in_flight_bytes,
+                    backlog_bytes=self.backlog_bytes,
+                    backlog_files=self.backlog_files,
+                )
+            else:
+                metrics.log_event("downloads_resumed")
+            self.paused_reason = blocker
+
+        if blocker:
+            return None
+
+        with self._lock:
+            self.in_flight_bytes += size
+            self.in_flight_files += 1
+            self._paused_since = None
+
+        return size
+
+    def check_stalled(self):
+        """Fails if downloads have been paused too long with no progress.
+
+        Call this each time downloads wait to be admitted. The wait restarts
+        whenever a download is admitted or the backlog on disk changes.
+
+        Raises
+        ------
+        RuntimeError
+            If nothing was admitted and the backlog didn't change for
+            `MAX_ADMISSION_WAIT_SECONDS`.
+        """
+        now = time.monotonic()
+        with self._lock:
+            backlog = (self.backlog_bytes, self.backlog_files)
+            if self._paused_since is None or backlog != self._paused_backlog:
+                self._paused_since = now
+                self._paused_backlog = backlog
+                return
+            waited = now - self._paused_since
+
+        if waited >= MAX_ADMISSION_WAIT_SECONDS:
+            metrics.log_event(
+                "downloads_stalled",
+                level=logging.ERROR,
+                reason=self.paused_reason,
+                seconds=waited,
+                backlog_bytes=backlog[0],
+                backlog_files=backlog[1],
+            )
+            raise RuntimeError(
+                f"Downloads were paused by {self.paused_reason} for {waited:.0f} "
+                "seconds without the backlog moving"
+            )
+
+    def release(self, size: int):
+        """Frees the room reserved for a finished download.
+
+        The MP3 now counts towards the backlog until the next refresh.
+
+        Parameters
+        ----------
+        size : int
+            The bytes returned by `try_admit`.
+        """
+        if not size:
+            return
+
+        with self._lock:
+            self.in_flight_bytes -= size
+            self.in_flight_files -= 1
+            self.backlog_bytes += size
+            self.backlog_files += 1
+
+
+def order_episodes(
+    episode_metadata: List[Dict[str, Any]], priority: Optional[str] = None
+) -> List[Dict[str, Any]]:
+    """Sorts episodes into the order they should be downloaded in.
+
+    Parameters
+    ----------
+    episode_metadata : list of dict
+        A list of dictionaries, each representing metadata for an episode.
+    priority : str, optional
+        "recency" for the newest episodes first, "duration" for the shortest
+        first, or None to keep the given order.
+
+    Returns
+    -------
+    list of dict
+        The episodes in download order. Episodes missing the value being
+        sorted on go last.
+    """
+    if priority == "recency":
+        oldest = datetime.min.replace(tzinfo=timezone.utc)
+        return sorted(
+            episode_metadata,
+            key=lambda episode: utils.get_published_at(episode) or oldest,
+            reverse=True,
+        )
+    if priority == "duration":
+        return sorted(
+            episode_metadata,
+            key=lambda episode: utils.get_duration_seconds(episode) or float("inf"),
+        )
+    if priority:
+        raise ValueError(f"Unknown download priority: {priority}")
+
+    return list(episode_metadata)
 
 
 def download_audio(episode: Dict[str, Any], download_dir: str) -> str:
@@ -46,55 +590,94 @@ def download_audio(episode: Dict[str, Any], download_dir: str) -> str:
     str
         A string indicating the status of the audio download.
     """
+    import requests
 
     episode_id = episode.get("id")
 
     # Get the audio URL from links (if available)
-    links = episode.get("links", [])
-    audio_url = None
-
-    for link in links:
-        if link.get("type") == "audio/mpeg":
-            audio_url = link.get("href")
-            break
+    audio_url = utils.get_audio_url(episode)
 
     if audio_url:
         filepath = os.path.join(download_dir, f"{episode_id}.mp3")
 
         # Don't re-download an existing MP3
         if os.path.exists(filepath):
+            metrics.increment("downloads_skipped")
             return f"Skipping existing file: {filepath}"
 
+        # Reuse the file if the same audio was downloaded for another episode
+        urls = [normalize_audio_url(audio_url)]
+        existing = find_downloaded(download_dir, urls)
+        if existing:
+            return link_download(existing, filepath)
+
         try:
             # Attempt to download audio using the requests library
-            response = requests.get(audio_url, stream=True, timeout=30)
-            # Check for 200 status code
-            response.raise_for_status()
-
-            with open(filepath, "wb") as f:
-                for chunk in response.iter_content(chunk_size=8192):
-                    f.write(chunk)
-
+            with metrics.timer("download"):
+                response = requests.get(audio_url, stream=True, timeout=30)
+                # Check for 200 status code
+                response.raise_for_status()
+
+                # Now that redirects have been followed, check the final URL
+                # and the file's ETag before reading the body
+                final_url = normalize_audio_url(response.url)
+                if final_url not in urls:
+                    urls.append(final_url)
+                resource_key = get_resource_key(response.headers, final_url)
+                existing = find_downloaded(download_dir, urls, resource_key)
+                if existing:
+                    response.close()
+                    return link_download(existing, filepath)
+
+                with open(filepath, "wb") as f:
+                    for chunk in response.iter_content(chunk_size=8192):
+                        f.write(chunk)
+                        metrics.increment("download_bytes", len(chunk))
+
+            record_download(download_dir, filepath, urls, resource_key)
+            metrics.increment("downloads")
             return f"Saved to: {filepath}\n"
 
         except requests.RequestException as e:
             # If that fails, use curl as a fallback
             try:
-                print(f"requests failed: {e}. Trying with curl for id: {episode_id}")
-
-                subprocess.run(
-                    ["curl", "-L", "-k", "-o", filepath, audio_url], check=True
+                metrics.log_event(
+                    "requests_failed",
+                    level=logging.WARNING,
+                    episode_id=episode_id,
+                    error=str(e),
                 )
+
+                with metrics.timer("download_curl"):
+                    subprocess.run(
+                        ["curl", "-f", "-L", "-k", "-s", "-o", filepath, audio_url],
+                        check=True,
+                    )
+                metrics.increment("download_bytes", os.path.getsize(filepath))
+                record_download(download_dir, filepath, urls)
+                metrics.increment("downloads")
                 return f"Saved with curl to: {filepath}\n"
 
             except subprocess.CalledProcessError as curl_err:
+                # curl may have written part of the file before failing
+                remove_partial(filepath)
+                metrics.increment("download_errors")
+                metrics.log_event(
+                    "download_failed",
+                    level=logging.ERROR,
+                    episode_id=episode_id,
+                    error=str(curl_err),
+                )
                 return f"Failed to download {episode_id} with both requests and curl: {curl_err}\n"
 
     else:
+        metrics.increment("downloads_missing")
         return f"No audio found for episode id: {episode_id}\n"
 
 
-def download_audio_parallel(episode_metadata: List[Dict[str, Any]]):
+def download_audio_parallel(
+    episode_metadata: List[Dict[str, Any]], engine: Optional[str] = None
+):
     """Downloads podcast episodes in parallel using threads.
 
     Parameters
@@ -102,31 +685,83 @@ def download_audio_parallel(episode_metadata: List[Dict[str, Any]]):
     episode_metadata : list of dict
         A list of dictionaries, each representing metadata for an episode
         published in the `target_year` (defined in extract_metadata.py).
+    engine : str, optional
+        "threads", or "async" to use the asyncio engine in
+        `download_audio_async.py` instead. Defaults to `DOWNLOAD_ENGINE`.
     """
     # Define a directory to save MP3s into
     download_dir = "episode_audio"
     os.makedirs(download_dir, exist_ok=True)
 
+    if (engine or DOWNLOAD_ENGINE) == "async":
+        import download_audio_async
+
+        download_audio_async.download_audio_parallel(episode_metadata, download_dir)
+        return
+
+    controller = AdmissionController(download_dir)
+    queue = deque(order_episodes(episode_metadata, DOWNLOAD_PRIORITY))
+    # The bytes reserved for each running download
+    running: Dict[Future, int] = {}
+
     with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
-        futures = [
-            executor.submit(download_audio, episode, download_dir)
-            for episode in episode_metadata
-        ]
+        while queue or running:
+            # Start downloads in priority order while there are free threads
+            # and the admission controller allows it
+            while queue and len(running) < MAX_WORKERS:
+                size = controller.try_admit(queue[0])
+                if size is None:
+                    break
+                future = executor.submit(download_audio, queue.popleft(), download_dir)
+                running[future] = size
+
+            if not running:
+                controller.check_stalled()
+                time.sleep(ADMISSION_POLL_SECONDS)
+                continue
+
+            finished, _ = wait(
+                running, timeout=ADMISSION_POLL_SECONDS, return_when=FIRST_COMPLETED
+            )
+            for future in finished:
+                controller.release(running.pop(future))
+                future.result()
+                metrics.increment("episodes_processed")
+                metrics.log_progress("episodes_processed", every=100)
+
+
+def parse_arguments() -> argparse.Namespace:
+    """Parses command-line arguments for the downloads.
+
+    The downloads are configured with the settings in `config`, so there are
+    no arguments, but `--help` describes the script instead of running it.
+
+    Returns
+    -------
+    argparse.Namespace
+        An empty namespace.
+    """
+    parser = argparse.ArgumentParser(
+        description="Downloads the audio of every episode in the episode metadata."
+    )
 
-        for future in as_completed(futures):
-            print(future.result())
+    return parser.parse_args()
 
 
 def main():
-    # Deserialize JSON to a list
-    print("\nLoading episode metadata from JSON...")
-    episode_metadata = utils.read_data_from_json("data/episode_metadata.json")
+    parse_arguments()
+    metrics.configure("download_audio")
+
+    # Deserialize the episode metadata to a list
+    print("\nLoading episode metadata...")
+    episode_metadata = utils.read_data(utils.get_stage_path("episode_metadata"))
 
     # Download audio files in parallel to a directory
     print("\nDownloading MP3 files...\n")
     download_audio_parallel(episode_metadata)
 
     print("\nAudio downloads complete!")
+    metrics.report()
 
 
 if __name__ == "__main__":
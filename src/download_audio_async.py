@@ -0,0 +1,454 @@
+"""
+download_audio_async.py
+=======================
+
+This script contains an asyncio download engine for `download_audio.py`,
+for when a fixed pool of 10 threads can't keep the network busy.
+
+* Downloads share one `aiohttp` session, so thousands of streams can be open
+at once without a thread each.
+* The number of concurrent downloads is adjusted while the engine runs: it
+grows while throughput keeps improving and shrinks when it drops, between
+`MIN_CONCURRENCY` and `DOWNLOAD_CONCURRENCY`.
+* No host gets more than `PER_HOST_CONCURRENCY` downloads at once.
+* Chunks are written to disk by a small thread pool, along with the other
+filesystem work (checking the download index, linking repeats, measuring the
+backlog), so it never blocks the event loop.
+* Episodes are started in the same order, and under the same admission
+control, as in `download_audio.py`.
+
+It uses the same download index as `download_audio.py`, so repeated audio is
+linked instead of downloaded here too. `aiohttp` is only needed when this
+engine is used.
+
+Usage
+-----
+
+To use this engine, run:
+    DOWNLOAD_ENGINE=async python3 src/download_audio.py
+
+"""
+
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+from urllib.parse import urlsplit
+
+import aiohttp
+
+import config as config
+import download_audio as download_audio
+import metrics as metrics
+import utils as utils
+
+# The most downloads to run at once, across all hosts
+DOWNLOAD_CONCURRENCY = config.load().download_concurrency
+# The most downloads to run at once from a single host
+PER_HOST_CONCURRENCY = config.load().per_host_concurrency
+# Where the concurrency limit starts, and the lowest it can be lowered to
+INITIAL_CONCURRENCY = 32
+MIN_CONCURRENCY = 4
+# How often to compare throughput and adjust the limit, in seconds
+ADJUST_INTERVAL = 2.0
+# How much the limit is multiplied or divided by at each adjustment
+ADJUST_FACTOR = 1.25
+# How much throughput has to drop before the limit changes direction
+ADJUST_TOLERANCE = 0.05
+# Thread count for writing downloaded chunks to disk
+WRITER_THREADS = 4
+# Bytes read from the network per write
+CHUNK_SIZE = 1024 * 1024
+
+
+class AdaptiveLimit:
+    """Limits how many downloads run at once, tuning the limit to throughput.
+
+    The limit hill-climbs: it keeps moving in one direction while throughput
+    improves, and turns around when throughput drops. It only grows while
+    downloads are waiting for a slot, since a limit that isn't reached can't
+    be holding throughput back.
+
+    Parameters
+    ----------
+    initial : int
+        The starting limit.
+    maximum : int
+        The highest the limit can go.
+    """
+
+    def __init__(self, initial: int, maximum: int):
+        self.maximum = max(maximum, 1)
+        self.minimum = min(MIN_CONCURRENCY, self.maximum)
+        self.limit = min(max(initial, self.minimum), self.maximum)
+        self.active = 0
+        self.waiting = 0
+        self._condition = asyncio.Condition()
+        self._bytes = 0
+        self._last_rate = 0.0
+        self._growing = True
+
+    async def __aenter__(self):
+        async with self._condition:
+            self.waiting += 1
+            await self._condition.wait_for(lambda: self.active < self.limit)
+            self.waiting -= 1
+            self.active += 1
+
+    async def __aexit__(self, *exc_info):
+        async with self._condition:
+            self.active -= 1
+            self._condition.notify()
+
+    def add_bytes(self, count: int):
+        """Counts bytes downloaded towards the current throughput."""
+        self._bytes += count
+
+    async def adjust(self, seconds: float):
+        """Moves the limit based on the throughput since the last adjustment.
+
+        Parameters
+        ----------
+        seconds : float
+            The time since the last adjustment.
+        """
+        rate = self._bytes / seconds
+        self._bytes = 0
+
+        if rate < self._last_rate * (1 - ADJUST_TOLERANCE):
+            self._growing = not self._growing
+        self._last_rate = rate
+
+        if self._growing and self.waiting:
+            limit = max(int(self.limit * ADJUST_FACTOR), self.limit + 1)
+        elif not self._growing:
+            limit = int(self.limit / ADJUST_FACTOR)
+        else:
+            return
+
+        limit = min(max(limit, self.minimum), self.maximum)
+        if limit != self.limit:
+            self.limit = limit
+            metrics.log_event(
+                "download_concurrency", limit=limit, bytes_per_second=rate
+            )
+            async with self._condition:
+                self._condition.notify_all()
+
+
+class DownloadEngine:
+    """Downloads episodes on one event loop, sharing a session and limits.
+
+    Parameters
+    ----------
+    session : aiohttp.ClientSession
+        The session shared by every download.
+    download_dir : str
+        The directory where the downloaded MP3 files should be saved.
+    writer : ThreadPoolExecutor
+        The threads that write chunks to disk and run the other blocking
+        filesystem calls.
+    concurrency : int, optional
+        The most downloads to run at once. Defaults to `DOWNLOAD_CONCURRENCY`.
+    """
+
+    def __init__(
+        self,
+        session: aiohttp.ClientSession,
+        download_dir: str,
+        writer: ThreadPoolExecutor,
+        concurrency: Optional[int] = None,
+    ):
+        self.session = session
+        self.download_dir = download_dir
+        self.writer = writer
+        self.limit = AdaptiveLimit(
+            INITIAL_CONCURRENCY, concurrency or DOWNLOAD_CONCURRENCY
+        )
+        self.host_limits: Dict[str, asyncio.Semaphore] = {}
+        # Downloads in progress, by normalized URL, so a second episode with
+        # the same audio waits for the first instead of fetching it again
+        self.in_flight: Dict[str, asyncio.Event] = {}
+
+    async def _run_blocking(self, func: Callable[..., Any], *args: Any) -> Any:
+        """Runs a blocking filesystem call on the writer threads."""
+        loop = asyncio.get_running_loop()
+
+        return await loop.run_in_executor(self.writer, func, *args)
+
+    async def download(self, episode: Dict[str, Any]) -> str:
+        """Downloads the MP3 for a single podcast episode.
+
+        Follows the same steps as `download_audio.download_audio`, including
+        the curl fallback.
+
+        Parameters
+        ----------
+        episode : dict
+            A dictionary containing metadata for a single episode.
+
+        Returns
+        -------
+        str
+            A string indicating the status of the audio download.
+        """
+        episode_id = episode.get("id")
+        audio_url = utils.get_audio_url(episode)
+
+        if not audio_url:
+            metrics.increment("downloads_missing")
+            return f"No audio found for episode id: {episode_id}\n"
+
+        filepath = os.path.join(self.download_dir, f"{episode_id}.mp3")
+
+        # Don't re-download an existing MP3
+        if await self._run_blocking(os.path.exists, filepath):
+            metrics.increment("downloads_skipped")
+            return f"Skipping existing file: {filepath}"
+
+        # Reuse the file if the same audio was downloaded for another episode,
+        # waiting for it first if it's still downloading
+        urls = [download_audio.normalize_audio_url(audio_url)]
+        while urls[0] in self.in_flight:
+            await self.in_flight[urls[0]].wait()
+        existing = await self._run_blocking(
+            download_audio.find_downloaded, self.download_dir, urls
+        )
+        if existing:
+            return await self._run_blocking(
+                download_audio.link_download, existing, filepath
+            )
+
+        done = self.in_flight[urls[0]] = asyncio.Event()
+        try:
+            return await self._fetch(episode_id, audio_url, filepath, urls)
+        finally:
+            del self.in_flight[urls[0]]
+            done.set()
+
+    async def _fetch(
+        self, episode_id: str, audio_url: str, filepath: str, urls: List[str]
+    ) -> str:
+        """Downloads an episode's audio once its host and the limit allow."""
+        host = urlsplit(audio_url).hostname or ""
+        if host not in self.host_limits:
+            self.host_limits[host] = asyncio.Semaphore(PER_HOST_CONCURRENCY)
+
+        async with self.host_limits[host], self.limit:
+            try:
+                start = time.perf_counter()
+                async with self.session.get(audio_url) as response:
+                    response.raise_for_status()
+
+                    # Now that redirects have been followed, check the final
+                    # URL and the file's ETag before reading the body
+                    final_url = download_audio.normalize_audio_url(str(response.url))
+                    if final_url not in urls:
+                        urls.append(final_url)
+                    resource_key = download_audio.get_resource_key(
+                        response.headers, final_url
+                    )
+                    existing = await self._run_blocking(
+                        download_audio.find_downloaded,
+                        self.download_dir,
+                        urls,
+                        resource_key,
+                    )
+                    if existing:
+                        return await self._run_blocking(
+                            download_audio.link_download, existing, filepath
+                        )
+
+                    await self._write_stream(response, filepath)
+                metrics.record_time("download", time.perf_counter() - start)
+
+                await self._run_blocking(
+                    download_audio.record_download,
+                    self.download_dir,
+                    filepath,
+                    urls,
+                    resource_key,
+                )
+                metrics.increment("downloads")
+                return f"Saved to: {filepath}\n"
+
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                # If that fails, use curl as a fallback
+                metrics.log_event(
+                    "requests_failed",
+                    level=logging.WARNING,
+                    episode_id=episode_id,
+                    error=str(e),
+                )
+                return await self._fetch_with_curl(
+                    episode_id, audio_url, filepath, urls
+                )
+
+    async def _write_stream(self, response: aiohttp.ClientResponse, filepath: str):
+        """Streams a response body to a file through the writer threads.
+
+        The body is written under a temporary name and renamed when it's
+        complete, so an interrupted download never looks finished. If the
+        stream fails, the partial file is deleted.
+        """
+        temp_path = f"{filepath}.part"
+        f = await self._run_blocking(open, temp_path, "wb")
+        try:
+            try:
+                async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+                    await self._run_blocking(f.write, chunk)
+                    self.limit.add_bytes(len(chunk))
+                    metrics.increment("download_bytes", len(chunk))
+            finally:
+                await self._run_blocking(f.close)
+        except BaseException:
+            await self._run_blocking(download_audio.remove_partial, temp_path)
+            raise
+
+        await self._run_blocking(os.replace, temp_path, filepath)
+
+    async def _fetch_with_curl(
+        self, episode_id: str, audio_url: str, filepath: str, urls: List[str]
+    ) -> str:
+        """Downloads an episode's audio with curl after aiohttp fails."""
+        with metrics.timer("download_curl"):
+            process = await asyncio.create_subprocess_exec(
+                "curl", "-f", "-L", "-k", "-s", "-o", filepath, audio_url
+            )
+            returncode = await process.wait()
+
+        if returncode != 0:
+            # curl may have written part of the file before failing
+            await self._run_blocking(download_audio.remove_partial, filepath)
+            metrics.increment("download_errors")
+            metrics.log_event(
+                "download_failed",
+                level=logging.ERROR,
+                episode_id=episode_id,
+                error=f"curl exited with status {returncode}",
+            )
+            return f"Failed to download {episode_id} with both aiohttp and curl\n"
+
+        size = await self._run_blocking(os.path.getsize, filepath)
+        metrics.increment("download_bytes", size)
+        await self._run_blocking(
+            download_audio.record_download,
+            self.download_dir,
+            filepath,
+            urls,
+        )
+        metrics.increment("downloads")
+        return f"Saved with curl to: {filepath}\n"
+
+    async def _adjust_periodically(self):
+        """Adjusts the concurrency limit every `ADJUST_INTERVAL` seconds."""
+        last = time.perf_counter()
+        while True:
+            await asyncio.sleep(ADJUST_INTERVAL)
+            now = time.perf_counter()
+            await self.limit.adjust(now - last)
+            last = now
+
+    async def run(self, episode_metadata: List[Dict[str, Any]]):
+        """Downloads every episode's MP3.
+
+        Parameters
+        ----------
+        episode_metadata : list of dict
+            A list of dictionaries, each representing metadata for an episode.
+        """
+        controller = download_audio.AdmissionController(self.download_dir)
+        queue = deque(
+            download_audio.order_episodes(
+                episode_metadata, download_audio.DOWNLOAD_PRIORITY
+            )
+        )
+        # The bytes reserved for each running download
+        running: Dict[asyncio.Task, int] = {}
+        adjuster = asyncio.create_task(self._adjust_periodically())
+
+        try:
+            while queue or running:
+                # Start downloads in priority order while the admission
+                # controller allows it
+                while queue and len(running) < self.limit.maximum:
+                    size = await self._run_blocking(controller.try_admit, queue[0])
+                    if size is None:
+                        break
+                    task = asyncio.create_task(self.download(queue.popleft()))
+                    running[task] = size
+
+                if not running:
+                    controller.check_stalled()
+                    await asyncio.sleep(download_audio.ADMISSION_POLL_SECONDS)
+                    continue
+
+                finished, _ = await asyncio.wait(
+                    running,
+                    timeout=download_audio.ADMISSION_POLL_SECONDS,
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+                for task in finished:
+                    controller.release(running.pop(task))
+                    try:
+                        task.result()
+                    except Exception as e:
+                        metrics.increment("download_errors")
+                        metrics.log_event(
+                            "download_failed", level=logging.ERROR, error=str(e)
+                        )
+                    metrics.increment("episodes_processed")
+                    metrics.log_progress("episodes_processed", every=100)
+        finally:
+            adjuster.cancel()
+
+
+async def download_all(
+    episode_metadata: List[Dict[str, Any]],
+    download_dir: str,
+    concurrency: Optional[int] = None,
+):
+    """Downloads every episode's MP3 on one event loop.
+
+    Parameters
+    ----------
+    episode_metadata : list of dict
+        A list of dictionaries, each representing metadata for an episode.
+    download_dir : str
+        The directory where the downloaded MP3 files should be saved.
+    concurrency : int, optional
+        The most downloads to run at once. Defaults to `DOWNLOAD_CONCURRENCY`.
+    """
+    # The engine's limits decide how many connections are open, so the
+    # connector doesn't add its own
+    connector = aiohttp.TCPConnector(limit=0, ttl_dns_cache=300)
+    timeout = aiohttp.ClientTimeout(total=None, sock_connect=30, sock_read=30)
+
+    with ThreadPoolExecutor(max_workers=WRITER_THREADS) as writer:
+        async with aiohttp.ClientSession(
+            connector=connector, timeout=timeout
+        ) as session:
+            engine = DownloadEngine(session, download_dir, writer, concurrency)
+            await engine.run(episode_metadata)
+
+
+def download_audio_parallel(
+    episode_metadata: List[Dict[str, Any]],
+    download_dir: str,
+    concurrency: Optional[int] = None,
+):
+    """Downloads podcast episodes concurrently with asyncio.
+
+    Parameters
+    ----------
+    episode_metadata : list of dict
+        A list of dictionaries, each representing metadata for an episode.
+    download_dir : str
+        The directory where the downloaded MP3 files should be saved.
+    concurrency : int, optional
+        The most downloads to run at once. Defaults to `DOWNLOAD_CONCURRENCY`.
+    """
+    asyncio.run(download_all(episode_metadata, download_dir, concurrency))
@@ -4,9 +4,15 @@ extract_metadata.py
 
 This script extracts show- and episode-level metadata from podcasts RSS URLs
 listed in a separate CSV file. It only extracts this metadata for one specified
-filtering year. After extraction, it writes all collected metadata to two JSON
-files in a separate directory, `data/show_metadata.json` and
-`data/episode_metadata.json`.
+filtering year, or for a range of publication dates. After extraction, it
+writes all collected metadata to two JSON files in a separate directory,
+`data/show_metadata.json` and `data/episode_metadata.json`.
+
+Feeds are downloaded in a thread pool and parsed in a process pool, so parsing
+uses every core. Episodes outside the filter are dropped from the raw XML by a streaming pass
+before `feedparser` sees the feed, so old back-catalog episodes aren't parsed
+into dicts only to be thrown away. Of what `feedparser` returns, only the fields
+declared in `schema.py` are kept.
 
 Usage
 -----
@@ -14,16 +20,43 @@ Usage
 To execute this script, run:
     python3 src/extract_metadata.py --path YOUR_CSV_PATH --year FILTER_YEAR
 
+To filter by a range of dates instead, run the following. Either
+`--start-date` or `--end-date` can be left out to leave that end open.
+    python3 src/extract_metadata.py --path YOUR_CSV_PATH --start-date START_DATE --end-date END_DATE
+
 """
 
 import argparse
 import csv
-from typing import Any, Dict, List, Tuple
-
-import feedparser
-
+import logging
+import os
+from concurrent.futures import (
+    Future,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    as_completed,
+)
+from datetime import date, datetime, time, timedelta, timezone
+from email.utils import parsedate_to_datetime
+from multiprocessing.context import BaseContext
+from typing import Any, Dict, List, Optional, Tuple
+from xml.parsers import expat
+
+import metrics as metrics
+import schema as schema
 import utils as utils
 
+# Thread count for downloading feeds
+MAX_FETCH_WORKERS = 10
+# Process count for parsing feeds, which is CPU-bound
+NUM_PARSE_WORKERS = os.cpu_count() or 1
+# Elements holding a single episode in RSS and Atom feeds
+ITEM_TAGS = {"item", "entry"}
+# Elements feedparser reads an episode's `published_parsed` value from
+DATE_TAGS = {"pubDate", "published", "date", "issued"}
+# How far outside the date range the streaming prefilter still keeps episodes
+PREFILTER_MARGIN = timedelta(days=1)
+
 
 def parse_arguments() -> argparse.Namespace:
     """Parses command-line arguments needed for RSS feed processing.
@@ -45,11 +78,24 @@ def parse_arguments() -> argparse.Namespace:
     parser.add_argument(
         "--year",
         type=int,
-        required=True,
         help="The episode publication year to filter by.",
     )
+    parser.add_argument(
+        "--start-date",
+        type=date.fromisoformat,
+        help="The earliest episode publication date to keep (YYYY-MM-DD).",
+    )
+    parser.add_argument(
+        "--end-date",
+        type=date.fromisoformat,
+        help="The latest episode publication date to keep (YYYY-MM-DD).",
+    )
 
-    return parser.parse_args()
+    args = parser.parse_args()
+    if args.year is None and args.start_date is None and args.end_date is None:
+        parser.error("one of --year, --start-date or --end-date is required")
+
+    return args
 
 
 def load_rss_urls(path: str) -> List[str]:
@@ -91,17 +137,229 @@ def load_rss_urls(path: str) -> List[str]:
         raise FileNotFoundError(f"CSV not found: {path}") from e
 
 
-def extract_metadata(
-    rss_url: str, target_year: int
+def get_date_range(
+    target_year: Optional[int] = None,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+) -> Tuple[Optional[datetime], Optional[datetime]]:
+    """Combines the year and date filters into one range of UTC times.
+
+    Parameters
+    ----------
+    target_year : int, optional
+        The episode publication year to filter by.
+    start_date : date, optional
+        The earliest episode publication date to keep.
+    end_date : date, optional
+        The latest episode publication date to keep.
+
+    Returns
+    -------
+    start : datetime or None
+        The start of the range (inclusive), or None if it's open.
+    end : datetime or None
+        The end of the range (exclusive), or None if it's open.
+    """
+    start = end = None
+
+    if target_year is not None:
+        start = datetime(target_year, 1, 1, tzinfo=timezone.utc)
+        end = datetime(target_year + 1, 1, 1, tzinfo=timezone.utc)
+
+    if start_date is not None:
+        start_time = datetime.combine(start_date, time.min, tzinfo=timezone.utc)
+        start = max(start, start_time) if start else start_time
+
+    if end_date is not None:
+        # The end date is inclusive, so the range ends at the next midnight
+        end_time = datetime.combine(
+            end_date + timedelta(days=1), time.min, tzinfo=timezone.utc
+        )
+        end = min(end, end_time) if end else end_time
+
+    return start, end
+
+
+def is_in_date_range(
+    published_at: Optional[datetime],
+    start: Optional[datetime],
+    end: Optional[datetime],
+) -> bool:
+    """Checks whether a publication time falls in a range.
+
+    Parameters
+    ----------
+    published_at : datetime or None
+        The episode's publication time.
+    start : datetime or None
+        The start of the range (inclusive), or None if it's open.
+    end : datetime or None
+        The end of the range (exclusive), or None if it's open.
+
+    Returns
+    -------
+    bool
+        True if there's no filter, or the episode was published in the range.
+    """
+    if start is None and end is None:
+        return True
+    if published_at is None:
+        return False
+
+    return (start is None or published_at >= start) and (
+        end is None or published_at < end
+    )
+
+
+def _parse_item_date(text: str) -> Optional[datetime]:
+    """Parses an RFC 822 or ISO 8601 date from a feed, or returns None."""
+    text = text.strip()
+    try:
+        parsed = parsedate_to_datetime(text)
+    except (TypeError, ValueError, IndexError):
+        try:
+            parsed = datetime.fromisoformat(text)
+        except ValueError:
+            return None
+
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+
+    return parsed
+
+
+def filter_feed_items(
+    content: bytes, start: Optional[datetime], end: Optional[datetime]
+) -> bytes:
+    """Drops episodes published outside a time range from a feed's raw XML.
+
+    The feed is scanned once with expat, without building a tree or any
+    dicts, and the byte ranges of out-of-range `<item>` (or Atom `<entry>`)
+    elements are cut out. Everything else is left byte-for-byte as it was, so
+    `feedparser` parses the result exactly as it would the full feed.
+
+    This is only a prefilter: episodes whose dates can't be read, or that
+    are within `PREFILTER_MARGIN` of either end of the range, are kept for
+    `parse_feed` to check. Feeds expat can't parse are returned unchanged.
+
+    Parameters
+    ----------
+    content : bytes
+        The raw feed XML.
+    start : datetime or None
+        The start of the range (inclusive), or None if it's open.
+    end : datetime or None
+        The end of the range (exclusive), or None if it's open.
+
+    Returns
+    -------
+    bytes
+        The feed XML without the out-of-range episodes.
+    """
+    # Byte offsets can only be matched up with tags in ASCII-based encodings
+    if (start is None and end is None) or content.startswith(
+        (b"\xff\xfe", b"\xfe\xff")
+    ):
+        return content
+
+    # Widen the range so differences from feedparser's date handling (e.g.
+    # missing time zones) never drop an episode it would have kept
+    start = start - PREFILTER_MARGIN if start else None
+    end = end + PREFILTER_MARGIN if end else None
+
+    parser = expat.ParserCreate()
+    parser.buffer_text = True
+    depth = 0
+    # The episode being read: its start offset, depth and publication time
+    item: Optional[Dict[str, Any]] = None
+    date_text: Optional[List[str]] = None
+    dropped = []
+
+    def start_element(name, attrs):
+        nonlocal depth, item, date_text
+        depth += 1
+        tag = name.rpartition(":")[2]
+
+        if item is None:
+            if tag in ITEM_TAGS:
+                item = {
+                    "start": parser.CurrentByteIndex,
+                    "depth": depth,
+                    "published_at": None,
+                }
+        elif (
+            tag in DATE_TAGS
+            and depth == item["depth"] + 1
+            and item["published_at"] is None
+        ):
+            date_text = []
+
+    def end_element(name):
+        nonlocal depth, item, date_text
+        if date_text is not None:
+            item["published_at"] = _parse_item_date("".join(date_text))
+            date_text = None
+        elif item is not None and depth == item["depth"]:
+            published_at = item["published_at"]
+            if published_at is not None and not is_in_date_range(
+                published_at, start, end
+            ):
+                item_end = content.index(b">", parser.CurrentByteIndex) + 1
+                dropped.append((item["start"], item_end))
+            item = None
+        depth -= 1
+
+    def character_data(data):
+        if date_text is not None:
+            date_text.append(data)
+
+    parser.StartElementHandler = start_element
+    parser.EndElementHandler = end_element
+    parser.CharacterDataHandler = character_data
+
+    try:
+        parser.Parse(content, True)
+    except expat.ExpatError:
+        # Leave malformed feeds to feedparser, which is more forgiving
+        return content
+
+    if not dropped:
+        return content
+
+    metrics.increment("episodes_prefiltered", len(dropped))
+
+    # Stitch together the bytes between the dropped episodes
+    parts = []
+    position = 0
+    for item_start, item_end in dropped:
+        parts.append(content[position:item_start])
+        position = item_end
+    parts.append(content[position:])
+
+    return b"".join(parts)
+
+
+def parse_feed(
+    content: bytes,
+    rss_url: str,
+    target_year: Optional[int] = None,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
 ) -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
-    """Extracts show- and episode-level metadata for a podcast.
+    """Parses a fetched RSS feed into show- and episode-level metadata.
 
     Parameters
     ----------
+    content : bytes
+        The raw feed XML.
     rss_url : str
-        The URL of the podcast RSS feed.
-    target_year : int
+        The URL the feed was fetched from (after redirects).
+    target_year : int, optional
         The episode publication year to filter by.
+    start_date : date, optional
+        The earliest episode publication date to keep.
+    end_date : date, optional
+        The latest episode publication date to keep.
 
     Returns
     -------
@@ -109,59 +367,182 @@ def extract_metadata(
         A dictionary containing the top-level metadata about the podcast.
     episode_metadata : list of dict
         A list of dictionaries, each representing metadata for an episode
-        published in the `target_year`.
+        that passes the filters. Every episode is kept if none are given.
     """
-    try:
-        feed = feedparser.parse(rss_url)
+    import feedparser
+
+    start, end = get_date_range(target_year, start_date, end_date)
+
+    with metrics.timer("prefilter"):
+        content = filter_feed_items(content, start, end)
+
+    # Pass the URL along so feedparser sets the same `base` values it would
+    # if it had fetched the feed itself
+    with metrics.timer("parse"):
+        feed = feedparser.parse(content, response_headers={"content-location": rss_url})
 
-        # Extract show metadata
-        show_metadata = dict(feed.feed)
+    # Extract show metadata, keeping only the fields the pipeline uses
+    show_metadata = schema.project(feed.feed, schema.SHOW_FIELDS)
 
-        # Extract episode metadata
-        episode_metadata = []
+    # Extract episode metadata
+    episode_metadata = []
 
-        for entry in feed.entries:
-            pub_date = entry.get("published_parsed")
+    for entry in feed.entries:
+        # Only save metadata for episodes published in the desired range
+        if is_in_date_range(utils.get_published_at(entry), start, end):
+            # Keep only the fields the pipeline uses, as a plain dict
+            episode_data = schema.project(entry, schema.EPISODE_FIELDS)
+            episode_metadata.append(episode_data)
+
+    return show_metadata, episode_metadata
+
+
+def fetch_feed(rss_url: str) -> Tuple[bytes, str]:
+    """Downloads a feed's raw XML.
+
+    Parameters
+    ----------
+    rss_url : str
+        The URL of the podcast RSS feed.
+
+    Returns
+    -------
+    content : bytes
+        The raw feed XML.
+    final_url : str
+        The URL the feed was fetched from (after redirects).
+    """
+    import requests
 
-            # Only save metadata for episodes published in the desired year
-            if pub_date and pub_date.tm_year == target_year:
-                # Convert the entry to a plain dict
-                episode_data = dict(entry)
-                episode_metadata.append(episode_data)
+    with metrics.timer("fetch"):
+        response = requests.get(rss_url, timeout=30)
+        response.raise_for_status()
+    metrics.increment("fetch_bytes", len(response.content))
 
-        return show_metadata, episode_metadata
+    return response.content, response.url
 
-    except Exception as e:
-        print(f"Error while processing {rss_url}: {e}")
-        return {}, []
+
+def _parse_feed_in_worker(
+    content: bytes, rss_url: str, *filters: Any
+) -> Tuple[Tuple[Dict[str, Any], List[Dict[str, Any]]], Dict[str, Any]]:
+    """Parses a feed in a worker process and returns its metrics with it."""
+    return parse_feed(content, rss_url, *filters), metrics.drain()
+
+
+def extract_all_metadata(
+    rss_urls: List[str],
+    target_year: Optional[int] = None,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    mp_context: Optional[BaseContext] = None,
+) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """Extracts show- and episode-level metadata for every podcast.
+
+    Feeds are fetched in a thread pool, and each feed's raw XML is handed to a
+    process pool to parse as soon as it arrives, since parsing is CPU-bound
+    and wouldn't run in parallel across threads. The workers filter the
+    episodes before sending them back.
+
+    Parameters
+    ----------
+    rss_urls : list of str
+        The URLs of the podcast RSS feeds.
+    target_year : int, optional
+        The episode publication year to filter by.
+    start_date : date, optional
+        The earliest episode publication date to keep.
+    end_date : date, optional
+        The latest episode publication date to keep.
+    mp_context : multiprocessing context, optional
+        How the parse workers are started. Defaults to the platform's default.
+
+    Returns
+    -------
+    tuple of lists of dict
+        The show metadata for every feed, and the episode metadata for every
+        episode that passes the filters, in the order of `rss_urls`.
+    """
+    # Initialize lists to store metadata in
+    all_show_metadata = []
+    all_episode_metadata = []
+    if not rss_urls:
+        return all_show_metadata, all_episode_metadata
+
+    fetch_pool = ThreadPoolExecutor(max_workers=MAX_FETCH_WORKERS)
+    parse_pool = ProcessPoolExecutor(
+        max_workers=min(NUM_PARSE_WORKERS, len(rss_urls)), mp_context=mp_context
+    )
+    with fetch_pool, parse_pool:
+        fetches = {
+            fetch_pool.submit(fetch_feed, url): i for i, url in enumerate(rss_urls)
+        }
+
+        # Start parsing each feed as soon as it's downloaded. A failed fetch
+        # is kept in place of its parse so its error is logged below
+        parses: Dict[int, Future] = {}
+        for fetch in as_completed(fetches):
+            i = fetches[fetch]
+            if fetch.exception() is not None:
+                parses[i] = fetch
+                continue
+            content, final_url = fetch.result()
+            parses[i] = parse_pool.submit(
+                _parse_feed_in_worker,
+                content,
+                final_url,
+                target_year,
+                start_date,
+                end_date,
+            )
+
+        # Gather show and metadata for all RSS URLs in their original order;
+        # save them into their respective lists
+        for i, url in enumerate(rss_urls):
+            try:
+                (show_metadata, episode_metadata), worker_metrics = parses[i].result()
+                metrics.merge(worker_metrics)
+                metrics.increment("feeds")
+                metrics.increment("episodes", len(episode_metadata))
+            except Exception as e:
+                metrics.increment("feed_errors")
+                metrics.log_event(
+                    "feed_failed", level=logging.ERROR, url=url, error=str(e)
+                )
+                show_metadata, episode_metadata = {}, []
+
+            all_show_metadata.append(show_metadata)
+            all_episode_metadata.extend(episode_metadata)
+            metrics.log_event("feed_processed", url=url, episodes=len(episode_metadata))
+
+    return all_show_metadata, all_episode_metadata
 
 
 def main():
     # Parse CSV path and desired year from command line
     args = parse_arguments()
+    metrics.configure("extract_metadata")
 
     # Save RSS URLs into a list
     print("\nLoading RSS URLs...")
     rss_urls = load_rss_urls(args.path)
 
-    # Initialize lists to store metadata in
-    all_show_metadata = []
-    all_episode_metadata = []
-
-    # Gather show and metadata for all RSS URLs; save them into their
-    # respective lists
-    for url in rss_urls:
-        print(f"\nProcessing feed: {url}")
-        show_metadata, episode_metadata = extract_metadata(url, target_year=args.year)
-        all_show_metadata.append(show_metadata)
-        all_episode_metadata.extend(episode_metadata)  # 782
+    all_show_metadata, all_episode_metadata = extract_all_metadata(
+        rss_urls, args.year, args.start_date, args.end_date
+    )
 
     # Serialize the metadata lists to JSON and save to files
-    print("\nSaving metadata to JSON...")
-    utils.save_data_to_json(all_show_metadata, "data/show_metadata.json")
-    utils.save_data_to_json(all_episode_metadata, "data/episode_metadata.json")
+    print("\nSaving metadata...")
+    utils.save_data(
+        all_show_metadata, utils.get_stage_path("show_metadata"), "show_metadata"
+    )
+    utils.save_data(
+        all_episode_metadata,
+        utils.get_stage_path("episode_metadata"),
+        "episode_metadata",
+    )
 
     print("\nMetadata extraction complete!")
+    metrics.report()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,658 @@
+"""
+ingest_daemon.py
+================
+
+This script continuously polls the podcast RSS feeds listed in a CSV and
+ingests new episodes as soon as they're published, instead of waiting for the
+next batch run of the whole pipeline.
+
+Each feed is polled on its own schedule:
+
+* The interval is a fraction of the feed's typical gap between episodes, so a
+daily show is checked every few hours and a monthly one about once a day.
+* A feed's `<ttl>` is respected as the shortest interval.
+* Each poll that finds nothing new backs the interval off a little.
+* Feeds are fetched with `If-None-Match`/`If-Modified-Since`, and a feed whose
+body hasn't changed isn't parsed at all.
+
+Only episodes whose IDs haven't been seen before are downloaded, transcribed
+and upserted into Postgres. An episode is only marked as seen once it has been
+ingested; until then it's kept as pending, and one that fails (or is cut off
+by a restart) is retried on its feed's next poll, up to `MAX_ATTEMPTS` times.
+What has been seen, what's pending, and when each feed is next due, is kept in
+`data/ingest_state.json` so the daemon can be restarted.
+
+Usage
+-----
+
+To execute this script, run:
+    python3 src/ingest_daemon.py --path YOUR_CSV_PATH
+
+On the first poll of a feed, its existing episodes are marked as seen without
+being ingested. To also ingest existing episodes published since a date, run:
+    python3 src/ingest_daemon.py --path YOUR_CSV_PATH --since 2024-10-01
+
+"""
+
+import argparse
+import hashlib
+import logging
+import multiprocessing
+import os
+import statistics
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple
+
+import download_audio as download_audio
+import extract_metadata as extract_metadata
+import metrics as metrics
+import transcribe_audio as transcribe_audio
+import utils as utils
+
+if TYPE_CHECKING:
+    import requests
+
+# Where the daemon keeps what it has seen and when each feed is next due
+STATE_PATH = os.path.join(utils.DATA_DIR, "ingest_state.json")
+# Bounds on how often a single feed is polled, in seconds
+MIN_POLL_SECONDS = 5 * 60
+MAX_POLL_SECONDS = 24 * 60 * 60
+# A feed is polled this many times per typical gap between its episodes
+POLLS_PER_EPISODE_GAP = 8
+# How much the interval grows after each poll that finds nothing new
+BACKOFF_FACTOR = 1.5
+# Number of recent episodes used to estimate a feed's publishing cadence
+CADENCE_WINDOW = 20
+# Thread count for fetching feeds and downloading audio
+MAX_WORKERS = 10
+# Times an episode is tried before it's abandoned, as in `work_queue`
+MAX_ATTEMPTS = 3
+# Transcription workers are spawned, as forking copies the running threads' locks
+PROCESS_START_METHOD = "spawn"
+
+
+def parse_arguments() -> argparse.Namespace:
+    """Parses command-line arguments for the ingest daemon.
+
+    Returns
+    -------
+    argparse.Namespace
+        An object containing the CSV file path and polling options.
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--path",
+        required=True,
+        help="The path to the CSV file with RSS feed URLs.",
+    )
+    parser.add_argument(
+        "--since",
+        type=datetime.fromisoformat,
+        help="On a feed's first poll, also ingest episodes published since this "
+        "date (YYYY-MM-DD).",
+    )
+    parser.add_argument(
+        "--once",
+        action="store_true",
+        help="Poll every due feed once, wait for ingestion, and exit.",
+    )
+
+    return parser.parse_args()
+
+
+def load_state(path: str) -> Dict[str, Any]:
+    """Loads the daemon's saved state, or starts a fresh one.
+
+    Parameters
+    ----------
+    path : str
+        The path to the state file.
+
+    Returns
+    -------
+    dict
+        A dictionary mapping each feed URL to its polling state.
+    """
+    if os.path.exists(path):
+        return utils.read_data_from_json(path)
+
+    return {}
+
+
+def save_state(state: Dict[str, Any], path: str):
+    """Saves the daemon's state, replacing the file atomically.
+
+    Parameters
+    ----------
+    state : dict
+        A dictionary mapping each feed URL to its polling state.
+    path : str
+        The path to the state file.
+    """
+    temp_path = f"{path}.tmp"
+    utils.save_data_to_json(state, temp_path)
+    os.replace(temp_path, path)
+
+
+def compute_poll_interval(
+    published_times: List[float],
+    ttl_minutes: Optional[str] = None,
+    unchanged_polls: int = 0,
+) -> float:
+    """Picks how long to wait before polling a feed again.
+
+    Parameters
+    ----------
+    published_times : list of float
+        Publication times of the feed's episodes as Unix timestamps.
+    ttl_minutes : str, optional
+        The feed's `<ttl>` value, the minutes it may be cached for.
+    unchanged_polls : int, optional
+        The number of polls in a row that found no new episodes.
+
+    Returns
+    -------
+    float
+        The number of seconds until the next poll.
+    """
+    recent = sorted(published_times, reverse=True)[:CADENCE_WINDOW]
+    gaps = [newer - older for newer, older in zip(recent, recent[1:]) if newer > older]
+
+    if gaps:
+        interval = statistics.median(gaps) / POLLS_PER_EPISODE_GAP
+    else:
+        interval = MAX_POLL_SECONDS
+
+    interval *= BACKOFF_FACTOR**unchanged_polls
+
+    try:
+        interval = max(interval, float(ttl_minutes) * 60)
+    except (TypeError, ValueError):
+        pass
+
+    return min(max(interval, MIN_POLL_SECONDS), MAX_POLL_SECONDS)
+
+
+def fetch_feed(
+    rss_url: str, feed_state: Dict[str, Any]
+) -> Optional["requests.Response"]:
+    """Fetches a feed unless it hasn't changed since the last poll.
+
+    Parameters
+    ----------
+    rss_url : str
+        The URL of the podcast RSS feed.
+    feed_state : dict
+        The feed's polling state. Its `etag`, `last_modified` and
+        `content_hash` are updated.
+
+    Returns
+    -------
+    requests.Response or None
+        The response, or None if the feed hasn't changed.
+    """
+    import requests
+
+    headers = {}
+    if feed_state.get("etag"):
+        headers["If-None-Match"] = feed_state["etag"]
+    if feed_state.get("last_modified"):
+        headers["If-Modified-Since"] = feed_state["last_modified"]
+
+    with metrics.timer("fetch"):
+        response = requests.get(rss_url, headers=headers, timeout=30)
+    if response.status_code == 304:
+        metrics.increment("feeds_not_modified")
+        return None
+    response.raise_for_status()
+    metrics.increment("fetch_bytes", len(response.content))
+
+    feed_state["etag"] = response.headers.get("ETag")
+    feed_state["last_modified"] = response.headers.get("Last-Modified")
+
+    # Some servers ignore conditional requests, so also compare the body
+    content_hash = hashlib.sha256(response.content).hexdigest()
+    if content_hash == feed_state.get("content_hash"):
+        metrics.increment("feeds_not_modified")
+        return None
+    feed_state["content_hash"] = content_hash
+
+    return response
+
+
+def poll_feed(
+    rss_url: str, feed_state: Dict[str, Any], since: Optional[datetime]
+) -> Tuple[Optional[Dict[str, Any]], List[Dict[str, Any]]]:
+    """Polls a feed for episodes that haven't been seen before.
+
+    Parameters
+    ----------
+    rss_url : str
+        The URL of the podcast RSS feed.
+    feed_state : dict
+        The feed's polling state, updated with the new episodes, which are
+        added to its `pending` episodes, and the time of the next poll.
+    since : datetime, optional
+        On the feed's first poll, episodes published since this time are
+        returned as new. Otherwise they're only marked as seen.
+
+    Returns
+    -------
+    show_metadata : dict or None
+        The show metadata, if the feed changed.
+    new_episodes : list of dict
+        The episodes that haven't been seen or found before.
+    """
+    first_poll = "seen_ids" not in feed_state
+    seen_ids = set(feed_state.get("seen_ids", []))
+    pending = feed_state.setdefault("pending", {})
+    show_metadata = None
+    new_episodes = []
+
+    response = fetch_feed(rss_url, feed_state)
+    if response is not None:
+        show_metadata, episodes = extract_metadata.parse_feed(
+            response.content, response.url
+        )
+
+        for episode in episodes:
+            episode_id = episode.get("id")
+            if episode_id in seen_ids or episode_id in pending:
+                continue
+
+            published_at = utils.get_published_at(episode)
+            if not first_poll or (since and published_at and published_at >= since):
+                # Only marked as seen once it has been ingested
+                pending[episode_id] = episode
+                new_episodes.append(episode)
+            else:
+                seen_ids.add(episode_id)
+
+        # Keep the most recent times, whatever order the feed lists them in
+        published_times = [utils.get_published_at(episode) for episode in episodes]
+        feed_state["published_times"] = sorted(
+            (
+                published_at.timestamp()
+                for published_at in published_times
+                if published_at is not None
+            ),
+            reverse=True,
+        )[:CADENCE_WINDOW]
+        feed_state["ttl"] = show_metadata.get("ttl")
+
+    feed_state["unchanged_polls"] = (
+        0 if new_episodes else feed_state.get("unchanged_polls", 0) + 1
+    )
+    feed_state["seen_ids"] = sorted(seen_ids)
+    feed_state["next_poll"] = time.time() + compute_poll_interval(
+        feed_state.get("published_times", []),
+        feed_state.get("ttl"),
+        feed_state["unchanged_polls"],
+    )
+
+    return show_metadata, new_episodes
+
+
+def record_ingested(state: Dict[str, Any], ingested: List[Tuple[str, str]]):
+    """Marks ingested episodes as seen, so they aren't retried.
+
+    Parameters
+    ----------
+    state : dict
+        A dictionary mapping each feed URL to its polling state.
+    ingested : list of (str, str)
+        The feed URL and ID of each episode that was ingested.
+    """
+    for url, episode_id in ingested:
+        feed_state = state[url]
+        feed_state.get("pending", {}).pop(episode_id, None)
+        feed_state.get("attempts", {}).pop(episode_id, None)
+        feed_state["seen_ids"] = sorted({*feed_state.get("seen_ids", []), episode_id})
+
+
+def record_failed(state: Dict[str, Any], failed: List[Tuple[str, str]]):
+    """Counts failed attempts, abandoning episodes after `MAX_ATTEMPTS`.
+
+    An abandoned episode is marked as seen, so it isn't retried or found as
+    new again.
+
+    Parameters
+    ----------
+    state : dict
+        A dictionary mapping each feed URL to its polling state.
+    failed : list of (str, str)
+        The feed URL and ID of each episode whose attempt failed.
+    """
+    for url, episode_id in failed:
+        feed_state = state[url]
+        attempts = feed_state.setdefault("attempts", {})
+        attempts[episode_id] = attempts.get(episode_id, 0) + 1
+        if attempts[episode_id] < MAX_ATTEMPTS:
+            continue
+
+        del attempts[episode_id]
+        feed_state.get("pending", {}).pop(episode_id, None)
+        feed_state["seen_ids"] = sorted({*feed_state.get("seen_ids", []), episode_id})
+        metrics.increment("episodes_abandoned")
+        metrics.log_event(
+            "episode_abandoned",
+            level=logging.ERROR,
+            url=url,
+            episode_id=episode_id,
+            attempts=MAX_ATTEMPTS,
+        )
+
+
+def record_finished(state: Dict[str, Any], ingester: "Ingester"):
+    """Updates the state with the episodes the ingester has finished.
+
+    Parameters
+    ----------
+    state : dict
+        A dictionary mapping each feed URL to its polling state.
+    ingester : Ingester
+        The ingester whose ingested and failed episodes are collected.
+    """
+    record_ingested(state, ingester.collect_ingested())
+    record_failed(state, ingester.collect_failed())
+
+
+class Ingester:
+    """Pushes new episodes through download, transcription and upsert.
+
+    Downloads run in a thread pool and transcription in a process pool that
+    stays warm between polls, so the model is only loaded once per worker.
+    Downloads wait for the `download_audio.AdmissionController` limits, so
+    they don't get too far ahead of transcription.
+    The episodes that were ingested or failed are collected with
+    `collect_ingested` and `collect_failed`, so the daemon's state is only
+    updated from the polling thread.
+
+    Parameters
+    ----------
+    dsn : str
+        A formatted string containing variables to make the Postgres
+        table connection.
+    """
+
+    def __init__(self, dsn: str):
+        self.dsn = dsn
+        self.download_dir = transcribe_audio.AUDIO_DIR
+        self.transcript_dir = transcribe_audio.TRANSCRIPT_DIR
+        os.makedirs(self.download_dir, exist_ok=True)
+        os.makedirs(self.transcript_dir, exist_ok=True)
+
+        self.download_pool = ThreadPoolExecutor(max_workers=MAX_WORKERS)
+        self.admission = download_audio.AdmissionController(
+            self.download_dir, self.transcript_dir
+        )
+        transcribe_audio.configure(transcribe_audio.load_settings())
+        self.transcribe_pool = ProcessPoolExecutor(
+            max_workers=transcribe_audio.NUM_WORKERS,
+            initializer=transcribe_audio.get_default_initializer(),
+            mp_context=multiprocessing.get_context(PROCESS_START_METHOD),
+        )
+        self.lock = threading.Lock()
+        # The episodes being ingested, by ID
+        self.in_flight: Dict[str, Future] = {}
+        # The feed URL and ID of each episode ingested or failed since the
+        # last collect
+        self.ingested: List[Tuple[str, str]] = []
+        self.failed: List[Tuple[str, str]] = []
+
+    def load_show(self, show_metadata: Dict[str, Any]):
+        """Upserts a changed show's metadata."""
+        import insert_data_into_postgres_show
+
+        insert_data_into_postgres_show.write_to_postgres(
+            self.dsn, [dict(show_metadata)]
+        )
+
+    def submit(self, url: str, episode: Dict[str, Any]):
+        """Starts ingesting an episode in the background.
+
+        Episodes that are in flight, or have finished but haven't been
+        collected yet, aren't started again.
+
+        Parameters
+        ----------
+        url : str
+            The URL of the episode's feed.
+        episode : dict
+            A dictionary containing metadata for a single episode.
+        """
+        episode_id = episode.get("id")
+        with self.lock:
+            if (
+                episode_id in self.in_flight
+                or (url, episode_id) in self.ingested
+                or (url, episode_id) in self.failed
+            ):
+                return
+            self.in_flight[episode_id] = self.download_pool.submit(
+                self._ingest, url, episode
+            )
+
+    def _ingest(self, url: str, episode: Dict[str, Any]):
+        """Downloads, transcribes and upserts a single episode."""
+        import insert_data_into_postgres_episode
+        import insert_data_into_postgres_full_text
+        import insert_data_into_postgres_segmented_text
+
+        episode_id = episode.get("id")
+        try:
+            insert_data_into_postgres_episode.write_to_postgres(
+                self.dsn, [dict(episode)]
+            )
+
+            self._download(episode)
+            audio_file = os.path.join(self.download_dir, f"{episode_id}.mp3")
+            if not os.path.exists(audio_file):
+                raise RuntimeError("audio was not downloaded")
+
+            future = self.transcribe_pool.submit(
+                transcribe_audio.transcribe_audio, audio_file, self.transcript_dir
+            )
+            _, worker_metrics = future.result()
+            metrics.merge(worker_metrics)
+
+            segmented_text_dict = transcribe_audio.load_transcript(
+                transcribe_audio.get_transcript_path(episode_id, self.transcript_dir)
+            )
+            full_text_dict = transcribe_audio.create_full_text_dict(
+                segmented_text_dict["segmented_text"], episode_id
+            )
+            insert_data_into_postgres_full_text.write_to_postgres(
+                self.dsn, [full_text_dict]
+            )
+            insert_data_into_postgres_segmented_text.write_to_postgres(
+                self.dsn, [segmented_text_dict]
+            )
+
+            with self.lock:
+                self.ingested.append((url, episode_id))
+            metrics.increment("episodes_ingested")
+            metrics.log_event("episode_ingested", episode_id=episode_id)
+
+        except Exception as e:
+            metrics.increment("ingest_errors")
+            metrics.log_event(
+                "ingest_failed",
+                level=logging.ERROR,
+                episode_id=episode_id,
+                error=str(e),
+            )
+            with self.lock:
+                self.failed.append((url, episode_id))
+
+        finally:
+            with self.lock:
+                del self.in_flight[episode_id]
+
+    def _download(self, episode: Dict[str, Any]):
+        """Downloads an episode's MP3 once the admission controller allows it."""
+        size = self.admission.try_admit(episode)
+        while size is None:
+            self.admission.check_stalled()
+            time.sleep(download_audio.ADMISSION_POLL_SECONDS)
+            size = self.admission.try_admit(episode)
+
+        try:
+            download_audio.download_audio(episode, self.download_dir)
+        finally:
+            self.admission.release(size)
+
+    def collect_ingested(self) -> List[Tuple[str, str]]:
+        """Returns the episodes ingested since the last call.
+
+        Returns
+        -------
+        list of (str, str)
+            The feed URL and ID of each episode.
+        """
+        with self.lock:
+            ingested, self.ingested = self.ingested, []
+
+        return ingested
+
+    def collect_failed(self) -> List[Tuple[str, str]]:
+        """Returns the episodes that failed since the last call.
+
+        Returns
+        -------
+        list of (str, str)
+            The feed URL and ID of each episode.
+        """
+        with self.lock:
+            failed, self.failed = self.failed, []
+
+        return failed
+
+    def wait(self):
+        """Waits for every episode submitted so far to finish."""
+        with self.lock:
+            futures = list(self.in_flight.values())
+        for future in futures:
+            future.result()
+
+    def close(self):
+        """Waits for in-flight episodes and shuts the pools down."""
+        self.wait()
+        self.download_pool.shutdown()
+        self.transcribe_pool.shutdown()
+
+
+def run(
+    rss_urls: List[str],
+    ingester: Ingester,
+    state: Dict[str, Any],
+    since: Optional[datetime] = None,
+    once: bool = False,
+):
+    """Polls each feed when it's due and ingests its new episodes.
+
+    Parameters
+    ----------
+    rss_urls : list of str
+        The URLs of the podcast RSS feeds.
+    ingester : Ingester
+        Pushes new episodes through download, transcription and upsert.
+    state : dict
+        The daemon's state, saved to `STATE_PATH` after every round of polls.
+    since : datetime, optional
+        Ingest existing episodes published since this time on a feed's first
+        poll.
+    once : bool, optional
+        Poll every due feed once and return instead of looping forever.
+    """
+    if since is not None and since.tzinfo is None:
+        since = since.replace(tzinfo=timezone.utc)
+
+    # Retry the episodes an earlier run didn't finish
+    record_finished(state, ingester)
+    for url in rss_urls:
+        for episode in state.get(url, {}).get("pending", {}).values():
+            ingester.submit(url, episode)
+
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as fetch_pool:
+        while True:
+            # Finished episodes aren't pending anymore, so aren't resubmitted
+            record_finished(state, ingester)
+            now = time.time()
+            due = [
+                url for url in rss_urls if state.get(url, {}).get("next_poll", 0) <= now
+            ]
+
+            polls = {
+                url: fetch_pool.submit(poll_feed, url, state.setdefault(url, {}), since)
+                for url in due
+            }
+            for url, future in polls.items():
+                try:
+                    show_metadata, new_episodes = future.result()
+                except Exception as e:
+                    # Try a failing feed again after the shortest interval
+                    state[url]["next_poll"] = time.time() + MIN_POLL_SECONDS
+                    metrics.increment("feed_errors")
+                    metrics.log_event(
+                        "poll_failed", level=logging.ERROR, url=url, error=str(e)
+                    )
+                    continue
+
+                metrics.increment("polls")
+                if show_metadata:
+                    try:
+                        ingester.load_show(show_metadata)
+                    except Exception as e:
+                        # Fetch and load the show again on the next poll
+                        for key in ("etag", "last_modified", "content_hash"):
+                            state[url].pop(key, None)
+                        metrics.increment("load_errors")
+                        metrics.log_event(
+                            "load_failed", level=logging.ERROR, url=url, error=str(e)
+                        )
+                # Retries the feed's failed episodes along with its new ones
+                for episode in state[url]["pending"].values():
+                    ingester.submit(url, episode)
+                metrics.log_event(
+                    "feed_polled", url=url, new_episodes=len(new_episodes)
+                )
+
+            if once:
+                ingester.wait()
+            record_finished(state, ingester)
+            save_state(state, STATE_PATH)
+
+            if once:
+                return
+
+            # Sleep until the next feed is due
+            next_poll = min(state[url]["next_poll"] for url in rss_urls)
+            time.sleep(max(1.0, next_poll - time.time()))
+
+
+def main():
+    args = parse_arguments()
+    metrics.configure("ingest_daemon")
+
+    rss_urls = extract_metadata.load_rss_urls(args.path)
+    state = load_state(STATE_PATH)
+    ingester = Ingester(utils.get_postgres_dsn())
+
+    print(f"\nPolling {len(rss_urls)} feeds...")
+    try:
+        run(rss_urls, ingester, state, since=args.since, once=args.once)
+    except KeyboardInterrupt:
+        print("\nStopping...")
+    finally:
+        ingester.close()
+        record_finished(state, ingester)
+        save_state(state, STATE_PATH)
+        metrics.report()
+
+
+if __name__ == "__main__":
+    main()
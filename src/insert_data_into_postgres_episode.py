@@ -11,85 +11,50 @@ Usage
 To execute this script, run:
     python3 src/insert_data_into_postgres_episode.py
 
+To also write cProfile reports for each stage to `data/profiles`, run:
+    python3 src/insert_data_into_postgres_episode.py --profile
+
 """
 
-import json
+import argparse
 import os
 from typing import Any, Dict, List
 
-import psycopg
-from dotenv import load_dotenv
-
+import metrics as metrics
+import row_encoder as row_encoder
+import schema as schema
+import stage_profiler as stage_profiler
 import utils as utils
 
-# Path to the JSON file
-json_file_path = "data/episode_metadata.json"
-
-# All top-level keys in the data
-expected_keys = [
-    "id",
-    "title",
-    "link",
-    "summary",
-    "published",
-    "itunes_episode",
-    "itunes_episodetype",
-    "itunes_duration",
-    "author",
-    "subtitle",
-    "image",
-    "title_detail",
-    "summary_detail",
-    "subtitle_detail",
-    "author_detail",
-    "published_parsed",
-    "links",
-    "authors",
-    "content",
-    "guidislink",
-    "ppg_enclosurelegacy",
-    "ppg_enclosuresecure",
-    "ppg_canonical",
-    "media_content",
-]
+# Path to the data file (JSON or Parquet, see utils.STAGE_FORMATS)
+data_file_path = utils.get_stage_path("episode_metadata")
+
+# All top-level keys in the data, as kept at extraction (see schema.py)
+expected_keys = schema.get_columns(schema.EPISODE_FIELDS)
 
 # All JSONB fields in the data
-json_fields = [
-    "title_detail",
-    "links",
-    "summary_detail",
-    "published_parsed",
-    "authors",
-    "author_detail",
-    "image",
-    "subtitle_detail",
-    "content",
-    "ppg_enclosurelegacy",
-    "ppg_enclosuresecure",
-    "media_content",
-]
-
-
-def prepare_json_fields(row: Dict[str, Any]) -> Dict[str, Any]:
-    """Prepare nested dictionary fields into serialized JSON strings.
+json_fields = schema.get_json_columns(schema.EPISODE_FIELDS)
+
+# The columns written for each row, in the order of the query's placeholders
+columns = expected_keys + ["row_hash"]
 
-    Parameters
-    ----------
-    row : dict
-        A dictionary for a single episode's data.
+
+def parse_arguments() -> argparse.Namespace:
+    """Parses command-line arguments for the loader.
 
     Returns
     -------
-    row : dict
-        A dictionary for a single episode's data with nested dictionaries
-        serialized into JSON strings.
+    argparse.Namespace
+        An object containing whether to profile the run.
     """
-    for field in json_fields:
-        if field in row and row[field] is not None:
-            row[field] = json.dumps(row[field])
-        else:
-            row[field] = None
-    return row
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="Write cProfile reports for each stage to data/profiles.",
+    )
+
+    return parser.parse_args()
 
 
 def write_to_postgres(dsn: str, data: List[Dict[str, Any]]):
@@ -103,26 +68,19 @@ def write_to_postgres(dsn: str, data: List[Dict[str, Any]]):
     data : list of dict
         The episode data to write.
     """
+    import psycopg
+
+    # Turns a record into its row's parameters, with the JSONB fields encoded
+    # and missing keys filled with None
+    encode_row = row_encoder.compile_row_encoder(expected_keys, json_fields)
+
     with psycopg.connect(dsn) as conn:
         with conn.cursor() as cur:
-            insert_query = """
-            INSERT INTO csmap.information.episode (
-                id, title, title_detail, links, link, summary,
-                summary_detail, published, published_parsed,
-                itunes_episodetype, itunes_episode, authors,
-                author, author_detail, image, subtitle, subtitle_detail,
-                content, itunes_duration, guidislink, ppg_enclosurelegacy,
-                ppg_enclosuresecure, ppg_canonical, media_content
-            )
-            VALUES (
-                %(id)s, %(title)s, %(title_detail)s, %(links)s, %(link)s,
-                %(summary)s, %(summary_detail)s, %(published)s,
-                %(published_parsed)s, %(itunes_episodetype)s, %(itunes_episode)s,
-                %(authors)s, %(author)s, %(author_detail)s, %(image)s,
-                %(subtitle)s, %(subtitle_detail)s, %(content)s,
-                %(itunes_duration)s, %(guidislink)s, %(ppg_enclosurelegacy)s,
-                %(ppg_enclosuresecure)s, %(ppg_canonical)s, %(media_content)s
+            insert_query = f"""
+            INSERT INTO csmap.information.episode AS stored (
+                {", ".join(columns)}
             )
+            VALUES ({row_encoder.get_placeholders(columns)})
             ON CONFLICT (id) DO UPDATE SET
                 id = EXCLUDED.id,
                 title = EXCLUDED.title,
@@ -132,50 +90,74 @@ def write_to_postgres(dsn: str, data: List[Dict[str, Any]]):
                 summary = EXCLUDED.summary,
                 summary_detail = EXCLUDED.summary_detail,
                 published = EXCLUDED.published,
-                published_parsed = EXCLUDED.published_parsed,
                 itunes_episodetype = EXCLUDED.itunes_episodetype,
                 itunes_episode = EXCLUDED.itunes_episode,
                 authors = EXCLUDED.authors,
                 author = EXCLUDED.author,
                 author_detail = EXCLUDED.author_detail,
                 image = EXCLUDED.image,
+                subtitle = EXCLUDED.subtitle,
+                subtitle_detail = EXCLUDED.subtitle_detail,
+                content = EXCLUDED.content,
                 itunes_duration = EXCLUDED.itunes_duration,
+                duration_seconds = EXCLUDED.duration_seconds,
                 guidislink = EXCLUDED.guidislink,
                 ppg_enclosurelegacy = EXCLUDED.ppg_enclosurelegacy,
                 ppg_enclosuresecure = EXCLUDED.ppg_enclosuresecure,
                 ppg_canonical = EXCLUDED.ppg_canonical,
-                media_content = EXCLUDED.media_content;
+                media_content = EXCLUDED.media_content,
+                row_hash = EXCLUDED.row_hash
+            WHERE stored.row_hash IS DISTINCT FROM EXCLUDED.row_hash;
             """
 
+            changed_ids = []
             for row in data:
-                # Serialize all nested dictionaries
-                prepared_row = prepare_json_fields(row)
-
-                # Fill in missing keys in episodes with None
-                for key in expected_keys:
-                    if key not in prepared_row:
-                        prepared_row[key] = None
+                # Serialize the nested fields and hash the row in one pass
+                with stage_profiler.stage("encode_row"):
+                    params = encode_row(row)
 
                 # Load the row for table insertion
-                cur.execute(insert_query, prepared_row)
-                print(f"\n{prepared_row.get("id")} inserted or updated")
-
-            conn.commit()
+                with metrics.timer("db_round_trip"), stage_profiler.stage(
+                    "db_round_trip"
+                ):
+                    cur.execute(insert_query, params)
+                metrics.increment("db_rows")
+                if cur.rowcount == 0:
+                    metrics.increment("db_rows_unchanged")
+                else:
+                    changed_ids.append(row.get("id"))
+                metrics.log_progress("db_rows")
+
+            # Let query caches drop results for the changed episodes
+            utils.notify_changes(cur, changed_ids)
+            with metrics.timer("db_commit"), stage_profiler.stage("db_commit"):
+                conn.commit()
 
 
 def main():
-    # Load JSON data from file path
-    data = utils.read_data_from_json(json_file_path)
+    args = parse_arguments()
+    metrics.configure("insert_data_into_postgres_episode")
+    if args.profile:
+        stage_profiler.enable(
+            os.path.join(
+                utils.DATA_DIR, "profiles", "insert_data_into_postgres_episode"
+            )
+        )
+
+    # Load data from file path
+    with stage_profiler.stage("read_data"):
+        data = utils.read_data(data_file_path)
 
     # Structure connection variables for Postgres table (defined in .env)
-    load_dotenv()
-    dsn = f"host={os.getenv('DB_HOST')} dbname={os.getenv('DB_NAME')} user={os.getenv('DB_USER')} password={os.getenv('DB_PASSWORD')} port={os.getenv('DB_PORT')}"
+    dsn = utils.get_postgres_dsn()
 
     # Write data to Postgres table
     print("\nWriting data to Postgres...")
     write_to_postgres(dsn, data)
 
     print(f"\n{len(data)} episodes inserted or updated successfully.")
+    metrics.report()
+    stage_profiler.write_reports()
 
 
 if __name__ == "__main__":
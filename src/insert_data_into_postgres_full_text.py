@@ -11,23 +11,44 @@ Usage
 To execute this script, run:
     python3 src/insert_data_into_postgres_full_text.py
 
+To also write cProfile reports for each stage to `data/profiles`, run:
+    python3 src/insert_data_into_postgres_full_text.py --profile
+
 """
 
+import argparse
 import os
 from typing import Any, Dict, List
 
-import psycopg
-from dotenv import load_dotenv
-
+import metrics as metrics
+import stage_profiler as stage_profiler
 import utils as utils
 
-# Path to the JSON file
-json_file_path = "data/full_text_transcriptions.json"
+# Path to the data file (JSON or Parquet, see utils.STAGE_FORMATS)
+data_file_path = utils.get_stage_path("full_text_transcriptions")
 
 # All the top-level keys in the data
 expected_keys = ["id", "full_text"]
 
 
+def parse_arguments() -> argparse.Namespace:
+    """Parses command-line arguments for the loader.
+
+    Returns
+    -------
+    argparse.Namespace
+        An object containing whether to profile the run.
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="Write cProfile reports for each stage to data/profiles.",
+    )
+
+    return parser.parse_args()
+
+
 def write_to_postgres(dsn: str, data: List[Dict[str, Any]]):
     """Write each full transcript to Postgres.
 
@@ -39,18 +60,22 @@ def write_to_postgres(dsn: str, data: List[Dict[str, Any]]):
     data : list of dict
         The full text data to write.
     """
+    import psycopg
+
     with psycopg.connect(dsn) as conn:
         with conn.cursor() as cur:
             insert_query = """
-            INSERT INTO csmap.transcript.full (
-                id, full_text
+            INSERT INTO csmap.transcript.full AS stored (
+                id, full_text, row_hash
             )
             VALUES (
-                %(id)s, %(full_text)s
+                %(id)s, %(full_text)s, %(row_hash)s
             )
             ON CONFLICT (id) DO UPDATE SET
                 id = EXCLUDED.id,
-                full_text = EXCLUDED.full_text;
+                full_text = EXCLUDED.full_text,
+                row_hash = EXCLUDED.row_hash
+            WHERE stored.row_hash IS DISTINCT FROM EXCLUDED.row_hash;
             """
 
             for row in data:
@@ -59,26 +84,47 @@ def write_to_postgres(dsn: str, data: List[Dict[str, Any]]):
                     if key not in row:
                         row[key] = None
 
+                # Hash the row so it's only rewritten if it changed
+                row["row_hash"] = utils.get_row_hash(row, expected_keys)
+
                 # Load the row for table insertion
-                cur.execute(insert_query, row)
-                print(f"\n{row.get("id")} inserted or updated")
+                with metrics.timer("db_round_trip"), stage_profiler.stage(
+                    "db_round_trip"
+                ):
+                    cur.execute(insert_query, row)
+                metrics.increment("db_rows")
+                if cur.rowcount == 0:
+                    metrics.increment("db_rows_unchanged")
+                metrics.log_progress("db_rows")
 
-            conn.commit()
+            with metrics.timer("db_commit"), stage_profiler.stage("db_commit"):
+                conn.commit()
 
 
 def main():
-    # Load JSON data from file path
-    data = utils.read_data_from_json(json_file_path)
+    args = parse_arguments()
+    metrics.configure("insert_data_into_postgres_full_text")
+    if args.profile:
+        stage_profiler.enable(
+            os.path.join(
+                utils.DATA_DIR, "profiles", "insert_data_into_postgres_full_text"
+            )
+        )
+
+    # Load data from file path
+    with stage_profiler.stage("read_data"):
+        data = utils.read_data(data_file_path)
 
     # Structure connection variables for Postgres table (defined in .env)
-    load_dotenv()
-    dsn = f"host={os.getenv('DB_HOST')} dbname={os.getenv('DB_NAME')} user={os.getenv('DB_USER')} password={os.getenv('DB_PASSWORD')} port={os.getenv('DB_PORT')}"
+    dsn = utils.get_postgres_dsn()
 
     # Write data to Postgres table
     print("\nWriting data to Postgres...")
     write_to_postgres(dsn, data)
 
     print(f"\n{len(data)} transcripts inserted or updated successfully.")
+    metrics.report()
+    stage_profiler.write_reports()
 
 
 if __name__ == "__main__":
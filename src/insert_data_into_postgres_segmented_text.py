@@ -5,31 +5,288 @@ This script loads episode metdata from
 `data/segmented_text_transcriptions.json` into the GCP-hosted PostgreSQL
 table, `csmap.transcript.segmented`.
 
+Each episode's segments are replaced as a whole: the new segments are copied
+into a staging table, then the episode's old segments that are gone or changed
+are deleted and the new ones inserted, in the same transaction. Re-transcribing
+an episode into fewer segments doesn't leave the old extra segments behind,
+and queries never see an episode half replaced.
+
+In the same transaction, the segments that mention each of `MENTION_KEYWORDS`
+in the episodes whose segments changed are recounted into
+`csmap.transcript.mention_counts`, so dashboards can read the counts instead
+of scanning every segment. If that table is empty while segments are stored
+(e.g. it was just added), every stored episode is counted first.
+
 Usage
 -----
 
 To execute this script, run:
     python3 src/insert_data_into_postgres_segmented_text.py
 
+To also write cProfile reports for each stage to `data/profiles`, run:
+    python3 src/insert_data_into_postgres_segmented_text.py --profile
+
+To recount every stored episode's mentions after changing the keywords, run:
+    python3 src/insert_data_into_postgres_segmented_text.py --recount-mentions --keywords Trump Biden Harris
+
 """
 
+import argparse
 import os
-from typing import Any, Dict, List
-
-import psycopg
-from dotenv import load_dotenv
+from itertools import islice
+from typing import TYPE_CHECKING, Any, Dict, Iterable, List, Tuple
 
+import keywords as keywords
+import metrics as metrics
+import stage_profiler as stage_profiler
 import utils as utils
 
-# Path to the JSON file
-json_file_path = "data/segmented_text_transcriptions.json"
+if TYPE_CHECKING:
+    import psycopg
+
+# Path to the data file (JSON or Parquet, see utils.STAGE_FORMATS)
+data_file_path = utils.get_stage_path("segmented_text_transcriptions")
 
 # All the top-level keys in the data
 expected_keys = ["id", "segmented_text"]
 
+# The columns of each segment's row, hashed to skip unchanged segments
+segment_columns = ["id", "segment_index", "text", "start_time", "end_time"]
+
+# How many episodes are replaced in each transaction
+EPISODES_PER_BATCH = 500
+# The keywords whose mentions are counted for each episode
+MENTION_KEYWORDS = keywords.DEFAULT_KEYWORDS
+
+# A staging table for one transaction's segments, dropped when it commits
+create_staging_query = """
+CREATE TEMP TABLE segmented_staging (
+    LIKE csmap.transcript.segmented INCLUDING DEFAULTS
+) ON COMMIT DROP;
+"""
+
+copy_query = """
+COPY segmented_staging (
+    id, segment_index, text, start_time, end_time, row_hash
+) FROM STDIN
+"""
+
+# Delete the episodes' segments that aren't in the new set unchanged, counting
+# the deleted segments of each episode
+delete_query = """
+WITH deleted AS (
+    DELETE FROM csmap.transcript.segmented AS stored
+    WHERE stored.id = ANY(%(ids)s)
+      AND NOT EXISTS (
+          SELECT 1 FROM segmented_staging AS staged
+          WHERE staged.id = stored.id
+            AND staged.segment_index = stored.segment_index
+            AND staged.row_hash = stored.row_hash
+      )
+    RETURNING stored.id
+)
+SELECT id, count(*) FROM deleted GROUP BY id;
+"""
+
+# Insert the new segments that aren't already stored, counting the inserted
+# segments of each episode
+insert_query = """
+WITH inserted AS (
+    INSERT INTO csmap.transcript.segmented (
+        id, segment_index, text, start_time, end_time, row_hash
+    )
+    SELECT staged.id, staged.segment_index, staged.text, staged.start_time,
+           staged.end_time, staged.row_hash
+    FROM segmented_staging AS staged
+    WHERE NOT EXISTS (
+        SELECT 1 FROM csmap.transcript.segmented AS stored
+        WHERE stored.id = staged.id AND stored.segment_index = staged.segment_index
+    )
+    RETURNING id
+)
+SELECT id, count(*) FROM inserted GROUP BY id;
+"""
+
+delete_mentions_query = """
+DELETE FROM csmap.transcript.mention_counts WHERE id = ANY(%(ids)s);
+"""
+
+# Count the segments of the episodes that mention each keyword as a whole word,
+# the same way `query.sql` matches them, and when the first one starts
+count_mentions_query = """
+INSERT INTO csmap.transcript.mention_counts (id, keyword, segment_count, first_time)
+SELECT s.id, k.keyword, count(*), min(s.start_time)
+FROM csmap.transcript.segmented AS s
+CROSS JOIN unnest(%(keywords)s::text[], %(patterns)s::text[]) AS k(keyword, pattern)
+WHERE s.id = ANY(%(ids)s) AND s.text ~* k.pattern
+GROUP BY s.id, k.keyword;
+"""
+
+# Whether no mentions are counted while segments are stored, i.e. the episodes
+# were loaded before the table was added
+uncounted_query = """
+SELECT NOT EXISTS (SELECT 1 FROM csmap.transcript.mention_counts)
+   AND EXISTS (SELECT 1 FROM csmap.transcript.segmented);
+"""
+
+stored_ids_query = """
+SELECT DISTINCT id FROM csmap.transcript.segmented ORDER BY id;
+"""
+
+
+def parse_arguments() -> argparse.Namespace:
+    """Parses command-line arguments for the loader.
+
+    Returns
+    -------
+    argparse.Namespace
+        An object containing whether to profile the run, the keywords to
+        count and whether to only recount them.
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="Write cProfile reports for each stage to data/profiles.",
+    )
+    parser.add_argument(
+        "--keywords",
+        nargs="+",
+        default=MENTION_KEYWORDS,
+        help="The keywords to count mentions of.",
+    )
+    parser.add_argument(
+        "--recount-mentions",
+        action="store_true",
+        help="Recount the mentions in every stored episode instead of loading.",
+    )
+
+    return parser.parse_args()
+
+
+def get_segment_rows(row: Dict[str, Any]) -> Iterable[Tuple[Any, ...]]:
+    """Flattens a transcript's segments into rows for the segmented table.
+
+    Parameters
+    ----------
+    row : dict
+        A dictionary with the episode's `id` and `segmented_text`.
+
+    Returns
+    -------
+    iterable of tuple
+        The values of each segment's row, in `segment_columns` order followed
+        by the row hash.
+    """
+    for index, segment in enumerate(row.get("segmented_text") or [], start=1):
+        segment_data = {
+            "id": row.get("id"),
+            "segment_index": index,
+            "text": segment.get("text", None),
+            "start_time": segment.get("start", None),
+            "end_time": segment.get("end", None),
+        }
+        yield (
+            *(segment_data[column] for column in segment_columns),
+            utils.get_row_hash(segment_data, segment_columns),
+        )
+
+
+def replace_segments(cur: "psycopg.Cursor", batch: List[Dict[str, Any]]):
+    """Replaces the segments of a batch of episodes within one transaction.
+
+    Parameters
+    ----------
+    cur : psycopg.Cursor
+        A cursor in the transaction to replace the segments in.
+    batch : list of dict
+        The episodes' transcripts, each with an `id` and `segmented_text`.
+    """
+    cur.execute(create_staging_query)
+
+    with metrics.timer("db_copy"), stage_profiler.stage("db_copy"):
+        with cur.copy(copy_query) as copy:
+            for row in batch:
+                for segment_row in get_segment_rows(row):
+                    copy.write_row(segment_row)
+                    metrics.increment("db_rows")
+        cur.execute("ANALYZE segmented_staging")
+
+    with metrics.timer("db_swap"), stage_profiler.stage("db_swap"):
+        cur.execute(delete_query, {"ids": [row["id"] for row in batch]})
+        deleted = dict(cur.fetchall())
+        metrics.increment("db_rows_deleted", sum(deleted.values()))
+        cur.execute(insert_query)
+        inserted = dict(cur.fetchall())
+        metrics.increment("db_rows_inserted", sum(inserted.values()))
+
+    changed_ids = deleted.keys() | inserted.keys()
+    count_mentions(cur, list(changed_ids))
+
+    # Let query caches drop results for the episodes whose segments changed
+    utils.notify_changes(cur, changed_ids)
+
+
+def count_mentions(cur: "psycopg.Cursor", ids: List[str]):
+    """Recounts the segments of some episodes that mention `MENTION_KEYWORDS`.
+
+    Parameters
+    ----------
+    cur : psycopg.Cursor
+        A cursor in the transaction that changed the episodes' segments.
+    ids : list of str
+        The ids of the episodes to recount.
+    """
+    if not ids:
+        return
+
+    with metrics.timer("db_count_mentions"), stage_profiler.stage("db_count_mentions"):
+        cur.execute(delete_mentions_query, {"ids": ids})
+        cur.execute(
+            count_mentions_query,
+            {
+                "ids": ids,
+                "keywords": MENTION_KEYWORDS,
+                "patterns": [
+                    keywords.get_keyword_pattern([keyword])
+                    for keyword in MENTION_KEYWORDS
+                ],
+            },
+        )
+        metrics.increment("db_mention_rows", max(cur.rowcount, 0))
+
+
+def recount_mentions(dsn: str, if_uncounted: bool = False):
+    """Recounts the mentions in every stored episode, e.g. for new keywords.
+
+    Parameters
+    ----------
+    dsn : str
+        A formatted string containing variables to make the Postgres
+        table connection.
+    if_uncounted : bool, optional
+        Only recount if no mentions are counted while segments are stored,
+        as right after `mention_counts` is added. Note that this can't tell
+        it apart from no stored episode mentioning any keyword.
+    """
+    import psycopg
+
+    with psycopg.connect(dsn) as conn:
+        with conn.cursor() as cur:
+            if if_uncounted:
+                if not cur.execute(uncounted_query).fetchone()[0]:
+                    return
+                metrics.log_event("mention_counts_backfill")
+
+            ids = [id for (id,) in cur.execute(stored_ids_query).fetchall()]
+            for start in range(0, len(ids), EPISODES_PER_BATCH):
+                count_mentions(cur, ids[start : start + EPISODES_PER_BATCH])
+                conn.commit()
+                metrics.log_progress("db_mention_rows")
+
 
 def write_to_postgres(dsn: str, data: List[Dict[str, Any]]):
-    """Write each segmented transcript to Postgres.
+    """Write each segmented transcript to Postgres, replacing its old segments.
 
     Parameters
     ----------
@@ -39,61 +296,63 @@ def write_to_postgres(dsn: str, data: List[Dict[str, Any]]):
     data : list of dict
         The segmented text data to write.
     """
+    import psycopg
+
+    # Count the episodes stored before `mention_counts` was added, since only
+    # the changed ones are counted below
+    recount_mentions(dsn, if_uncounted=True)
+
+    # Keep the last transcript of any episode that appears twice, so the
+    # staging table never holds two copies of a segment
+    transcripts = iter({row["id"]: row for row in data if row.get("id")}.values())
+
     with psycopg.connect(dsn) as conn:
         with conn.cursor() as cur:
-            insert_query = """
-            INSERT INTO csmap.transcript.segmented (
-                id, segment_index, text, start_time, end_time
-            )
-            VALUES (
-                %(id)s, %(segment_index)s, %(text)s, %(start_time)s, %(end_time)s
-            )
-            ON CONFLICT (id, segment_index) DO UPDATE SET
-                text = EXCLUDED.text,
-                start_time = EXCLUDED.start_time,
-                end_time = EXCLUDED.end_time;
-            """
-
-            for row in data:
-                # Fill in missing keys in transcripts with None
-                for key in expected_keys:
-                    if key not in row:
-                        row[key] = None
-
-                # Flatten the segments into individual rows
-                if "segmented_text" in row and row["segmented_text"]:
-                    # Loop through each segment and insert as a row
-                    for index, segment in enumerate(row["segmented_text"], start=1):
-                        segment_data = {
-                            "id": row["id"],
-                            "segment_index": index,
-                            "text": segment.get("text", None),
-                            "start_time": segment.get("start", None),
-                            "end_time": segment.get("end", None),
-                        }
-
-                        # Load the row for table insertion
-                        cur.execute(insert_query, segment_data)
-                        print(
-                            f"Segment {index} for {row.get('id')} inserted or updated"
-                        )
-
-            conn.commit()
+            while True:
+                batch = list(islice(transcripts, EPISODES_PER_BATCH))
+                if not batch:
+                    break
+
+                replace_segments(cur, batch)
+                with metrics.timer("db_commit"), stage_profiler.stage("db_commit"):
+                    conn.commit()
+                metrics.log_progress("db_rows")
 
 
 def main():
-    # Load JSON data from file path
-    data = utils.read_data_from_json(json_file_path)
+    global MENTION_KEYWORDS
+
+    args = parse_arguments()
+    metrics.configure("insert_data_into_postgres_segmented_text")
+    if args.profile:
+        stage_profiler.enable(
+            os.path.join(
+                utils.DATA_DIR, "profiles", "insert_data_into_postgres_segmented_text"
+            )
+        )
+    MENTION_KEYWORDS = args.keywords
 
     # Structure connection variables for Postgres table (defined in .env)
-    load_dotenv()
-    dsn = f"host={os.getenv('DB_HOST')} dbname={os.getenv('DB_NAME')} user={os.getenv('DB_USER')} password={os.getenv('DB_PASSWORD')} port={os.getenv('DB_PORT')}"
+    dsn = utils.get_postgres_dsn()
+
+    if args.recount_mentions:
+        print("\nRecounting mentions...")
+        recount_mentions(dsn)
+        metrics.report()
+        stage_profiler.write_reports()
+        return
+
+    # Load data from file path
+    with stage_profiler.stage("read_data"):
+        data = utils.read_data(data_file_path)
 
     # Write data to Postgres table
     print("\nWriting data to Postgres...")
     write_to_postgres(dsn, data)
 
     print(f"\n{len(data)} transcripts inserted or updated successfully.")
+    metrics.report()
+    stage_profiler.write_reports()
 
 
 if __name__ == "__main__":
@@ -10,87 +10,50 @@ Usage
 To execute this script, run:
     python3 src/insert_data_into_postgres_show.py
 
+To also write cProfile reports for each stage to `data/profiles`, run:
+    python3 src/insert_data_into_postgres_show.py --profile
+
 """
 
-import json
+import argparse
 import os
 from typing import Any, Dict, List
 
-import psycopg
-from dotenv import load_dotenv
-
+import metrics as metrics
+import row_encoder as row_encoder
+import schema as schema
+import stage_profiler as stage_profiler
 import utils as utils
 
-# Path to your the file
-json_file_path = "data/show_metadata.json"
-
-# All top-level keys in the data
-expected_keys = [
-    "title",
-    "title_detail",
-    "links",
-    "link",
-    "subtitle",
-    "subtitle_detail",
-    "rights",
-    "rights_detail",
-    "generator",
-    "generator_detail",
-    "language",
-    "authors",
-    "author",
-    "author_detail",
-    "itunes_block",
-    "publisher_detail",
-    "tags",
-    "media_thumbnail",
-    "href",
-    "image",
-    "itunes_type",
-    "updated",
-    "updated_parsed",
-    "media_restriction",
-    "restriction",
-]
+# Path to the data file (JSON or Parquet, see utils.STAGE_FORMATS)
+data_file_path = utils.get_stage_path("show_metadata")
+
+# All top-level keys in the data, as kept at extraction (see schema.py)
+expected_keys = schema.get_columns(schema.SHOW_FIELDS)
 
 # All JSONB fields in the data
-json_fields = [
-    "title_detail",
-    "links",
-    "subtitle_detail",
-    "rights_detail",
-    "generator_detail",
-    "authors",
-    "author_detail",
-    "publisher_detail",
-    "tags",
-    "media_thumbnail",
-    "image",
-    "updated_parsed",
-    "media_restriction",
-]
-
-
-def prepare_json_fields(row: Dict[str, Any]) -> Dict[str, Any]:
-    """Prepare nested dictionary fields into serialized JSON strings.
+json_fields = schema.get_json_columns(schema.SHOW_FIELDS)
 
-    Parameters
-    ----------
-    row : dict
-        A dictionary for a single shows's data.
+# The columns written for each row, in the order of the query's placeholders
+columns = expected_keys + ["row_hash"]
+
+
+def parse_arguments() -> argparse.Namespace:
+    """Parses command-line arguments for the loader.
 
     Returns
     -------
-    row : dict
-        A dictionary for a single show's data with nested dictionaries
-        serialized into JSON strings.
+    argparse.Namespace
+        An object containing whether to profile the run.
     """
-    for field in json_fields:
-        if field in row and row[field] is not None:
-            row[field] = json.dumps(row[field])
-        else:
-            row[field] = None
-    return row
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="Write cProfile reports for each stage to data/profiles.",
+    )
+
+    return parser.parse_args()
 
 
 def write_to_postgres(dsn: str, data: List[Dict[str, Any]]):
@@ -104,27 +67,19 @@ def write_to_postgres(dsn: str, data: List[Dict[str, Any]]):
     data : list of dict
         The show data to write.
     """
+    import psycopg
+
+    # Turns a record into its row's parameters, with the JSONB fields encoded
+    # and missing keys filled with None
+    encode_row = row_encoder.compile_row_encoder(expected_keys, json_fields)
+
     with psycopg.connect(dsn) as conn:
         with conn.cursor() as cur:
-            insert_query = """
-            INSERT INTO csmap.information.show (
-                title, title_detail, links, link, subtitle,
-                subtitle_detail, rights, rights_detail,
-                generator, generator_detail, language, authors,
-                author, author_detail, itunes_block,
-                publisher_detail, tags, media_thumbnail, href,
-                image, itunes_type, updated, updated_parsed, media_restriction,
-                restriction
-            )
-            VALUES (
-                %(title)s, %(title_detail)s, %(links)s, %(link)s, %(subtitle)s,
-                %(subtitle_detail)s, %(rights)s, %(rights_detail)s,
-                %(generator)s, %(generator_detail)s, %(language)s, %(authors)s,
-                %(author)s, %(author_detail)s, %(itunes_block)s,
-                %(publisher_detail)s, %(tags)s, %(media_thumbnail)s, %(href)s,
-                %(image)s, %(itunes_type)s, %(updated)s, %(updated_parsed)s,
-                %(media_restriction)s, %(restriction)s
+            insert_query = f"""
+            INSERT INTO csmap.information.show AS stored (
+                {", ".join(columns)}
             )
+            VALUES ({row_encoder.get_placeholders(columns)})
             ON CONFLICT (title) DO UPDATE SET
                 title = EXCLUDED.title,
                 title_detail = EXCLUDED.title_detail,
@@ -148,40 +103,59 @@ def write_to_postgres(dsn: str, data: List[Dict[str, Any]]):
                 image = EXCLUDED.image,
                 itunes_type = EXCLUDED.itunes_type,
                 updated = EXCLUDED.updated,
-                updated_parsed = EXCLUDED.updated_parsed,
                 media_restriction = EXCLUDED.media_restriction,
-                restriction = EXCLUDED.restriction;
+                restriction = EXCLUDED.restriction,
+                row_hash = EXCLUDED.row_hash
+            WHERE stored.row_hash IS DISTINCT FROM EXCLUDED.row_hash;
             """
 
+            changed = False
             for row in data:
-                # Serialize all nested dictionaries
-                prepared_row = prepare_json_fields(row)
-
-                # Fill in missing keys in episodes with None
-                for key in expected_keys:
-                    if key not in prepared_row:
-                        prepared_row[key] = None
+                # Serialize the nested fields and hash the row in one pass
+                with stage_profiler.stage("encode_row"):
+                    params = encode_row(row)
 
                 # Load the row for table insertion
-                cur.execute(insert_query, prepared_row)
-                print(f"\n{prepared_row.get("title")} inserted or updated")
-
-            conn.commit()
+                with metrics.timer("db_round_trip"), stage_profiler.stage(
+                    "db_round_trip"
+                ):
+                    cur.execute(insert_query, params)
+                metrics.increment("db_rows")
+                if cur.rowcount == 0:
+                    metrics.increment("db_rows_unchanged")
+                else:
+                    changed = True
+                metrics.log_progress("db_rows")
+
+            # A show's title appears in the results for all of its episodes
+            if changed:
+                utils.notify_changes(cur, [utils.ALL_EPISODES])
+            with metrics.timer("db_commit"), stage_profiler.stage("db_commit"):
+                conn.commit()
 
 
 def main():
-    # Load JSON data from file path
-    data = utils.read_data_from_json(json_file_path)
+    args = parse_arguments()
+    metrics.configure("insert_data_into_postgres_show")
+    if args.profile:
+        stage_profiler.enable(
+            os.path.join(utils.DATA_DIR, "profiles", "insert_data_into_postgres_show")
+        )
+
+    # Load data from file path
+    with stage_profiler.stage("read_data"):
+        data = utils.read_data(data_file_path)
 
     # Structure connection variables for Postgres table (defined in .env)
-    load_dotenv()
-    dsn = f"host={os.getenv('DB_HOST')} dbname={os.getenv('DB_NAME')} user={os.getenv('DB_USER')} password={os.getenv('DB_PASSWORD')} port={os.getenv('DB_PORT')}"
+    dsn = utils.get_postgres_dsn()
 
     # Write data to Postgres table
     print("\nWriting data to Postgres...")
     write_to_postgres(dsn, data)
 
     print(f"\n{len(data)} shows inserted or updated successfully.")
+    metrics.report()
+    stage_profiler.write_reports()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,136 @@
+"""
+keywords.py
+===========
+
+This script contains `KeywordMatcher`, which finds the names our queries look
+for in transcript text, including the misspellings a small model makes of
+them.
+
+The `tiny` model often writes a name the way it sounds ("Tromp", "Bidon"),
+so a word matches a keyword if it's the same word, or if it sounds the same
+(the same Soundex code) and is spelled similarly enough.
+
+"""
+
+import re
+from difflib import SequenceMatcher
+from typing import Dict, Iterable, List
+
+# The keywords the transcript queries look for
+DEFAULT_KEYWORDS = ["Trump", "Biden"]
+# How similar a word's spelling has to be to a keyword it sounds like, from 0
+# to 1. Sounding alike alone matches too much ("bottom" and "Biden")
+FUZZY_RATIO = 0.7
+# Words are runs of letters and apostrophes
+WORD_PATTERN = re.compile(r"[A-Za-z']+")
+
+# The Soundex digit for each consonant. Vowels, H, W and Y have none
+_SOUNDEX_CODES = {
+    letter: digit
+    for letters, digit in (
+        ("BFPV", "1"),
+        ("CGJKQSXZ", "2"),
+        ("DT", "3"),
+        ("L", "4"),
+        ("MN", "5"),
+        ("R", "6"),
+    )
+    for letter in letters
+}
+
+
+def soundex(word: str) -> str:
+    """Encodes a word by how it sounds.
+
+    Parameters
+    ----------
+    word : str
+        The word to encode.
+
+    Returns
+    -------
+    str
+        The word's first letter and three digits, e.g. "T651" for "Trump", or
+        an empty string if the word has no letters.
+    """
+    letters = [letter for letter in word.upper() if "A" <= letter <= "Z"]
+    if not letters:
+        return ""
+
+    code = letters[0]
+    last = _SOUNDEX_CODES.get(letters[0], "")
+    for letter in letters[1:]:
+        digit = _SOUNDEX_CODES.get(letter, "")
+        if digit and digit != last:
+            code += digit
+        # H and W don't separate letters with the same digit, but vowels do
+        if letter not in "HW":
+            last = digit
+
+    return (code + "000")[:4]
+
+
+def get_keyword_pattern(keywords: Iterable[str]) -> str:
+    """Builds the Postgres regex `query.sql` matches segments with.
+
+    Parameters
+    ----------
+    keywords : iterable of str
+        The keywords to match as whole words.
+
+    Returns
+    -------
+    str
+        A pattern for the case-insensitive `~*` operator.
+    """
+    alternatives = "|".join(re.escape(keyword) for keyword in keywords)
+
+    return rf"\m({alternatives})\M"
+
+
+class KeywordMatcher:
+    """Checks text for any of a list of keywords.
+
+    Parameters
+    ----------
+    keywords : iterable of str, optional
+        The keywords to look for. Matching ignores case.
+    fuzzy : bool, optional
+        Whether words that sound like a keyword and are spelled similarly also
+        match.
+    """
+
+    def __init__(self, keywords: Iterable[str] = DEFAULT_KEYWORDS, fuzzy: bool = True):
+        self.keywords = {keyword.lower() for keyword in keywords}
+        self.fuzzy = fuzzy
+        self.sounds: Dict[str, List[str]] = {}
+        for keyword in self.keywords:
+            self.sounds.setdefault(soundex(keyword), []).append(keyword)
+
+    def matches_word(self, word: str) -> bool:
+        """Checks whether a single word matches one of the keywords."""
+        word = word.lower().strip("'")
+        if word in self.keywords:
+            return True
+        if not self.fuzzy:
+            return False
+
+        return any(
+            SequenceMatcher(None, word, keyword).ratio() >= FUZZY_RATIO
+            for keyword in self.sounds.get(soundex(word), ())
+        )
+
+    def matches(self, text: str) -> bool:
+        """Checks whether any word in some text matches one of the keywords.
+
+        Parameters
+        ----------
+        text : str
+            The text to check.
+
+        Returns
+        -------
+        bool
+            Whether a keyword was found.
+        """
+        return any(self.matches_word(word) for word in WORD_PATTERN.findall(text))
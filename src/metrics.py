@@ -0,0 +1,358 @@
+"""
+metrics.py
+==========
+
+This script contains the shared instrumentation used by every pipeline script:
+counters, timers and structured JSON logging.
+
+Counters track amounts of work (e.g. `download_bytes`, `db_rows`) and timers
+track how long each kind of work takes (e.g. `fetch`, `parse`, `inference`,
+`db_round_trip`). At the end of a run, `report` logs a summary of both.
+
+Worker processes send their metrics back to the parent with `drain` and
+`merge`. A forked worker starts with empty metrics rather than a copy of the
+parent's, so nothing is counted twice.
+
+Metrics can also be exported in the Prometheus text format, either to a file
+for node_exporter's textfile collector (set `METRICS_TEXTFILE` to its path) or
+from a local HTTP endpoint while the script runs (set `METRICS_PORT`).
+
+"""
+
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional
+
+import config as config
+
+# Where to write Prometheus metrics at the end of a run (optional)
+METRICS_TEXTFILE = config.load().metrics_textfile
+# Port to serve Prometheus metrics on while a script runs (optional)
+METRICS_PORT = config.load().metrics_port
+# How often to log progress, in units of work, for per-row or per-file loops
+PROGRESS_EVERY = config.load().progress_every
+
+logger = logging.getLogger("csmap")
+
+_lock = threading.Lock()
+_counters: Dict[str, float] = {}
+# Each timer keeps its count, total seconds and longest single duration
+_timers: Dict[str, Dict[str, float]] = {}
+# The last multiple of `every` that each counter's progress was logged at
+_progress: Dict[str, int] = {}
+_script = "csmap"
+_started_at = time.perf_counter()
+
+
+class JsonFormatter(logging.Formatter):
+    """Formats log records as one JSON object per line."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": self.formatTime(record, "%Y-%m-%dT%H:%M:%S"),
+            "level": record.levelname.lower(),
+            "script": _script,
+            "event": record.getMessage(),
+        }
+        entry.update(getattr(record, "fields", {}))
+        return json.dumps(entry, default=str)
+
+
+def configure(script: str):
+    """Sets up structured logging and metrics export for a script.
+
+    Parameters
+    ----------
+    script : str
+        The script's name, attached to every log line and metric.
+    """
+    global _script, _started_at
+    _script = script
+    _started_at = time.perf_counter()
+
+    if not logger.handlers:
+        handler = logging.StreamHandler(sys.stderr)
+        handler.setFormatter(JsonFormatter())
+        logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+
+    if METRICS_PORT:
+        start_http_server(METRICS_PORT)
+
+
+def log_event(event: str, level: int = logging.INFO, **fields: Any):
+    """Logs a structured event.
+
+    Parameters
+    ----------
+    event : str
+        A short name for what happened, e.g. "download_failed".
+    level : int, optional
+        The logging level.
+    **fields
+        Extra values to include in the JSON log line.
+    """
+    logger.log(level, event, extra={"fields": fields})
+
+
+def increment(name: str, value: float = 1):
+    """Adds to a counter.
+
+    Parameters
+    ----------
+    name : str
+        The counter's name, e.g. "download_bytes".
+    value : float, optional
+        The amount to add.
+    """
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+
+
+def record_time(name: str, seconds: float):
+    """Records one duration for a timer.
+
+    Parameters
+    ----------
+    name : str
+        The timer's name, e.g. "inference".
+    seconds : float
+        The duration to record.
+    """
+    with _lock:
+        stats = _timers.setdefault(name, {"count": 0, "sum": 0.0, "max": 0.0})
+        stats["count"] += 1
+        stats["sum"] += seconds
+        stats["max"] = max(stats["max"], seconds)
+
+
+@contextmanager
+def timer(name: str) -> Iterator[None]:
+    """Times the enclosed block and records it under `name`.
+
+    Parameters
+    ----------
+    name : str
+        The timer's name, e.g. "fetch".
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_time(name, time.perf_counter() - start)
+
+
+def log_progress(name: str, every: int = PROGRESS_EVERY):
+    """Logs a progress event each time a counter passes a multiple of `every`.
+
+    Call this after incrementing `name`; it replaces per-row print calls.
+    Counters incremented in batches are logged once for each multiple they
+    pass, even if they never land on one exactly.
+
+    Parameters
+    ----------
+    name : str
+        The counter to report on.
+    every : int, optional
+        How many units of work to wait between progress events.
+    """
+    with _lock:
+        count = _counters.get(name, 0)
+        multiple = int(count // every)
+        if multiple <= _progress.get(name, 0):
+            return
+        _progress[name] = multiple
+
+    log_event("progress", **{name: count, "rate": count / _elapsed()})
+
+
+def snapshot() -> Dict[str, Any]:
+    """Returns a copy of the current counters and timers.
+
+    Returns
+    -------
+    dict
+        A dictionary with "counters" and "timers" keys.
+    """
+    with _lock:
+        return {
+            "counters": dict(_counters),
+            "timers": {name: dict(stats) for name, stats in _timers.items()},
+        }
+
+
+def drain() -> Dict[str, Any]:
+    """Returns the current counters and timers and resets them.
+
+    Worker processes call this after each task and send the result back to
+    the parent, which combines them with `merge`.
+
+    Returns
+    -------
+    dict
+        A dictionary with "counters" and "timers" keys.
+    """
+    with _lock:
+        data = {"counters": dict(_counters), "timers": dict(_timers)}
+        _counters.clear()
+        _timers.clear()
+        _progress.clear()
+        return data
+
+
+def merge(data: Dict[str, Any]):
+    """Adds counters and timers from another process into this one.
+
+    Parameters
+    ----------
+    data : dict
+        The output of `drain` or `snapshot` from another process.
+    """
+    with _lock:
+        for name, value in data.get("counters", {}).items():
+            _counters[name] = _counters.get(name, 0) + value
+        for name, other in data.get("timers", {}).items():
+            stats = _timers.setdefault(name, {"count": 0, "sum": 0.0, "max": 0.0})
+            stats["count"] += other["count"]
+            stats["sum"] += other["sum"]
+            stats["max"] = max(stats["max"], other["max"])
+
+
+def reset():
+    """Clears all counters and timers."""
+    with _lock:
+        _counters.clear()
+        _timers.clear()
+        _progress.clear()
+
+
+def _reset_in_child():
+    """Starts a forked process with empty metrics.
+
+    Otherwise a worker's first `drain` would send the parent's metrics back
+    to it, and `merge` would count them again. The lock is replaced too, in
+    case another thread held it when the process forked.
+    """
+    global _lock
+    _lock = threading.Lock()
+    reset()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_in_child)
+
+
+def _elapsed() -> float:
+    """Returns the seconds since `configure` was called."""
+    return max(time.perf_counter() - _started_at, 1e-9)
+
+
+def format_prometheus() -> str:
+    """Formats the current metrics in the Prometheus text format.
+
+    Counters become `csmap_<name>_total` and timers become
+    `csmap_<name>_seconds` summaries with `_count` and `_sum` series.
+
+    Returns
+    -------
+    str
+        The metrics as Prometheus text.
+    """
+    data = snapshot()
+    label = f'{{script="{_script}"}}'
+    lines = []
+
+    for name, value in sorted(data["counters"].items()):
+        lines.append(f"# TYPE csmap_{name}_total counter")
+        lines.append(f"csmap_{name}_total{label} {value}")
+
+    for name, stats in sorted(data["timers"].items()):
+        lines.append(f"# TYPE csmap_{name}_seconds summary")
+        lines.append(f"csmap_{name}_seconds_count{label} {stats['count']}")
+        lines.append(f"csmap_{name}_seconds_sum{label} {stats['sum']}")
+
+    lines.append("# TYPE csmap_run_seconds gauge")
+    lines.append(f"csmap_run_seconds{label} {_elapsed()}")
+
+    return "\n".join(lines) + "\n"
+
+
+def write_prometheus_textfile(path: str):
+    """Writes the current metrics to a Prometheus textfile.
+
+    The file is written under a temporary name and then renamed so the
+    collector never reads a partial file.
+
+    Parameters
+    ----------
+    path : str
+        The file to write.
+    """
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        f.write(format_prometheus())
+    os.replace(temp_path, path)
+
+
+def start_http_server(port: int) -> "ThreadingHTTPServer":
+    """Serves the current metrics at `http://localhost:<port>/metrics`.
+
+    Parameters
+    ----------
+    port : int
+        The local port to listen on.
+
+    Returns
+    -------
+    ThreadingHTTPServer
+        The running server, which stops when the script exits.
+    """
+    # Only scripts that serve their metrics pay for importing the server
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path != "/metrics":
+                self.send_error(404)
+                return
+            body = format_prometheus().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    return server
+
+
+def report(path: Optional[str] = METRICS_TEXTFILE):
+    """Logs a summary of the run's metrics and writes the Prometheus textfile.
+
+    Parameters
+    ----------
+    path : str, optional
+        The Prometheus textfile to write. Defaults to `METRICS_TEXTFILE`.
+    """
+    data = snapshot()
+    elapsed = _elapsed()
+    rates = {
+        f"{name}_per_second": value / elapsed
+        for name, value in data["counters"].items()
+    }
+    log_event("summary", seconds=elapsed, **data, rates=rates)
+
+    if path:
+        write_prometheus_textfile(path)
@@ -0,0 +1,404 @@
+"""
+pipeline.py
+===========
+
+This script runs the whole pipeline as one command. The stages and the stages
+they depend on are:
+
+    extract             (none)
+    load_show           extract
+    load_episode        extract
+    download            extract
+    transcribe          download
+    load_full_text      transcribe
+    load_segmented_text transcribe
+
+Stages start as soon as their dependencies finish, so independent stages run
+at the same time: the show and episode loads run alongside download and
+transcription, and the two transcript loads run alongside each other. Data is
+passed between stages in memory where possible. Every stage still writes its
+usual output to `data`, and a stage whose dependency wasn't run in the same
+invocation reads that output instead.
+
+Usage
+-----
+
+To execute the whole pipeline, run:
+    python3 src/pipeline.py --path YOUR_CSV_PATH --year FILTER_YEAR
+
+To run some stages only, or a stage and everything after it, run:
+    python3 src/pipeline.py --only load_show load_episode
+    python3 src/pipeline.py --from transcribe
+
+To print the stages that would run and the files they'd read, without running
+them, add `--dry-run`.
+
+"""
+
+import argparse
+import logging
+import multiprocessing
+import os
+import sys
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from datetime import date
+from typing import Any, Callable, Dict, List, Set, Tuple
+
+import metrics as metrics
+import utils as utils
+
+# How the stages' process pools start their workers. Forking copies whatever
+# locks the other stages' threads hold at that moment, which can deadlock the
+# workers, so they're spawned fresh instead
+PROCESS_START_METHOD = "spawn"
+
+
+def run_extract(args: argparse.Namespace, outputs: Dict[str, Any]) -> Any:
+    """Extracts show and episode metadata from the RSS feeds."""
+    import extract_metadata
+
+    if args.path is None or (
+        args.year is None and args.start_date is None and args.end_date is None
+    ):
+        raise ValueError(
+            "--path and one of --year, --start-date or --end-date are required "
+            "to run extract."
+        )
+
+    rss_urls = extract_metadata.load_rss_urls(args.path)
+    show_metadata, episode_metadata = extract_metadata.extract_all_metadata(
+        rss_urls,
+        args.year,
+        args.start_date,
+        args.end_date,
+        mp_context=multiprocessing.get_context(PROCESS_START_METHOD),
+    )
+    utils.save_data(
+        show_metadata, utils.get_stage_path("show_metadata"), "show_metadata"
+    )
+    utils.save_data(
+        episode_metadata, utils.get_stage_path("episode_metadata"), "episode_metadata"
+    )
+
+    return {"show_metadata": show_metadata, "episode_metadata": episode_metadata}
+
+
+def get_extracted(outputs: Dict[str, Any], stage: str) -> List[Dict[str, Any]]:
+    """Returns extracted metadata from memory, or from disk if extract didn't run.
+
+    The rows aren't copied: the loaders and the downloader share them across
+    threads, but only read them (the loaders encode each row into a new
+    tuple with `row_encoder`).
+    """
+    if "extract" in outputs:
+        return outputs["extract"][stage]
+
+    return utils.read_data(utils.get_stage_path(stage))
+
+
+def run_load_show(args: argparse.Namespace, outputs: Dict[str, Any]) -> Any:
+    """Loads the show metadata into Postgres."""
+    import insert_data_into_postgres_show
+
+    data = get_extracted(outputs, "show_metadata")
+    insert_data_into_postgres_show.write_to_postgres(utils.get_postgres_dsn(), data)
+
+
+def run_load_episode(args: argparse.Namespace, outputs: Dict[str, Any]) -> Any:
+    """Loads the episode metadata into Postgres."""
+    import insert_data_into_postgres_episode
+
+    data = get_extracted(outputs, "episode_metadata")
+    insert_data_into_postgres_episode.write_to_postgres(utils.get_postgres_dsn(), data)
+
+
+def run_download(args: argparse.Namespace, outputs: Dict[str, Any]) -> Any:
+    """Downloads the audio for every extracted episode."""
+    import download_audio
+
+    download_audio.download_audio_parallel(get_extracted(outputs, "episode_metadata"))
+
+
+def run_transcribe(args: argparse.Namespace, outputs: Dict[str, Any]) -> Any:
+    """Transcribes the downloaded audio and saves the transcript files."""
+    import transcribe_audio
+
+    transcribe_audio.configure(transcribe_audio.load_settings())
+    transcribe_audio.transcribe_audio_parallel(
+        transcribe_audio.AUDIO_DIR,
+        transcribe_audio.TRANSCRIPT_DIR,
+        mp_context=multiprocessing.get_context(PROCESS_START_METHOD),
+    )
+    transcribe_audio.save_transcriptions(transcribe_audio.TRANSCRIPT_DIR)
+
+
+def run_load_full_text(args: argparse.Namespace, outputs: Dict[str, Any]) -> Any:
+    """Loads the full text transcripts into Postgres."""
+    import insert_data_into_postgres_full_text
+
+    data = utils.read_data(insert_data_into_postgres_full_text.data_file_path)
+    insert_data_into_postgres_full_text.write_to_postgres(
+        utils.get_postgres_dsn(), data
+    )
+
+
+def run_load_segmented_text(args: argparse.Namespace, outputs: Dict[str, Any]) -> Any:
+    """Loads the segmented transcripts into Postgres."""
+    import insert_data_into_postgres_segmented_text
+
+    data = utils.read_data(insert_data_into_postgres_segmented_text.data_file_path)
+    insert_data_into_postgres_segmented_text.write_to_postgres(
+        utils.get_postgres_dsn(), data
+    )
+
+
+# Each stage's function, the stages it depends on and the stage outputs it
+# reads from `data` when its dependencies didn't run, in the order they're
+# listed in the usage above
+STAGES: Dict[str, Dict[str, Any]] = {
+    "extract": {"func": run_extract, "depends_on": [], "reads": []},
+    "load_show": {
+        "func": run_load_show,
+        "depends_on": ["extract"],
+        "reads": ["show_metadata"],
+    },
+    "load_episode": {
+        "func": run_load_episode,
+        "depends_on": ["extract"],
+        "reads": ["episode_metadata"],
+    },
+    "download": {
+        "func": run_download,
+        "depends_on": ["extract"],
+        "reads": ["episode_metadata"],
+    },
+    "transcribe": {"func": run_transcribe, "depends_on": ["download"], "reads": []},
+    "load_full_text": {
+        "func": run_load_full_text,
+        "depends_on": ["transcribe"],
+        "reads": ["full_text_transcriptions"],
+    },
+    "load_segmented_text": {
+        "func": run_load_segmented_text,
+        "depends_on": ["transcribe"],
+        "reads": ["segmented_text_transcriptions"],
+    },
+}
+
+
+def parse_arguments() -> argparse.Namespace:
+    """Parses command-line arguments for the pipeline.
+
+    Returns
+    -------
+    argparse.Namespace
+        An object containing the CSV file path, the filtering year or dates
+        and the stages to run.
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--path", help="The path to the CSV file with RSS feed URLs.")
+    parser.add_argument(
+        "--year", type=int, help="The episode publication year to filter by."
+    )
+    parser.add_argument(
+        "--start-date",
+        type=date.fromisoformat,
+        help="The earliest episode publication date to keep (YYYY-MM-DD).",
+    )
+    parser.add_argument(
+        "--end-date",
+        type=date.fromisoformat,
+        help="The latest episode publication date to keep (YYYY-MM-DD).",
+    )
+
+    selection = parser.add_mutually_exclusive_group()
+    selection.add_argument(
+        "--only", nargs="+", choices=STAGES, help="Run only these stages."
+    )
+    selection.add_argument(
+        "--from",
+        dest="from_stage",
+        choices=STAGES,
+        help="Run this stage and every stage that depends on it.",
+    )
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="Print the stages that would run and the files they'd read.",
+    )
+
+    return parser.parse_args()
+
+
+def get_descendants(stage: str) -> Set[str]:
+    """Finds a stage and every stage that depends on it, directly or not.
+
+    Parameters
+    ----------
+    stage : str
+        The stage to start from.
+
+    Returns
+    -------
+    selected : set of str
+        The stage and its descendants.
+    """
+    selected = {stage}
+    changed = True
+    while changed:
+        changed = False
+        for name, spec in STAGES.items():
+            if name not in selected and selected.intersection(spec["depends_on"]):
+                selected.add(name)
+                changed = True
+
+    return selected
+
+
+def select_stages(args: argparse.Namespace) -> Set[str]:
+    """Picks the stages to run from the `--only` and `--from` arguments.
+
+    Parameters
+    ----------
+    args : argparse.Namespace
+        The parsed command-line arguments.
+
+    Returns
+    -------
+    set of str
+        The names of the stages to run.
+    """
+    if args.only:
+        return set(args.only)
+    if args.from_stage:
+        return get_descendants(args.from_stage)
+
+    return set(STAGES)
+
+
+def describe_plan(selected: Set[str]) -> List[str]:
+    """Describes when each selected stage would start and what it would read.
+
+    Parameters
+    ----------
+    selected : set of str
+        The names of the stages to run.
+
+    Returns
+    -------
+    list of str
+        A line for each stage, in `STAGES` order.
+    """
+    lines = []
+    for name, spec in STAGES.items():
+        if name not in selected:
+            continue
+
+        waits_for = [d for d in spec["depends_on"] if d in selected]
+        line = f"{name}: after {', '.join(waits_for)}" if waits_for else f"{name}: now"
+        if not waits_for:
+            for stage in spec["reads"]:
+                path = utils.get_stage_path(stage)
+                found = "found" if os.path.exists(path) else "missing"
+                line += f", reads {path} ({found})"
+        lines.append(line)
+
+    return lines
+
+
+def run_pipeline(
+    args: argparse.Namespace,
+    selected: Set[str],
+    stages: Dict[str, Dict[str, Any]] = STAGES,
+) -> Tuple[Dict[str, Any], Set[str]]:
+    """Runs the selected stages, each one as soon as its dependencies finish.
+
+    Dependencies that aren't selected are treated as already done. If a stage
+    fails, the stages that depend on it are skipped.
+
+    Parameters
+    ----------
+    args : argparse.Namespace
+        The parsed command-line arguments, passed to each stage.
+    selected : set of str
+        The names of the stages to run.
+    stages : dict, optional
+        The stage definitions. Defaults to `STAGES`.
+
+    Returns
+    -------
+    outputs : dict
+        The value returned by each stage that succeeded.
+    failed : set of str
+        The names of the stages that failed or were skipped.
+    """
+    outputs: Dict[str, Any] = {}
+    done: Set[str] = set()
+    failed: Set[str] = set()
+    pending = [name for name in stages if name in selected]
+    running: Dict[Future, str] = {}
+
+    def call_stage(name: str, func: Callable) -> Any:
+        metrics.log_event("stage_started", stage=name)
+        with metrics.timer(f"stage_{name}"):
+            return func(args, outputs)
+
+    with ThreadPoolExecutor(max_workers=len(stages)) as executor:
+        while pending or running:
+            # Start every pending stage whose selected dependencies are done
+            for name in list(pending):
+                depends_on = [d for d in stages[name]["depends_on"] if d in selected]
+                if failed.intersection(depends_on):
+                    pending.remove(name)
+                    failed.add(name)
+                    metrics.log_event(
+                        "stage_skipped", level=logging.WARNING, stage=name
+                    )
+                elif done.issuperset(depends_on):
+                    pending.remove(name)
+                    future = executor.submit(call_stage, name, stages[name]["func"])
+                    running[future] = name
+
+            if not running:
+                continue
+
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                name = running.pop(future)
+                try:
+                    outputs[name] = future.result()
+                    done.add(name)
+                    metrics.log_event("stage_finished", stage=name)
+                except Exception as e:
+                    failed.add(name)
+                    metrics.log_event(
+                        "stage_failed", level=logging.ERROR, stage=name, error=str(e)
+                    )
+
+    return outputs, failed
+
+
+def main():
+    args = parse_arguments()
+    metrics.configure("pipeline")
+
+    selected = select_stages(args)
+    if args.dry_run:
+        print("\n".join(describe_plan(selected)))
+        return
+
+    print(f"\nRunning stages: {', '.join(s for s in STAGES if s in selected)}")
+    _, failed = run_pipeline(args, selected)
+
+    if failed:
+        print(f"\nPipeline failed: {', '.join(s for s in STAGES if s in failed)}")
+    else:
+        print("\nPipeline complete!")
+    metrics.report()
+
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
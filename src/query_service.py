@@ -0,0 +1,422 @@
+"""
+query_service.py
+================
+
+This script runs the mention search from `query.sql`, with the keywords and
+the date window as parameters, and caches the results.
+
+Analysts run the same few searches many times a day against tables that
+rarely change, so each search's results are kept in a local LRU cache for up
+to `CACHE_TTL_SECONDS`. Searches share a small connection pool, which reads
+from the replica in `DB_READ_HOST` if one is set.
+
+The loaders notify `utils.CHANGES_CHANNEL` with the ids of the episodes they
+change, when their transaction commits. A background connection to the
+primary listens on it and drops the cached searches a change could affect:
+the ones whose results include the episode, and the ones whose date window
+covers its publication date. A replica can still be a moment behind, so a
+search repeated right after a load may cache slightly old results, but never
+for longer than the TTL.
+
+Usage
+-----
+
+To search for mentions, run:
+    python3 src/query_service.py --keywords Trump Biden --date 2024-11-05
+
+"""
+
+import argparse
+import logging
+import threading
+import time
+from collections import OrderedDict
+from datetime import date, datetime, timedelta, timezone
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    Dict,
+    Hashable,
+    Iterable,
+    List,
+    Optional,
+    Tuple,
+)
+
+import metrics as metrics
+import utils as utils
+from keywords import DEFAULT_KEYWORDS, get_keyword_pattern
+
+if TYPE_CHECKING:
+    import psycopg
+
+# The maximum number of connections searches share
+POOL_SIZE = 4
+# The number of searches whose results are cached
+CACHE_SIZE = 256
+# How long a search's results are cached for, even if nothing changes
+CACHE_TTL_SECONDS = 15 * 60
+# The date and window the searches in `query.sql` default to
+DEFAULT_DATE = date(2024, 11, 5)
+DEFAULT_WINDOW_DAYS = 14
+# How often the listener checks whether the service is closing
+LISTEN_TIMEOUT_SECONDS = 1.0
+# How long to wait before reconnecting a listener that lost its connection
+RECONNECT_SECONDS = 5.0
+
+# The episodes published in a window with a segment matching the pattern
+mention_query = """
+SELECT DISTINCT e.id, e.title AS episode_title, p.title AS podcast_title
+FROM csmap.information.episode e
+JOIN csmap.information.show p
+    ON e.title_detail->>'base' = p.title_detail->>'base'
+JOIN csmap.transcript.segmented s
+    ON e.id = s.id
+WHERE e.published BETWEEN %(start)s AND %(end)s
+  AND s.text ~* %(pattern)s
+ORDER BY e.id;
+"""
+
+# The publication times of changed episodes, to find the windows they're in
+published_query = """
+SELECT published FROM csmap.information.episode
+WHERE id = ANY(%(ids)s) AND published IS NOT NULL;
+"""
+
+
+class ResultCache:
+    """A thread-safe LRU cache whose entries also expire after a time to live.
+
+    Parameters
+    ----------
+    max_size : int, optional
+        The number of entries kept. The least recently used are evicted first.
+    ttl : float, optional
+        The seconds an entry is kept for.
+    """
+
+    def __init__(self, max_size: int = CACHE_SIZE, ttl: float = CACHE_TTL_SECONDS):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self.lock = threading.Lock()
+        # Bumped by every invalidation, so a result read before one isn't
+        # cached after it
+        self.generation = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Returns a key's cached value, or None if it's missing or expired."""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+
+            return entry[1]
+
+    def put(self, key: Hashable, value: Any, generation: int) -> bool:
+        """Caches a value, unless the cache was invalidated since it was read.
+
+        Parameters
+        ----------
+        key : hashable
+            The key to cache the value under.
+        value : any
+            The value.
+        generation : int
+            The cache's `generation` from before the value was read.
+
+        Returns
+        -------
+        bool
+            Whether the value was cached.
+        """
+        with self.lock:
+            if generation != self.generation:
+                return False
+            self.entries[key] = (time.monotonic() + self.ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+            return True
+
+    def invalidate(
+        self, predicate: Optional[Callable[[Hashable, Any], bool]] = None
+    ) -> int:
+        """Drops the cached entries a predicate picks, or all of them.
+
+        Parameters
+        ----------
+        predicate : callable, optional
+            Takes a key and its value, and returns whether to drop them.
+
+        Returns
+        -------
+        int
+            The number of entries dropped.
+        """
+        with self.lock:
+            self.generation += 1
+            stale = [
+                key
+                for key, (_, value) in self.entries.items()
+                if predicate is None or predicate(key, value)
+            ]
+            for key in stale:
+                del self.entries[key]
+
+            return len(stale)
+
+
+def get_window(on: date, window_days: int) -> Tuple[datetime, datetime]:
+    """Returns the UTC times `window_days` days either side of a date."""
+    center = datetime(on.year, on.month, on.day, tzinfo=timezone.utc)
+    window = timedelta(days=window_days)
+
+    return center - window, center + window
+
+
+def is_affected(
+    key: Tuple[Tuple[str, ...], datetime, datetime],
+    results: List[Dict[str, Any]],
+    ids: Iterable[str],
+    published_times: Iterable[datetime],
+) -> bool:
+    """Checks whether changed episodes can affect a cached search.
+
+    Parameters
+    ----------
+    key : tuple
+        The search's cache key: its keywords and the window's start and end.
+    results : list of dict
+        The search's cached results.
+    ids : iterable of str
+        The ids of the changed episodes.
+    published_times : iterable of datetime
+        When the changed episodes were published.
+
+    Returns
+    -------
+    bool
+        True if a changed episode is in the results, or was published in the
+        window, where it may now match.
+    """
+    _, start, end = key
+    ids = set(ids)
+
+    return any(row["id"] in ids for row in results) or any(
+        start <= published <= end for published in published_times
+    )
+
+
+class MentionService:
+    """Runs cached mention searches over a pool of connections.
+
+    Parameters
+    ----------
+    dsn : str, optional
+        The connection string searches run on. Defaults to the read replica,
+        if there is one.
+    listen_dsn : str, optional
+        The connection string of the primary, which the loaders' change
+        notifications come from. Defaults to `dsn` if that's given, or the
+        primary in the .env file otherwise.
+    pool_size : int, optional
+        The maximum number of connections searches share.
+    cache : ResultCache, optional
+        Where results are cached.
+    """
+
+    def __init__(
+        self,
+        dsn: Optional[str] = None,
+        listen_dsn: Optional[str] = None,
+        pool_size: int = POOL_SIZE,
+        cache: Optional[ResultCache] = None,
+    ):
+        from psycopg.rows import dict_row
+        from psycopg_pool import ConnectionPool
+
+        self.listen_dsn = listen_dsn or dsn or utils.get_postgres_dsn()
+        self.pool = ConnectionPool(
+            dsn or utils.get_postgres_dsn(replica=True),
+            min_size=1,
+            max_size=pool_size,
+            kwargs={"row_factory": dict_row},
+            open=True,
+        )
+        self.cache = cache or ResultCache()
+        self.closing = threading.Event()
+        # Set once the listener is connected, so changes are being tracked
+        self.listening = threading.Event()
+        self.listener = threading.Thread(target=self._listen, daemon=True)
+        self.listener.start()
+
+    def find_mentions(
+        self,
+        keywords: Iterable[str] = DEFAULT_KEYWORDS,
+        on: date = DEFAULT_DATE,
+        window_days: int = DEFAULT_WINDOW_DAYS,
+    ) -> List[Dict[str, Any]]:
+        """Finds the episodes near a date that mention any of some keywords.
+
+        Parameters
+        ----------
+        keywords : iterable of str, optional
+            The keywords to look for, as whole words ignoring case.
+        on : date, optional
+            The middle of the date window.
+        window_days : int, optional
+            The days either side of `on` to search episodes published in.
+
+        Returns
+        -------
+        list of dict
+            The `id`, `episode_title` and `podcast_title` of each matching
+            episode, ordered by id.
+        """
+        start, end = get_window(on, window_days)
+        key = (tuple(sorted({keyword.lower() for keyword in keywords})), start, end)
+
+        results = self.cache.get(key)
+        if results is not None:
+            metrics.increment("query_cache_hits")
+        else:
+            metrics.increment("query_cache_misses")
+            generation = self.cache.generation
+            with metrics.timer("db_query"), self.pool.connection() as conn:
+                results = conn.execute(
+                    mention_query,
+                    {
+                        "start": start,
+                        "end": end,
+                        "pattern": get_keyword_pattern(key[0]),
+                    },
+                ).fetchall()
+            # Without the listener, changes could go unnoticed until the TTL
+            if self.listening.is_set():
+                self.cache.put(key, results, generation)
+
+        # Copy the rows so callers can't modify the cached ones
+        return [dict(row) for row in results]
+
+    def invalidate_episodes(self, conn: "psycopg.Connection", ids: Iterable[str]):
+        """Drops the cached searches that changes to some episodes can affect.
+
+        Parameters
+        ----------
+        conn : psycopg.Connection
+            A connection to the primary, to look the episodes up on.
+        ids : iterable of str
+            The changed episodes' ids, or `utils.ALL_EPISODES`.
+        """
+        ids = set(ids)
+        if utils.ALL_EPISODES in ids:
+            dropped = self.cache.invalidate()
+        else:
+            published_times = [
+                published
+                for (published,) in conn.execute(
+                    published_query, {"ids": list(ids)}
+                ).fetchall()
+            ]
+            dropped = self.cache.invalidate(
+                lambda key, results: is_affected(key, results, ids, published_times)
+            )
+        metrics.increment("query_cache_invalidations", dropped)
+
+    def _listen(self):
+        """Drops cached searches as the loaders report changes, until closed."""
+        import psycopg
+
+        while not self.closing.is_set():
+            try:
+                with psycopg.connect(self.listen_dsn, autocommit=True) as conn:
+                    conn.execute(f"LISTEN {utils.CHANGES_CHANNEL}")
+                    # Changes made while nothing was listening went unseen
+                    self.cache.invalidate()
+                    self.listening.set()
+
+                    while not self.closing.is_set():
+                        ids = {
+                            notify.payload
+                            for notify in conn.notifies(
+                                timeout=LISTEN_TIMEOUT_SECONDS, stop_after=1
+                            )
+                        }
+                        if ids:
+                            # A transaction's notifications arrive together
+                            ids.update(
+                                notify.payload for notify in conn.notifies(timeout=0)
+                            )
+                            self.invalidate_episodes(conn, ids)
+
+            except psycopg.Error as e:
+                self.listening.clear()
+                metrics.log_event("listen_failed", level=logging.ERROR, error=str(e))
+                self.closing.wait(RECONNECT_SECONDS)
+
+        self.listening.clear()
+
+    def close(self):
+        """Stops the listener and closes the pool's connections."""
+        self.closing.set()
+        self.listener.join()
+        self.pool.close()
+
+    def __enter__(self) -> "MentionService":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def parse_arguments() -> argparse.Namespace:
+    """Parses command-line arguments for a search.
+
+    Returns
+    -------
+    argparse.Namespace
+        An object containing the keywords, date and window.
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--keywords",
+        nargs="+",
+        default=DEFAULT_KEYWORDS,
+        help="The keywords to search transcripts for.",
+    )
+    parser.add_argument(
+        "--date",
+        type=date.fromisoformat,
+        default=DEFAULT_DATE,
+        help="The middle of the date window, as YYYY-MM-DD.",
+    )
+    parser.add_argument(
+        "--window-days",
+        type=int,
+        default=DEFAULT_WINDOW_DAYS,
+        help="The days either side of the date to search.",
+    )
+
+    return parser.parse_args()
+
+
+def main():
+    args = parse_arguments()
+    metrics.configure("query_service")
+
+    with MentionService() as service:
+        for row in service.find_mentions(args.keywords, args.date, args.window_days):
+            print(f"{row['podcast_title']}\t{row['episode_title']}")
+
+    metrics.report()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""
+row_encoder.py
+==============
+
+This script builds the functions the loaders use to turn a record into the
+parameters of their INSERT query.
+
+For each table, `compile_row_encoder` generates and compiles one function
+with a line per column, so a record is read once and turned straight into the
+parameter tuple: missing keys become None, nested values are encoded to JSON
+with the fastest configured backend, and the row hash is taken over the
+encoded values. The JSON is handed to psycopg already encoded, wrapped in
+`Jsonb` so it's sent in the binary JSONB format without being encoded again.
+
+"""
+
+import hashlib
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+import utils as utils
+
+
+def _passthrough(raw: bytes) -> bytes:
+    """Returns JSON that's already encoded, for psycopg's `Jsonb` dumper."""
+    return raw
+
+
+def _as_tuple(expressions: List[str]) -> str:
+    """Writes the source of a tuple of expressions, even one or none."""
+    return "(" + "".join(f"{expression}, " for expression in expressions) + ")"
+
+
+def compile_row_encoder(
+    columns: List[str],
+    json_columns: Iterable[str] = (),
+    with_hash: bool = True,
+    backend: Optional[str] = None,
+) -> Callable[[Dict[str, Any]], Tuple[Any, ...]]:
+    """Compiles a function that turns a record into a row's parameters.
+
+    Parameters
+    ----------
+    columns : list of str
+        The record keys to write, in the order of the query's placeholders.
+    json_columns : iterable of str, optional
+        The columns whose values are written as JSONB.
+    with_hash : bool, optional
+        Whether to add a hash of the row's values after the columns, for the
+        `row_hash` column.
+    backend : str, optional
+        The JSON library to encode with. Defaults to `utils.JSON_BACKEND`.
+
+    Returns
+    -------
+    callable
+        Takes a record and returns the tuple of its row's parameters. The
+        record isn't modified.
+    """
+    from psycopg.types.json import Jsonb
+
+    json_columns = set(json_columns)
+    names = [f"v{index}" for index in range(len(columns))]
+
+    lines = ["def encode_row(row):", "    get = row.get"]
+    for name, column in zip(names, columns):
+        lines.append(f"    {name} = get({column!r})")
+        if column in json_columns:
+            lines.append(f"    if {name} is not None:")
+            lines.append(f"        {name} = dumps({name})")
+
+    values = [
+        (
+            f"None if {name} is None else Jsonb({name}, passthrough)"
+            if column in json_columns
+            else name
+        )
+        for name, column in zip(names, columns)
+    ]
+    if with_hash:
+        # The plain values are strs, numbers, bools and Nones, whose reprs are
+        # stable from run to run. The JSON is hashed as encoded, with None as
+        # an empty string since no JSON encodes to that
+        plain = [
+            name for name, column in zip(names, columns) if column not in json_columns
+        ]
+        encoded = [
+            f"{name} or b''"
+            for name, column in zip(names, columns)
+            if column in json_columns
+        ]
+        lines.append(f"    key = repr({_as_tuple(plain)}).encode()")
+        lines.append(f"    key += b'\\0'.join({_as_tuple(encoded)})")
+        values.append("blake2b(key, digest_size=16).hexdigest()")
+    lines.append(f"    return {_as_tuple(values)}")
+
+    namespace = {
+        "dumps": utils.get_json_encoder(backend),
+        "Jsonb": Jsonb,
+        "passthrough": _passthrough,
+        "blake2b": hashlib.blake2b,
+    }
+    exec(compile("\n".join(lines), f"<row encoder {columns[0]}>", "exec"), namespace)
+
+    return namespace["encode_row"]
+
+
+def get_placeholders(columns: List[str]) -> str:
+    """Returns the positional placeholders for a row's parameters.
+
+    Parameters
+    ----------
+    columns : list of str
+        The columns being written.
+
+    Returns
+    -------
+    str
+        A comma-separated `%s` for each column.
+    """
+    return ", ".join(["%s"] * len(columns))
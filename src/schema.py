@@ -0,0 +1,162 @@
+"""
+schema.py
+=========
+
+This script declares which show and episode fields the pipeline keeps, and
+projects feedparser's output down to them at extraction time.
+
+feedparser returns every element it finds in a feed, along with parsed
+`struct_time` copies of each date and `*_detail` objects that repeat the
+plain fields' text. Only the fields declared here are kept, with their types
+normalized, so every later stage reads, writes and loads less. The loaders
+take their columns from the same declarations.
+
+Each field has a kind:
+
+* "value": kept as it is.
+* "json": a nested value, loaded into a JSONB column.
+* "detail": a feedparser text construct (e.g. `title_detail`), loaded into a
+  JSONB column without its `value`, which is the same as the plain field.
+* "timestamp": an ISO 8601 time in UTC, from feedparser's parsed copy of the
+  date. Dates it couldn't parse are kept as written.
+* "duration": the episode's length in seconds, from `itunes_duration`.
+* "internal": kept for the pipeline's own use, but not loaded.
+
+"""
+
+from datetime import datetime, timezone
+from typing import Any, Dict, List
+
+import utils as utils
+
+# The fields kept for each show, in column order
+SHOW_FIELDS = {
+    "title": "value",
+    "title_detail": "detail",
+    "links": "json",
+    "link": "value",
+    "subtitle": "value",
+    "subtitle_detail": "detail",
+    "rights": "value",
+    "rights_detail": "detail",
+    "generator": "value",
+    "generator_detail": "json",
+    "language": "value",
+    "authors": "json",
+    "author": "value",
+    "author_detail": "json",
+    "itunes_block": "value",
+    "publisher_detail": "json",
+    "tags": "json",
+    "media_thumbnail": "json",
+    "href": "value",
+    "image": "json",
+    "itunes_type": "value",
+    "updated": "timestamp",
+    "media_restriction": "json",
+    "restriction": "value",
+    # The ingest daemon's polling interval respects the feed's <ttl>
+    "ttl": "internal",
+}
+
+# The fields kept for each episode, in column order
+EPISODE_FIELDS = {
+    "id": "value",
+    "title": "value",
+    "title_detail": "detail",
+    "links": "json",
+    "link": "value",
+    "summary": "value",
+    "summary_detail": "detail",
+    "published": "timestamp",
+    "itunes_episodetype": "value",
+    "itunes_episode": "value",
+    "authors": "json",
+    "author": "value",
+    "author_detail": "json",
+    "image": "json",
+    "subtitle": "value",
+    "subtitle_detail": "detail",
+    "content": "json",
+    "itunes_duration": "value",
+    "duration_seconds": "duration",
+    "guidislink": "value",
+    "ppg_enclosurelegacy": "json",
+    "ppg_enclosuresecure": "json",
+    "ppg_canonical": "value",
+    "media_content": "json",
+}
+
+# The kinds loaded into JSONB columns
+JSON_KINDS = {"json", "detail"}
+
+
+def get_columns(fields: Dict[str, str]) -> List[str]:
+    """Lists the fields that are loaded into Postgres, in column order.
+
+    Parameters
+    ----------
+    fields : dict
+        `SHOW_FIELDS` or `EPISODE_FIELDS`.
+
+    Returns
+    -------
+    list of str
+        The names of the loaded fields.
+    """
+    return [name for name, kind in fields.items() if kind != "internal"]
+
+
+def get_json_columns(fields: Dict[str, str]) -> List[str]:
+    """Lists the fields that are loaded into JSONB columns.
+
+    Parameters
+    ----------
+    fields : dict
+        `SHOW_FIELDS` or `EPISODE_FIELDS`.
+
+    Returns
+    -------
+    list of str
+        The names of the JSONB fields.
+    """
+    return [name for name, kind in fields.items() if kind in JSON_KINDS]
+
+
+def project(record: Dict[str, Any], fields: Dict[str, str]) -> Dict[str, Any]:
+    """Keeps only the declared fields of a feedparser record, normalized.
+
+    Parameters
+    ----------
+    record : dict
+        A show's `feed.feed` or an episode's entry, as parsed by feedparser.
+    fields : dict
+        `SHOW_FIELDS` or `EPISODE_FIELDS`.
+
+    Returns
+    -------
+    dict
+        A plain dictionary with the declared fields the record has.
+    """
+    projected = {}
+    for name, kind in fields.items():
+        if kind == "duration":
+            value = utils.get_duration_seconds(record)
+        elif kind == "timestamp":
+            parsed = record.get(f"{name}_parsed")
+            value = (
+                datetime(*parsed[:6], tzinfo=timezone.utc).isoformat()
+                if parsed
+                else record.get(name)
+            )
+        elif kind == "detail" and record.get(name) is not None:
+            value = {key: v for key, v in record[name].items() if key != "value"}
+        elif name in record:
+            value = record[name]
+        else:
+            continue
+
+        if value is not None:
+            projected[name] = value
+
+    return projected
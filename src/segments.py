@@ -0,0 +1,215 @@
+"""
+segments.py
+===========
+
+This script contains `SegmentList`, a memory-compact container for timestamped
+transcript segments.
+
+WhisperX returns each segment as a dictionary of a float start time, a float
+end time and a text string. For long transcripts, the per-object overhead of
+those dictionaries dominates memory and pickling cost. `SegmentList` stores the
+same data as two `array("d")` time arrays plus a single text string with
+offsets into it, so a transcript is a handful of objects no matter how many
+segments it has.
+
+"""
+
+from array import array
+from bisect import bisect_left, bisect_right
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Union
+
+
+class SegmentList:
+    """A sequence of transcript segments stored in parallel arrays.
+
+    Segments are expected in time order, as WhisperX returns them. Only the
+    `start`, `end` and `text` of each segment are kept.
+
+    Parameters
+    ----------
+    starts : iterable of float, optional
+        The start time of each segment in seconds.
+    ends : iterable of float, optional
+        The end time of each segment in seconds.
+    texts : iterable of str, optional
+        The text of each segment.
+    """
+
+    __slots__ = ("starts", "ends", "text", "offsets")
+
+    def __init__(
+        self,
+        starts: Iterable[float] = (),
+        ends: Iterable[float] = (),
+        texts: Iterable[str] = (),
+    ):
+        self.starts = array("d", starts)
+        self.ends = array("d", ends)
+
+        # Concatenate the texts into one string and record where each one
+        # begins, with a final offset marking the end of the last segment
+        texts = list(texts)
+        self.text = "".join(texts)
+        self.offsets = array("q", [0])
+        position = 0
+        for segment_text in texts:
+            position += len(segment_text)
+            self.offsets.append(position)
+
+        if not len(self.starts) == len(self.ends) == len(texts):
+            raise ValueError("starts, ends and texts must be the same length.")
+
+    @classmethod
+    def from_dicts(cls, segments: Iterable[Dict[str, Any]]) -> "SegmentList":
+        """Builds a `SegmentList` from WhisperX-style segment dictionaries.
+
+        Parameters
+        ----------
+        segments : iterable of dict
+            Dictionaries with `start`, `end` and `text` keys.
+
+        Returns
+        -------
+        SegmentList
+            The same segments in compact form.
+        """
+        segments = list(segments)
+
+        return cls(
+            (segment["start"] for segment in segments),
+            (segment["end"] for segment in segments),
+            (segment["text"] for segment in segments),
+        )
+
+    def to_list(self) -> List[Dict[str, Any]]:
+        """Converts the segments back to a list of dictionaries.
+
+        Returns
+        -------
+        list of dict
+            Dictionaries with `start`, `end` and `text` keys.
+        """
+        return list(self)
+
+    def get_text(self, index: int) -> str:
+        """Returns the text of a single segment.
+
+        Parameters
+        ----------
+        index : int
+            The position of the segment.
+
+        Returns
+        -------
+        str
+            The segment's text.
+        """
+        return self.text[self.offsets[index] : self.offsets[index + 1]]
+
+    def between(self, start: float, end: float) -> "SegmentList":
+        """Returns the segments that overlap a time range.
+
+        Parameters
+        ----------
+        start : float
+            The start of the range in seconds.
+        end : float
+            The end of the range in seconds.
+
+        Returns
+        -------
+        SegmentList
+            The segments that end after `start` and begin before `end`.
+        """
+        first = bisect_right(self.ends, start)
+        last = bisect_left(self.starts, end)
+
+        return self[first : max(first, last)]
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        for index in range(len(self)):
+            yield {
+                "start": self.starts[index],
+                "end": self.ends[index],
+                "text": self.get_text(index),
+            }
+
+    def __getitem__(
+        self, index: Union[int, slice]
+    ) -> Union[Dict[str, Any], "SegmentList"]:
+        if isinstance(index, slice):
+            first, last, step = index.indices(len(self))
+            if step != 1:
+                raise ValueError("SegmentList slices must be contiguous.")
+            last = max(first, last)
+
+            # Copy the arrays directly rather than rebuilding from texts
+            sliced = SegmentList()
+            sliced.starts = self.starts[first:last]
+            sliced.ends = self.ends[first:last]
+            sliced.text = self.text[self.offsets[first] : self.offsets[last]]
+            sliced.offsets = array(
+                "q",
+                (
+                    offset - self.offsets[first]
+                    for offset in self.offsets[first : last + 1]
+                ),
+            )
+            return sliced
+
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("SegmentList index out of range.")
+
+        return {
+            "start": self.starts[index],
+            "end": self.ends[index],
+            "text": self.get_text(index),
+        }
+
+    def __eq__(self, other: object) -> bool:
+        if isinstance(other, SegmentList):
+            return (
+                self.starts == other.starts
+                and self.ends == other.ends
+                and self.text == other.text
+                and self.offsets == other.offsets
+            )
+        if isinstance(other, list):
+            return self.to_list() == other
+        return NotImplemented
+
+    def __repr__(self) -> str:
+        return f"SegmentList({len(self)} segments)"
+
+    def __getstate__(self) -> Dict[str, Any]:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def __setstate__(self, state: Dict[str, Any]):
+        for name, value in state.items():
+            setattr(self, name, value)
+
+
+def as_segment_list(
+    segments: Optional[Union[SegmentList, Iterable[Dict[str, Any]]]],
+) -> SegmentList:
+    """Converts segment dictionaries to a `SegmentList` if they aren't one.
+
+    Parameters
+    ----------
+    segments : SegmentList or iterable of dict or None
+        The segments to convert.
+
+    Returns
+    -------
+    SegmentList
+        The segments in compact form.
+    """
+    if isinstance(segments, SegmentList):
+        return segments
+
+    return SegmentList.from_dicts(segments or [])
@@ -0,0 +1,194 @@
+"""
+speech_regions.py
+=================
+
+This script finds the stretches of an episode's audio that aren't speech, so
+they can be cut out before the audio is transcribed.
+
+Podcasts often open and close with long silences, and pause between segments
+and ads. The audio is split into short frames, and runs of quiet frames at
+least `MIN_SILENCE_SECONDS` long are dropped. What's left is joined together
+and transcribed, and an `OffsetMap` moves the timestamps of the transcribed
+segments back to where they were in the original audio.
+
+Only silence is detected here, since it can be found from the energy of the
+audio alone. Music beds are left to the voice activity detection WhisperX
+runs on the shortened audio.
+
+"""
+
+from bisect import bisect_left, bisect_right
+from typing import Any, List, Tuple
+
+from segments import SegmentList
+
+# Length of the frames whose energy is measured, in seconds
+FRAME_SECONDS = 0.03
+# Frames this far below the loud parts of the episode count as silence, in dB
+DYNAMIC_RANGE_DB = 35.0
+# Frames quieter than this always count as silence, in dBFS
+SILENCE_FLOOR_DB = -60.0
+# How loud "the loud parts" are, as a percentile of the frames' energy
+LOUD_PERCENTILE = 95
+# Shorter pauses are kept, since they fall between words and sentences
+MIN_SILENCE_SECONDS = 1.0
+# Audio kept on each side of the speech next to a dropped silence, in seconds
+PADDING_SECONDS = 0.2
+
+
+class OffsetMap:
+    """Maps times in shortened audio back to times in the original audio.
+
+    Parameters
+    ----------
+    regions : list of tuple
+        The start and end, in seconds of the original audio, of each region
+        that was kept, in order.
+    """
+
+    __slots__ = ("kept_starts", "original_starts")
+
+    def __init__(self, regions: List[Tuple[float, float]]):
+        self.kept_starts: List[float] = []
+        self.original_starts: List[float] = []
+
+        position = 0.0
+        for start, end in regions:
+            self.kept_starts.append(position)
+            self.original_starts.append(start)
+            position += end - start
+
+    def to_original(self, time: float, is_end: bool = False) -> float:
+        """Converts a time in the shortened audio to the original audio.
+
+        Parameters
+        ----------
+        time : float
+            A time in the shortened audio, in seconds.
+        is_end : bool, optional
+            Whether the time ends a segment. A time that falls exactly where
+            two regions were joined is placed at the end of the earlier one
+            rather than the start of the later one.
+
+        Returns
+        -------
+        float
+            The same moment in the original audio, in seconds.
+        """
+        if not self.kept_starts:
+            return time
+
+        search = bisect_left if is_end else bisect_right
+        index = max(0, search(self.kept_starts, time) - 1)
+
+        return self.original_starts[index] + time - self.kept_starts[index]
+
+    def restore(self, segments: SegmentList) -> SegmentList:
+        """Moves transcribed segments back to their times in the original audio.
+
+        Parameters
+        ----------
+        segments : SegmentList
+            Segments transcribed from the shortened audio.
+
+        Returns
+        -------
+        SegmentList
+            The same segments with their times in the original audio.
+        """
+        return SegmentList(
+            (self.to_original(start) for start in segments.starts),
+            (self.to_original(end, is_end=True) for end in segments.ends),
+            (segments.get_text(i) for i in range(len(segments))),
+        )
+
+
+def find_speech_regions(audio: Any, sample_rate: int) -> List[Tuple[int, int]]:
+    """Finds the regions of the audio to keep.
+
+    Parameters
+    ----------
+    audio : numpy.ndarray
+        Mono audio samples between -1 and 1, as decoded by WhisperX.
+    sample_rate : int
+        The number of samples per second.
+
+    Returns
+    -------
+    list of tuple
+        The first sample and the sample after the last of each region to
+        keep, in order. Empty if the whole file is silent.
+    """
+    import numpy as np
+
+    frame_length = int(FRAME_SECONDS * sample_rate)
+    num_frames = len(audio) // frame_length
+    if num_frames == 0:
+        return [(0, len(audio))] if len(audio) else []
+
+    # Measure each frame's energy in dBFS, and compare it to the loud parts of
+    # the episode so quiet recordings aren't treated as silence
+    frames = np.asarray(audio[: num_frames * frame_length], dtype=np.float32)
+    energy = np.mean(frames.reshape(num_frames, frame_length) ** 2, axis=1)
+    energy_db = 10 * np.log10(energy + 1e-10)
+    threshold = max(
+        SILENCE_FLOOR_DB, np.percentile(energy_db, LOUD_PERCENTILE) - DYNAMIC_RANGE_DB
+    )
+    voiced = np.concatenate(([False], energy_db > threshold, [False]))
+
+    # Each voiced run starts where `voiced` rises and ends where it falls
+    edges = np.flatnonzero(np.diff(voiced.astype(np.int8)))
+    runs = edges.reshape(-1, 2)
+    if len(runs) == 0:
+        return []
+
+    # Join runs separated by pauses too short to drop
+    min_gap = MIN_SILENCE_SECONDS / FRAME_SECONDS
+    regions = [list(runs[0])]
+    for start, end in runs[1:]:
+        if start - regions[-1][1] < min_gap:
+            regions[-1][1] = end
+        else:
+            regions.append([start, end])
+
+    # Convert to samples, padding each region into the silence around it. The
+    # file's last partial frame stays with the final region
+    padding = int(PADDING_SECONDS * sample_rate)
+    sample_regions = []
+    for start, end in regions:
+        start = max(0, start * frame_length - padding)
+        end = min(len(audio), end * frame_length + padding)
+        if end == num_frames * frame_length:
+            end = len(audio)
+        sample_regions.append((int(start), int(end)))
+
+    return sample_regions
+
+
+def remove_non_speech(audio: Any, sample_rate: int) -> Tuple[Any, OffsetMap]:
+    """Cuts the long silences out of an episode's audio.
+
+    Parameters
+    ----------
+    audio : numpy.ndarray
+        Mono audio samples between -1 and 1, as decoded by WhisperX.
+    sample_rate : int
+        The number of samples per second.
+
+    Returns
+    -------
+    tuple of numpy.ndarray and OffsetMap
+        The shortened audio, and the map from its times back to the original
+        audio's.
+    """
+    import numpy as np
+
+    regions = find_speech_regions(audio, sample_rate)
+    offset_map = OffsetMap(
+        [(start / sample_rate, end / sample_rate) for start, end in regions]
+    )
+    if regions == [(0, len(audio))]:
+        return audio, offset_map
+
+    shortened = np.concatenate([audio[start:end] for start, end in regions] or [[]])
+    return shortened.astype(audio.dtype, copy=False), offset_map
@@ -0,0 +1,136 @@
+"""
+stage_profiler.py
+=================
+
+This script contains opt-in cProfile hooks for the transcription and loading
+hot paths.
+
+Code marks its stages with `stage_profiler.stage("<name>")`. When profiling is
+off (the default) this returns a shared no-op context manager, so the hooks
+cost nothing measurable. When a script is run with `--profile`, each stage gets
+its own profiler in every process, including process pool workers, and at the
+end of the run the per-process results are merged into one report per stage:
+
+* `data/profiles/<script>/<stage>.prof`, for `snakeviz` or `pstats`
+* `data/profiles/<script>/<stage>.txt`, the top functions by cumulative time
+
+"""
+
+import cProfile
+import glob
+import os
+import pstats
+from contextlib import nullcontext
+from typing import Dict, Optional
+
+# Set in the environment so worker processes inherit it, however they start
+PROFILE_DIR_ENV = "CSMAP_PROFILE_DIR"
+# Number of functions listed in each text report
+REPORT_LIMIT = 40
+
+_profile_dir: Optional[str] = os.getenv(PROFILE_DIR_ENV)
+_profilers: Dict[str, cProfile.Profile] = {}
+_disabled = nullcontext()
+
+
+class _StageProfile:
+    """Enables a stage's profiler for the duration of a `with` block."""
+
+    __slots__ = ("profiler",)
+
+    def __init__(self, name: str):
+        self.profiler = _profilers.get(name)
+        if self.profiler is None:
+            self.profiler = _profilers[name] = cProfile.Profile()
+
+    def __enter__(self):
+        self.profiler.enable()
+
+    def __exit__(self, *exc_info):
+        self.profiler.disable()
+
+
+def enable(profile_dir: str):
+    """Turns profiling on for this process and any workers it starts.
+
+    Parameters
+    ----------
+    profile_dir : str
+        The directory to write profiles and reports to.
+    """
+    global _profile_dir
+    os.makedirs(profile_dir, exist_ok=True)
+    os.environ[PROFILE_DIR_ENV] = profile_dir
+    _profile_dir = profile_dir
+
+
+def is_enabled() -> bool:
+    """Returns whether profiling is on in this process."""
+    return _profile_dir is not None
+
+
+def stage(name: str):
+    """Profiles the enclosed block as part of the stage `name`.
+
+    Stages shouldn't be nested, since only one profiler can run at a time.
+
+    Parameters
+    ----------
+    name : str
+        The stage's name, e.g. "inference".
+
+    Returns
+    -------
+    context manager
+        A no-op when profiling is off.
+    """
+    if _profile_dir is None:
+        return _disabled
+
+    return _StageProfile(name)
+
+
+def dump():
+    """Saves this process's stage profiles so far.
+
+    Worker processes call this after each task, since process pool workers
+    exit without running cleanup code.
+    """
+    if _profile_dir is None:
+        return
+
+    for name, profiler in _profilers.items():
+        profiler.dump_stats(os.path.join(_profile_dir, f"{name}.{os.getpid()}.prof"))
+
+
+def write_reports(profile_dir: Optional[str] = None):
+    """Merges every process's profiles into one report per stage.
+
+    Parameters
+    ----------
+    profile_dir : str, optional
+        The directory containing the per-process profiles. Defaults to the
+        directory passed to `enable`.
+    """
+    profile_dir = profile_dir or _profile_dir
+    if profile_dir is None:
+        return
+
+    dump()
+
+    # Group the per-process files, named <stage>.<pid>.prof, by stage
+    parts: Dict[str, list] = {}
+    for path in glob.glob(os.path.join(profile_dir, "*.*.prof")):
+        name = os.path.basename(path).rsplit(".", 2)[0]
+        parts.setdefault(name, []).append(path)
+
+    for name, paths in parts.items():
+        stats = pstats.Stats(*paths)
+        stats.dump_stats(os.path.join(profile_dir, f"{name}.prof"))
+
+        with open(os.path.join(profile_dir, f"{name}.txt"), "w") as f:
+            stats.stream = f
+            stats.sort_stats("cumulative").print_stats(REPORT_LIMIT)
+
+        for path in paths:
+            os.remove(path)
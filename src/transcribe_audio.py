@@ -9,113 +9,745 @@ podcast episode in one string, and `data/segmented_text_transcriptions.json`,
 whcih segments the entire text of the podcast episode into timestamped
 sections.
 
+Each worker saves its transcript straight to a per-episode file in
+`data/transcripts` and only sends the episode ID back to the parent process.
+The two JSONs are then streamed together from those files, with the full text
+derived from the segments.
+
 Usage
 -----
 
 To execute this script, run:
     python3 src/transcribe_audio.py
 
+To also write cProfile reports for each stage (merged across the worker
+processes) to `data/profiles`, run:
+    python3 src/transcribe_audio.py --profile
+
+To spread transcription across several machines that share the `data` and
+`episode_audio` directories, queue the untranscribed audio once, then start a
+worker on each machine. Workers claim episodes from the queue in
+`data/transcription_queue.sqlite` and exit when it's empty; episodes claimed by
+a worker that crashes are retried by the others. Afterwards, run the script
+once without flags to write the two JSONs.
+    python3 src/transcribe_audio.py --enqueue
+    python3 src/transcribe_audio.py --worker
+
+The model size, device, compute type, process count and threads per process
+default to the constants below. To find the fastest settings for a machine,
+time a short clip from one of the episodes with each combination of process
+count, threads and compute type, and save the best to
+`data/transcribe_config.json` under the machine's host name:
+    python3 src/transcribe_audio.py --calibrate
+
+Later runs on that machine use the saved settings, and any of them can be
+overridden for one run with `--model-size`, `--device`, `--compute-type`,
+`--num-workers` and `--cpu-threads`.
+
+To get a larger model's accuracy on the names the queries look for without
+paying for it on every episode, name a model to refine with. Everything is
+transcribed with the main model first, then each segment that mentions one of
+the keywords (or something that sounds like one), along with the segments on
+either side of it, is transcribed again with the larger model:
+    python3 src/transcribe_audio.py --refine-model-size small
+    python3 src/transcribe_audio.py --refine-model-size small \
+        --refine-keywords Trump Biden Harris
+
 """
 
+import argparse
+import logging
+import multiprocessing
 import os
-from concurrent.futures import ProcessPoolExecutor, as_completed
-from typing import Any, Dict, List, Set, Tuple
+import socket
+import sys
+import threading
+import time
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    Future,
+    ProcessPoolExecutor,
+    as_completed,
+    wait,
+)
+from functools import partial
+from multiprocessing.context import BaseContext
+from typing import Any, Callable, Dict, Iterator, List, Optional, Set, Tuple, Union
 
+import metrics as metrics
+import speech_regions as speech_regions
+import stage_profiler as stage_profiler
 import utils as utils
+import work_queue as work_queue
+from keywords import DEFAULT_KEYWORDS, KeywordMatcher
+from segments import SegmentList, as_segment_list
 
 # The path where the MP3s are
 AUDIO_DIR = "episode_audio"
+# The path where each episode's segmented transcript is saved by the workers
+TRANSCRIPT_DIR = os.path.join(utils.DATA_DIR, "transcripts")
+# Written to the transcript directory once older combined transcripts are copied in
+MIGRATED_MARKER = ".migrated"
 # Configuration variables for the transcription model
 MODEL_SIZE = "tiny"
 DEVICE = "cpu"
+COMPUTE_TYPE = "int8"
 # Process count for transcribing audio in parallel
 NUM_WORKERS = 4
+# Intra-op threads used by the model in each process
+CPU_THREADS = 4
+# The larger model that re-transcribes segments mentioning the keywords, or
+# None to keep the main model's transcripts as they are
+REFINE_MODEL_SIZE = None
+# The keywords whose segments are re-transcribed
+REFINE_KEYWORDS = DEFAULT_KEYWORDS
+# How many segments on each side of a keyword are re-transcribed with it, to
+# catch names split across segments and give the larger model some context
+REFINE_NEIGHBORS = 1
+# Where each machine's tuned settings are saved, keyed by host name
+CONFIG_PATH = os.path.join(utils.DATA_DIR, "transcribe_config.json")
+# The settings that can be tuned and the constants they override
+SETTINGS = {
+    "model_size": "MODEL_SIZE",
+    "device": "DEVICE",
+    "compute_type": "COMPUTE_TYPE",
+    "num_workers": "NUM_WORKERS",
+    "cpu_threads": "CPU_THREADS",
+    "refine_model_size": "REFINE_MODEL_SIZE",
+    "refine_keywords": "REFINE_KEYWORDS",
+}
+# Compute types tried by --calibrate on each device
+CALIBRATION_COMPUTE_TYPES = {
+    "cpu": ["int8", "float32"],
+    "cuda": ["float16", "int8_float16", "int8"],
+}
+# Length of the clip timed by --calibrate, in seconds
+CALIBRATION_SECONDS = 60
+# Sample rate of the audio decoded by WhisperX
+SAMPLE_RATE = 16000
+# Whether long silences are cut out of decoded audio before it's transcribed
+SKIP_SILENCE = True
+# How often a queue worker checks for episodes to retry, in seconds
+QUEUE_POLL_SECONDS = 5.0
+# Queue workers are spawned, as forking would copy the heartbeat thread's locks
+PROCESS_START_METHOD = "spawn"
 
 # Initializing global transcription model
 model = None
+# Initializing global audio decoder. When it isn't set, the model is given the
+# file path and decodes the audio itself
+decode_audio = None
+# Initializing the global refining model and the keywords that trigger it
+refine_model = None
+refine_matcher = None
 
 
-def init_worker():
-    """Initializes the transcription model in each process pool worker."""
-    global model
+def parse_arguments() -> argparse.Namespace:
+    """Parses command-line arguments for transcription.
+
+    Returns
+    -------
+    argparse.Namespace
+        An object containing whether to profile the run and how to use the
+        work queue.
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="Write cProfile reports for each stage to data/profiles.",
+    )
+
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument(
+        "--enqueue",
+        action="store_true",
+        help="Add the untranscribed audio to the work queue and exit.",
+    )
+    mode.add_argument(
+        "--worker",
+        action="store_true",
+        help="Transcribe episodes claimed from the work queue until it's empty.",
+    )
+    parser.add_argument(
+        "--queue",
+        default=work_queue.QUEUE_PATH,
+        help="The path to the work queue's SQLite file.",
+    )
+    mode.add_argument(
+        "--calibrate",
+        action="store_true",
+        help="Time each worker configuration on a sample clip and save the best.",
+    )
+    parser.add_argument(
+        "--sample",
+        help="The audio file to calibrate with. Defaults to the first downloaded.",
+    )
+    parser.add_argument(
+        "--config",
+        default=CONFIG_PATH,
+        help="The path to the file of saved settings for each machine.",
+    )
+    parser.add_argument("--model-size", help="The WhisperX model to load.")
+    parser.add_argument("--device", help="The device to run the model on.")
+    parser.add_argument("--compute-type", help="The model's compute type.")
+    parser.add_argument(
+        "--num-workers", type=int, help="The number of worker processes."
+    )
+    parser.add_argument(
+        "--cpu-threads", type=int, help="The number of threads in each process."
+    )
+    parser.add_argument(
+        "--refine-model-size",
+        help="A larger model to re-transcribe the segments mentioning keywords.",
+    )
+    parser.add_argument(
+        "--refine-keywords",
+        nargs="+",
+        help="The keywords whose segments are re-transcribed (Trump and Biden).",
+    )
+
+    return parser.parse_args()
+
+
+def load_settings(
+    config_path: str = CONFIG_PATH, host: Optional[str] = None
+) -> Dict[str, Any]:
+    """Loads the transcription settings saved for a machine.
+
+    Parameters
+    ----------
+    config_path : str, optional
+        The path to the file of saved settings for each machine.
+    host : str, optional
+        The machine's host name. Defaults to this machine.
+
+    Returns
+    -------
+    dict
+        The saved settings, with the module constants filling in any that
+        weren't saved.
+    """
+    settings = get_settings()
+    if os.path.exists(config_path):
+        saved = utils.read_data_from_json(config_path)
+        saved = saved.get(host or socket.gethostname(), {})
+        settings.update((key, saved[key]) for key in SETTINGS if key in saved)
+
+    return settings
+
+
+def get_settings() -> Dict[str, Any]:
+    """Returns the settings currently in use, from the module constants."""
+    return {key: globals()[constant] for key, constant in SETTINGS.items()}
+
+
+def configure(settings: Dict[str, Any]):
+    """Overrides the module constants with the given settings.
+
+    Parameters
+    ----------
+    settings : dict
+        Settings keyed like `SETTINGS`. Missing or None values are left alone.
+    """
+    for key, constant in SETTINGS.items():
+        if settings.get(key) is not None:
+            globals()[constant] = settings[key]
+
+
+def init_worker(settings: Optional[Dict[str, Any]] = None):
+    """Initializes the transcription model in each process pool worker.
+
+    Parameters
+    ----------
+    settings : dict, optional
+        The model settings to use. Defaults to the module constants, which
+        aren't inherited by workers on platforms that spawn them.
+    """
+    global model, decode_audio, refine_model, refine_matcher
     import whisperx
 
-    model = whisperx.load_model(MODEL_SIZE, DEVICE, compute_type="int8")
+    settings = settings or get_settings()
+    model = whisperx.load_model(
+        settings["model_size"],
+        settings["device"],
+        compute_type=settings["compute_type"],
+        threads=settings["cpu_threads"],
+    )
+    decode_audio = whisperx.load_audio
+
+    if settings["refine_model_size"]:
+        refine_model = whisperx.load_model(
+            settings["refine_model_size"],
+            settings["device"],
+            compute_type=settings["compute_type"],
+            threads=settings["cpu_threads"],
+        )
+        refine_matcher = KeywordMatcher(settings["refine_keywords"])
 
 
-def read_in_json(path: str) -> List[Set[str]]:
-    """Reads in the existing transcription data from JSON to a list.
+def get_default_initializer() -> Callable[[], None]:
+    """Returns a worker initializer that loads the model with the current settings."""
+    return partial(init_worker, get_settings())
 
-    To avoid re-transcribing the same audio twice if it ran in two different
-    script executions, this function looks at the episode ID of what's already
-    been transcribed. If during transcription, this ID is encountered again, it
-    will be skipped.
+
+def get_calibration_candidates(
+    device: str, cpu_count: Optional[int] = None
+) -> List[Dict[str, Any]]:
+    """Lists the worker configurations to try when calibrating.
+
+    On a CPU, process counts go up in powers of two to the number of cores,
+    each with enough threads per process to fill the cores and with half as
+    many. On a GPU, only one or two processes are tried, since they share it.
+
+    Parameters
+    ----------
+    device : str
+        The device the model runs on.
+    cpu_count : int, optional
+        The number of cores. Defaults to this machine's.
+
+    Returns
+    -------
+    list of dict
+        The `num_workers`, `cpu_threads` and `compute_type` of each
+        configuration.
+    """
+    cpu_count = cpu_count or os.cpu_count() or 1
+    compute_types = CALIBRATION_COMPUTE_TYPES.get(device, [COMPUTE_TYPE])
+
+    if device == "cpu":
+        worker_counts = [2**i for i in range(cpu_count.bit_length())]
+        if worker_counts[-1] != cpu_count:
+            worker_counts.append(cpu_count)
+    else:
+        worker_counts = [1, 2]
+
+    candidates = []
+    for num_workers in worker_counts:
+        threads = max(1, cpu_count // num_workers)
+        for cpu_threads in sorted({threads, max(1, threads // 2)}, reverse=True):
+            for compute_type in compute_types:
+                candidates.append(
+                    {
+                        "num_workers": num_workers,
+                        "cpu_threads": cpu_threads,
+                        "compute_type": compute_type,
+                    }
+                )
+
+    return candidates
+
+
+def _time_sample(sample_path: str, seconds: float) -> Tuple[float, float, float]:
+    """Transcribes the start of a sample file in a worker, timing the model.
+
+    Returns
+    -------
+    tuple of float
+        When the transcription started and finished, and the seconds of audio
+        it covered.
+    """
+    audio = decode_audio(sample_path)[: int(seconds * SAMPLE_RATE)]
+    start = time.time()
+    model.transcribe(audio, language="en")
+
+    return start, time.time(), len(audio) / SAMPLE_RATE
+
+
+def measure_throughput(
+    settings: Dict[str, Any],
+    sample_path: str,
+    seconds: float = CALIBRATION_SECONDS,
+    initializer: Callable[[Dict[str, Any]], None] = init_worker,
+) -> float:
+    """Measures how fast a worker configuration transcribes a sample clip.
+
+    Each worker process transcribes the clip twice, and the throughput is
+    taken over the span from the first transcription starting to the last one
+    finishing, so loading the model isn't counted.
 
     Parameters
     ----------
+    settings : dict
+        The settings to run the workers with.
+    sample_path : str
+        The audio file whose start is transcribed.
+    seconds : float, optional
+        How much of the file to transcribe.
+    initializer : callable, optional
+        Sets the global `model` in each worker from the settings.
+
+    Returns
+    -------
+    float
+        The seconds of audio transcribed per second.
+    """
+    num_workers = settings["num_workers"]
+    with ProcessPoolExecutor(
+        max_workers=num_workers, initializer=initializer, initargs=(settings,)
+    ) as executor:
+        futures = [
+            executor.submit(_time_sample, sample_path, seconds)
+            for _ in range(2 * num_workers)
+        ]
+        timings = [future.result() for future in futures]
+
+    elapsed = max(end for _, end, _ in timings) - min(start for start, _, _ in timings)
+    return sum(audio for _, _, audio in timings) / elapsed
+
+
+def calibrate(
+    sample_path: str,
+    config_path: str = CONFIG_PATH,
+    seconds: float = CALIBRATION_SECONDS,
+) -> Dict[str, Any]:
+    """Finds the fastest worker configuration for this machine and saves it.
+
+    The model size and device are kept as they are, since they change the
+    transcripts rather than just the speed.
+
+    Parameters
+    ----------
+    sample_path : str
+        The audio file to time.
+    config_path : str, optional
+        The path to the file of saved settings for each machine. Other
+        machines' settings in it are kept.
+    seconds : float, optional
+        How much of the sample file to transcribe with each configuration.
+
+    Returns
+    -------
+    dict
+        The saved settings, along with the audio seconds per second they
+        reached.
+    """
+    best: Dict[str, Any] = {}
+    for candidate in get_calibration_candidates(DEVICE):
+        settings = {**get_settings(), **candidate}
+        try:
+            throughput = measure_throughput(settings, sample_path, seconds)
+        except Exception as e:
+            metrics.log_event(
+                "calibration_failed", level=logging.WARNING, error=str(e), **candidate
+            )
+            continue
+
+        metrics.log_event(
+            "calibration_result", audio_seconds_per_second=throughput, **candidate
+        )
+        if throughput > best.get("audio_seconds_per_second", 0):
+            best = {**settings, "audio_seconds_per_second": throughput}
+
+    if not best:
+        raise RuntimeError("No configuration could transcribe the sample")
+
+    saved = {}
+    if os.path.exists(config_path):
+        saved = utils.read_data_from_json(config_path)
+    saved[socket.gethostname()] = best
+
+    # Replace the file atomically, since other machines may be reading it
+    temp_path = f"{config_path}.{socket.gethostname()}.tmp"
+    utils.save_data_to_json(saved, temp_path)
+    os.replace(temp_path, config_path)
+
+    return best
+
+
+def get_transcript_path(episode_id: str, transcript_dir: str) -> str:
+    """Builds the path to an episode's saved transcript.
+
+    Parameters
+    ----------
+    episode_id : str
+        The unique episode ID from the RSS feed.
+    transcript_dir : str
+        The directory where per-episode transcripts are saved.
+
+    Returns
+    -------
+    str
+        The path to the episode's transcript file.
+    """
+    return os.path.join(transcript_dir, f"{episode_id}.json")
+
+
+def save_transcript(segmented_text_dict: Dict[str, Any], transcript_dir: str) -> str:
+    """Saves an episode's segmented transcript to its own file.
+
+    The file is written under a temporary name and then renamed, so a crashed
+    worker never leaves a partial transcript behind.
+
+    Parameters
+    ----------
+    segmented_text_dict : dict
+        A dictionary containing the episode ID and its timestamped segments.
+    transcript_dir : str
+        The directory where per-episode transcripts are saved.
+
+    Returns
+    -------
     path : str
-        The path where the transcript text JSON file lives.
+        The path the transcript was saved to.
+    """
+    path = get_transcript_path(segmented_text_dict["id"], transcript_dir)
+    temp_path = f"{path}.tmp"
+
+    with open(temp_path, "wb") as f:
+        f.write(utils.dumps_json(segmented_text_dict))
+    os.replace(temp_path, path)
+
+    return path
+
+
+def load_transcript(path: str) -> Dict[str, Any]:
+    """Loads an episode's segmented transcript saved by `save_transcript`.
+
+    Parameters
+    ----------
+    path : str
+        The path to the episode's transcript file.
 
     Returns
     -------
-    tuple of list and set
-        A tuple containing the deserialized JSON of existing transcription data
-        and a set of unique episode IDs from the JSON.
+    dict
+        A dictionary containing the episode ID and its segments as a
+        `SegmentList`.
     """
-    if os.path.exists(path):
-        data = utils.read_data_from_json(path)
+    with open(path, "rb") as f:
+        segmented_text_dict = utils.loads_json(f.read())
+
+    segments = as_segment_list(segmented_text_dict.get("segmented_text"))
+
+    return create_segmented_text_dict(segments, segmented_text_dict["id"])
 
-        existing_ids = {item["id"] for item in data if "id" in item}
-        print(f"\nLoaded {path} JSON.")
 
-        return data, existing_ids
+def read_transcribed_ids(transcript_dir: str) -> Set[str]:
+    """Finds the episodes that have already been transcribed.
 
-    return [], {}
+    To avoid re-transcribing the same audio twice if it ran in two different
+    script executions, this function looks at the episode IDs that already have
+    a saved transcript. If during transcription, this ID is encountered again,
+    it will be skipped.
+
+    Transcripts from runs before per-episode files were saved are copied into
+    `transcript_dir` first, see `migrate_transcriptions`.
+
+    Parameters
+    ----------
+    transcript_dir : str
+        The directory where per-episode transcripts are saved.
 
+    Returns
+    -------
+    existing_ids : set of str
+        The unique episode IDs that have already been transcribed.
+    """
+    migrate_transcriptions(transcript_dir)
 
-def transcribe_audio(audio_file: str) -> Tuple[str, Dict[str, Any], Dict[str, Any]]:
+    return {
+        f[: -len(".json")] for f in os.listdir(transcript_dir) if f.endswith(".json")
+    }
+
+
+def migrate_transcriptions(transcript_dir: str):
+    """Copies transcripts from the combined output into `transcript_dir`.
+
+    Transcripts that only exist in `data/segmented_text_transcriptions.json`
+    (from runs before per-episode files were saved) are copied so they are
+    kept when that output is rewritten. This only happens once: afterwards,
+    the output is always written from `transcript_dir`, so it isn't read
+    again.
+
+    Parameters
+    ----------
+    transcript_dir : str
+        The directory where per-episode transcripts are saved.
+    """
+    os.makedirs(transcript_dir, exist_ok=True)
+    marker = os.path.join(transcript_dir, MIGRATED_MARKER)
+    if os.path.exists(marker):
+        return
+
+    path = utils.get_stage_path("segmented_text_transcriptions")
+    if os.path.exists(path):
+        for item in utils.read_data(path):
+            if "id" in item and not os.path.exists(
+                get_transcript_path(item["id"], transcript_dir)
+            ):
+                save_transcript(item, transcript_dir)
+        print(f"\nMigrated {path}.")
+
+    open(marker, "w").close()
+
+
+def transcribe_audio(
+    audio_file: str, transcript_dir: str = TRANSCRIPT_DIR
+) -> Tuple[str, Dict[str, Any]]:
     """Transcribes an episode of podcast from MP3 to text.
 
+    Rather than returning the transcript to the parent process, the worker
+    saves it to `transcript_dir` and only returns the episode ID and the
+    worker's metrics for this file.
+
     Parameters
     ----------
     audio_file : str
         The path to the audio file to transcribe.
+    transcript_dir : str, optional
+        The directory where per-episode transcripts are saved.
 
     Returns
     -------
     tuple of str and dict
-        The episode ID, full transcription text dictionary, and segmented text
-        dictionary.
+        The ID of the transcribed episode and the metrics recorded while
+        transcribing it.
 
     """
     global model
-    # Load the WhisperX transcription model and transcribe the audio
+    # Decode the audio and transcribe it with the WhisperX transcription model
     # model = whisperx.load_model(MODEL_SIZE, DEVICE, compute_type="int8")
-    transcription = model.transcribe(audio_file, language="en")
+    with metrics.timer("decode"), stage_profiler.stage("decode"):
+        audio = decode_audio(audio_file) if decode_audio else audio_file
+
+    # Cut out long silences so the model only sees the parts worth
+    # transcribing, keeping track of where the remaining audio came from
+    offset_map = None
+    if SKIP_SILENCE and decode_audio:
+        with metrics.timer("skip_silence"), stage_profiler.stage("skip_silence"):
+            original_length = len(audio)
+            audio, offset_map = speech_regions.remove_non_speech(audio, SAMPLE_RATE)
+        metrics.increment("audio_seconds", original_length / SAMPLE_RATE)
+        metrics.increment(
+            "skipped_seconds", (original_length - len(audio)) / SAMPLE_RATE
+        )
+
+    with metrics.timer("inference"), stage_profiler.stage("inference"):
+        if offset_map is not None and not len(audio):
+            transcription = {"segments": []}
+        else:
+            transcription = model.transcribe(audio, language="en")
 
     # Extract the episode ID from the file name and the timestamped text
-    # segments from the transcription model
+    # segments from the transcription model, with times in the original audio
     episode_id = os.path.basename(audio_file).replace(".mp3", "")
-    segments = transcription["segments"]
+    segments = SegmentList.from_dicts(transcription["segments"])
+    if refine_model is not None and decode_audio:
+        with metrics.timer("refine"), stage_profiler.stage("refine"):
+            segments = refine_segments(segments, audio)
+    if offset_map is not None:
+        segments = offset_map.restore(segments)
 
-    # Create two dictionaries, one with the full text mapped to the episode ID,
-    # and one with the timestamped segments mapped to the episode ID
-    full_text_dict = create_full_text_dict(segments, episode_id)
+    # Save the timestamped segments mapped to the episode ID. The full text is
+    # derived from these later, so it's never stored or sent twice
     segmented_text_dict = create_segmented_text_dict(segments, episode_id)
+    with metrics.timer("save_transcript"), stage_profiler.stage("save_transcript"):
+        save_transcript(segmented_text_dict, transcript_dir)
 
-    return episode_id, full_text_dict, segmented_text_dict
+    metrics.increment("audio_files")
+    metrics.increment("segments", len(segments))
+    # Workers exit without cleanup, so save their profiles after every file
+    stage_profiler.dump()
+
+    return episode_id, metrics.drain()
+
+
+def get_refine_windows(
+    segments: SegmentList, matcher: KeywordMatcher, neighbors: int = REFINE_NEIGHBORS
+) -> List[Tuple[int, int]]:
+    """Finds the runs of segments to re-transcribe.
+
+    Parameters
+    ----------
+    segments : SegmentList
+        The segments from the main model.
+    matcher : KeywordMatcher
+        Checks each segment's text for the keywords.
+    neighbors : int, optional
+        How many segments on each side of a match are included with it.
+
+    Returns
+    -------
+    list of tuple
+        The index of the first segment and of the segment after the last in
+        each run, in order. Runs that overlap or touch are merged.
+    """
+    windows: List[Tuple[int, int]] = []
+    for index in range(len(segments)):
+        if not matcher.matches(segments.get_text(index)):
+            continue
+
+        first = max(0, index - neighbors)
+        last = min(len(segments), index + neighbors + 1)
+        if windows and first <= windows[-1][1]:
+            windows[-1] = (windows[-1][0], last)
+        else:
+            windows.append((first, last))
+
+    return windows
+
+
+def refine_segments(segments: SegmentList, audio: Any) -> SegmentList:
+    """Re-transcribes the segments around keywords with the refining model.
+
+    Parameters
+    ----------
+    segments : SegmentList
+        The segments from the main model.
+    audio : numpy.ndarray
+        The decoded audio the segments were transcribed from.
+
+    Returns
+    -------
+    SegmentList
+        The segments, with each run around a keyword replaced by the refining
+        model's segments for the same stretch of audio.
+    """
+    windows = get_refine_windows(segments, refine_matcher)
+    if not windows:
+        return segments
+
+    starts: List[float] = []
+    ends: List[float] = []
+    texts: List[str] = []
+
+    def keep(first: int, last: int):
+        starts.extend(segments.starts[first:last])
+        ends.extend(segments.ends[first:last])
+        texts.extend(segments.get_text(index) for index in range(first, last))
+
+    previous = 0
+    for first, last in windows:
+        keep(previous, first)
+
+        # Transcribe just this stretch of audio, then move the new segments'
+        # times from the start of the clip to the start of the episode
+        start, end = segments.starts[first], segments.ends[last - 1]
+        clip = audio[int(start * SAMPLE_RATE) : int(end * SAMPLE_RATE)]
+        for segment in refine_model.transcribe(clip, language="en")["segments"]:
+            starts.append(start + segment["start"])
+            ends.append(start + segment["end"])
+            texts.append(segment["text"])
+
+        metrics.increment("refined_segments", last - first)
+        metrics.increment("refined_seconds", end - start)
+        previous = last
+
+    keep(previous, len(segments))
+    return SegmentList(starts, ends, texts)
 
 
 def create_full_text_dict(
-    segments: List[Dict[str, Any]], episode_id: str
+    segments: Union[SegmentList, List[Dict[str, Any]]], episode_id: str
 ) -> Dict[str, Any]:
     """Creates a dictionary with the full transcript in one string.
 
     Parameters
     ----------
-    segments : list of dict
-        Dictionaries containing sections of texts and their start and end
-        timestamps.
+    segments : SegmentList or list of dict
+        Sections of texts and their start and end timestamps.
     episode_id : str
         The unique episode ID from the RSS feed.
 
@@ -126,23 +758,26 @@ def create_full_text_dict(
         single string.
     """
     # Since the segments dictionaries are loaded into the segment list in
-    # order, loop through and join the text together
-    full_transcription_text = "".join(segment["text"] for segment in segments)
+    # order, loop through and join the text together. A SegmentList already
+    # holds its text joined in order
+    if isinstance(segments, SegmentList):
+        full_transcription_text = segments.text
+    else:
+        full_transcription_text = "".join(segment["text"] for segment in segments)
     full_text_dict = {"id": episode_id, "full_text": full_transcription_text}
 
     return full_text_dict
 
 
 def create_segmented_text_dict(
-    segments: List[Dict[str, Any]], episode_id: str
+    segments: Union[SegmentList, List[Dict[str, Any]]], episode_id: str
 ) -> Dict[str, Any]:
     """Creates a dictionary with the transcript split into timestamped parts.
 
     Parameters
     ----------
-    segments : list of dict
-        Dictionaries containing sections of texts and their start and end
-        timestamps.
+    segments : SegmentList or list of dict
+        Sections of texts and their start and end timestamps.
     episode_id : str
         The unique episode ID from the RSS feed.
 
@@ -158,74 +793,305 @@ def create_segmented_text_dict(
     return segmented_text_dict
 
 
-def transcribe_audio_parallel(
-    audio_dir: str,
-) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
-    """Transcribes podcast episodes in parallel using using a process pool.
+def iter_transcripts(transcript_dir: str) -> Iterator[Dict[str, Any]]:
+    """Loads the saved transcripts one at a time, ordered by episode ID.
+
+    Parameters
+    ----------
+    transcript_dir : str
+        The directory where per-episode transcripts are saved.
+
+    Yields
+    ------
+    dict
+        A dictionary containing an episode ID and its segments.
+    """
+    for f in sorted(os.listdir(transcript_dir)):
+        if f.endswith(".json"):
+            yield load_transcript(os.path.join(transcript_dir, f))
+
+
+def save_transcriptions(transcript_dir: str):
+    """Writes the full and segmented text outputs from the saved transcripts.
+
+    Transcripts are streamed from `transcript_dir` one episode at a time, so
+    memory use doesn't grow with the number or length of episodes.
+
+    Parameters
+    ----------
+    transcript_dir : str
+        The directory where per-episode transcripts are saved.
+    """
+    utils.save_data_stream(
+        (
+            create_full_text_dict(item["segmented_text"], item["id"])
+            for item in iter_transcripts(transcript_dir)
+        ),
+        utils.get_stage_path("full_text_transcriptions"),
+        "full_text_transcriptions",
+    )
+    utils.save_data_stream(
+        iter_transcripts(transcript_dir),
+        utils.get_stage_path("segmented_text_transcriptions"),
+        "segmented_text_transcriptions",
+    )
+
+
+def list_untranscribed_audio(audio_dir: str, transcript_dir: str) -> List[str]:
+    """Lists the MP3s in `audio_dir` that don't have a transcript yet.
 
     Parameters
     ----------
     audio_dir : str
         The path containing all of the podcast episode MP3s.
+    transcript_dir : str
+        The directory where per-episode transcripts are saved.
 
     Returns
     -------
-    tuple of dicts
-        A tuple containg the dictionaries of full text transcription and
-        segmented text transcription.
+    list of str
+        The paths to the untranscribed MP3s.
     """
     # Check if audio has already been transcribed to avoid rewrites
-    full_text_dicts, existing_ids = read_in_json("data/full_text_transcriptions.json")
-    segmented_text_dicts, existing_ids = read_in_json(
-        "data/segmented_text_transcriptions.json"
-    )
+    existing_ids = read_transcribed_ids(transcript_dir)
 
-    # Filter out IDs that are already in the JSON
-    audio_files = [
+    # Filter out IDs that already have a transcript
+    return [
         os.path.join(audio_dir, f)
         for f in os.listdir(audio_dir)
         if f.endswith(".mp3") and os.path.splitext(f)[0] not in existing_ids
     ]
 
+
+def enqueue_audio(
+    queue_path: str, audio_dir: str, transcript_dir: str = TRANSCRIPT_DIR
+) -> int:
+    """Adds the untranscribed MP3s to the work queue.
+
+    Parameters
+    ----------
+    queue_path : str
+        The path to the work queue's SQLite file.
+    audio_dir : str
+        The path containing all of the podcast episode MP3s.
+    transcript_dir : str, optional
+        The directory where per-episode transcripts are saved.
+
+    Returns
+    -------
+    int
+        The number of episodes added to the queue.
+    """
+    audio_files = list_untranscribed_audio(audio_dir, transcript_dir)
+    conn = work_queue.connect(queue_path)
+    try:
+        return work_queue.enqueue(
+            conn,
+            ((os.path.splitext(os.path.basename(f))[0], f) for f in audio_files),
+        )
+    finally:
+        conn.close()
+
+
+def _send_heartbeats(queue_path: str, worker: str, stop: threading.Event):
+    """Renews a worker's leases every `HEARTBEAT_SECONDS` until stopped."""
+    conn = work_queue.connect(queue_path)
+    try:
+        while not stop.wait(work_queue.HEARTBEAT_SECONDS):
+            work_queue.heartbeat(conn, worker)
+    finally:
+        conn.close()
+
+
+def transcribe_from_queue(
+    queue_path: str,
+    transcript_dir: str = TRANSCRIPT_DIR,
+    initializer: Optional[Callable[[], None]] = None,
+    worker: Optional[str] = None,
+):
+    """Transcribes episodes claimed from the work queue until it's empty.
+
+    Only as many episodes as there are worker processes are claimed at once,
+    so other machines can pick up the rest. A background thread keeps the
+    claims alive while they're transcribed.
+
+    Parameters
+    ----------
+    queue_path : str
+        The path to the work queue's SQLite file.
+    transcript_dir : str, optional
+        The directory where per-episode transcripts are saved.
+    initializer : callable, optional
+        Sets the global `model` in each worker process. Defaults to loading
+        WhisperX with the current settings.
+    worker : str, optional
+        A name for this worker, unique across machines. Defaults to the host
+        name and process ID.
+    """
+    worker = worker or f"{socket.gethostname()}:{os.getpid()}"
+    conn = work_queue.connect(queue_path)
+    stop = threading.Event()
+    heartbeats = threading.Thread(
+        target=_send_heartbeats, args=(queue_path, worker, stop), daemon=True
+    )
+    heartbeats.start()
+    running: Dict[Future, str] = {}
+
+    try:
+        with ProcessPoolExecutor(
+            max_workers=NUM_WORKERS,
+            initializer=initializer or get_default_initializer(),
+            mp_context=multiprocessing.get_context(PROCESS_START_METHOD),
+        ) as executor:
+            while True:
+                # Claim an episode for each idle worker process
+                while len(running) < NUM_WORKERS:
+                    task = work_queue.claim(conn, worker)
+                    if task is None:
+                        break
+                    future = executor.submit(
+                        transcribe_audio, task["audio_path"], transcript_dir
+                    )
+                    running[future] = task["episode_id"]
+
+                if not running:
+                    # Other workers' claims may still run out and need retrying
+                    if not work_queue.get_counts(conn).get("claimed"):
+                        break
+                    time.sleep(QUEUE_POLL_SECONDS)
+                    continue
+
+                finished, _ = wait(
+                    running, timeout=QUEUE_POLL_SECONDS, return_when=FIRST_COMPLETED
+                )
+                for future in finished:
+                    episode_id = running.pop(future)
+                    try:
+                        _, worker_metrics = future.result()
+                        metrics.merge(worker_metrics)
+                        work_queue.complete(conn, episode_id, worker)
+                        metrics.log_progress("audio_files", every=10)
+
+                    except Exception as e:
+                        work_queue.fail(conn, episode_id, worker, str(e))
+                        metrics.increment("transcription_errors")
+                        metrics.log_event(
+                            "transcription_failed",
+                            level=logging.ERROR,
+                            episode_id=episode_id,
+                            error=str(e),
+                        )
+    finally:
+        stop.set()
+        conn.close()
+
+    metrics.log_event("queue_drained", worker=worker)
+
+
+def transcribe_audio_parallel(
+    audio_dir: str,
+    transcript_dir: str = TRANSCRIPT_DIR,
+    initializer: Optional[Callable[[], None]] = None,
+    mp_context: Optional[BaseContext] = None,
+):
+    """Transcribes podcast episodes in parallel using using a process pool.
+
+    Parameters
+    ----------
+    audio_dir : str
+        The path containing all of the podcast episode MP3s.
+    transcript_dir : str, optional
+        The directory where per-episode transcripts are saved.
+    initializer : callable, optional
+        Sets the global `model` in each worker. Defaults to loading WhisperX
+        with the current settings; the benchmarks swap in a fake model here.
+    mp_context : multiprocessing context, optional
+        How the worker processes are started. Defaults to the platform's
+        default.
+    """
+    audio_files = list_untranscribed_audio(audio_dir, transcript_dir)
+
     with ProcessPoolExecutor(
-        max_workers=NUM_WORKERS, initializer=init_worker
+        max_workers=NUM_WORKERS,
+        initializer=initializer or get_default_initializer(),
+        mp_context=mp_context,
     ) as executor:
         future_to_file = {
-            executor.submit(transcribe_audio, audio): audio for audio in audio_files
+            executor.submit(transcribe_audio, audio, transcript_dir): audio
+            for audio in audio_files
         }
         for future in as_completed(future_to_file):
             try:
-                episode_id, full_text_dict, segmented_text_dict = future.result()
+                with stage_profiler.stage("collect_results"):
+                    episode_id, worker_metrics = future.result()
+                metrics.merge(worker_metrics)
+                metrics.log_progress("audio_files", every=10)
 
-                # For each completed transcription, add them to the lists of
-                # finished full and segmented text dictionaries
-                full_text_dicts.append(full_text_dict)
-                segmented_text_dicts.append(segmented_text_dict)
+            except Exception as e:
+                metrics.increment("transcription_errors")
+                metrics.log_event(
+                    "transcription_failed",
+                    level=logging.ERROR,
+                    audio_file=future_to_file[future],
+                    error=str(e),
+                )
 
-                print(f"Processed: {episode_id}")
 
-            except Exception as e:
-                print(f"Error processing file: {future_to_file[future]} - {e}")
+def main():
+    args = parse_arguments()
+    metrics.configure("transcribe_audio")
+    if args.profile:
+        stage_profiler.enable(
+            os.path.join(utils.DATA_DIR, "profiles", "transcribe_audio")
+        )
 
-    return full_text_dicts, segmented_text_dicts
+    # Saved settings for this machine override the constants, and flags
+    # override both
+    configure(load_settings(args.config))
+    configure({key: getattr(args, key) for key in SETTINGS})
 
+    if args.calibrate:
+        sample = args.sample
+        if sample is None:
+            mp3s = []
+            if os.path.isdir(AUDIO_DIR):
+                mp3s = sorted(f for f in os.listdir(AUDIO_DIR) if f.endswith(".mp3"))
+            if not mp3s:
+                sys.exit(f"No MP3s in {AUDIO_DIR} to calibrate with, pass --sample.")
+            sample = os.path.join(AUDIO_DIR, mp3s[0])
+        print(f"\nCalibrating with {sample}...")
+        best = calibrate(sample, args.config)
+        print(f"\nSaved the fastest settings to {args.config}: {best}")
+        return
 
-def main():
+    if args.enqueue:
+        added = enqueue_audio(args.queue, AUDIO_DIR, TRANSCRIPT_DIR)
+        print(f"\nAdded {added} episodes to the work queue.")
+        return
+
+    if args.worker:
+        print("\nTranscribing episodes from the work queue...")
+        transcribe_from_queue(args.queue, TRANSCRIPT_DIR)
+        metrics.report()
+        stage_profiler.write_reports()
+        return
 
     # Transcribe audio files in parallel
     print("\nStarting audio transcription...")
-    full_text_dicts, segmented_text_dicts = transcribe_audio_parallel(AUDIO_DIR)
+    transcribe_audio_parallel(AUDIO_DIR, TRANSCRIPT_DIR)
 
-    print("\nSaving transcriptions to JSONs...")
+    print("\nSaving transcriptions...")
 
-    # Serialize final dictionaries to JSON and save files in the `data`
-    # directory
-    utils.save_data_to_json(full_text_dicts, "data/full_text_transcriptions.json")
-    utils.save_data_to_json(
-        segmented_text_dicts, "data/segmented_text_transcriptions.json"
-    )
+    # Combine the per-episode transcripts into the full and segmented text
+    # files in the `data` directory
+    with metrics.timer("save_transcriptions"), stage_profiler.stage(
+        "save_transcriptions"
+    ):
+        save_transcriptions(TRANSCRIPT_DIR)
 
     print("\nTranscription complete!")
+    metrics.report()
+    stage_profiler.write_reports()
 
 
 if __name__ == "__main__":
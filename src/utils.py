@@ -4,15 +4,271 @@ utils.py
 
 This script contains shared utility functions.
 
+Each pipeline stage writes its output to the `data` directory. By default this
+is pretty-printed JSON, but any stage can be switched to Parquet by changing
+its entry in `STAGE_FORMATS` or by setting a `<STAGE>_FORMAT` environment
+variable (e.g. `SEGMENTED_TEXT_TRANSCRIPTIONS_FORMAT=parquet`). A format of
+"json.zst" writes zstd-compressed JSON.
+
+JSON is encoded with the library named in `JSON_BACKEND` ("json", "orjson" or
+"msgspec"). All three read and write the same data, so files written with one
+can be read with any other.
+
 """
 
+import hashlib
 import json
-from typing import Any, Dict, List
+import os
+from datetime import datetime, timezone
+from functools import partial
+from itertools import islice
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
+
+import config as config
+import metrics as metrics
+from segments import SegmentList
+
+# The directory where each stage's output lives
+DATA_DIR = "data"
+
+# The JSON library to encode and decode with: "json", "orjson" or "msgspec"
+JSON_BACKEND = config.load().json_backend
+# Whether to write JSON without indentation (smaller and faster to parse)
+JSON_COMPACT = config.load().json_compact
+# Compression level used for `.zst` files
+ZSTD_LEVEL = 3
+# Number of records buffered at a time when streaming data to a file
+STREAM_BATCH_SIZE = 100
+
+# The storage format for each stage's output: "json", "json.zst" or "parquet"
+STAGE_FORMATS = {
+    "show_metadata": "json",
+    "episode_metadata": "json",
+    "full_text_transcriptions": "json",
+    "segmented_text_transcriptions": "json",
+}
+
+# The channel the loaders notify with the ids of the episodes they change, so
+# query caches (see query_service.py) can drop results that went stale
+CHANGES_CHANNEL = "csmap_episode_changes"
+# The payload for a change that can affect any episode, like a show's title
+ALL_EPISODES = "*"
+
+# Columns for each stage's Parquet layout, as (name, type) pairs. Types are
+# pyarrow type names, with "json" marking nested values stored as JSON strings
+PARQUET_COLUMNS = {
+    "show_metadata": [
+        ("title", "string"),
+        ("link", "string"),
+        ("subtitle", "string"),
+        ("rights", "string"),
+        ("generator", "string"),
+        ("language", "string"),
+        ("author", "string"),
+        ("itunes_block", "int64"),
+        ("href", "string"),
+        ("itunes_type", "string"),
+        ("updated", "string"),
+        ("restriction", "string"),
+        ("title_detail", "json"),
+        ("links", "json"),
+        ("subtitle_detail", "json"),
+        ("rights_detail", "json"),
+        ("generator_detail", "json"),
+        ("authors", "json"),
+        ("author_detail", "json"),
+        ("publisher_detail", "json"),
+        ("tags", "json"),
+        ("media_thumbnail", "json"),
+        ("image", "json"),
+        ("media_restriction", "json"),
+        # Not loaded into Postgres, but bounds how often the ingest daemon polls
+        ("ttl", "string"),
+    ],
+    "episode_metadata": [
+        ("id", "string"),
+        ("title", "string"),
+        ("link", "string"),
+        ("summary", "string"),
+        ("published", "string"),
+        ("published_at", "timestamp"),
+        ("audio_url", "string"),
+        ("itunes_episode", "string"),
+        ("itunes_episodetype", "string"),
+        ("itunes_duration", "string"),
+        ("duration_seconds", "float64"),
+        ("author", "string"),
+        ("subtitle", "string"),
+        ("guidislink", "bool"),
+        ("ppg_canonical", "string"),
+        ("title_detail", "json"),
+        ("links", "json"),
+        ("summary_detail", "json"),
+        ("authors", "json"),
+        ("author_detail", "json"),
+        ("image", "json"),
+        ("subtitle_detail", "json"),
+        ("content", "json"),
+        ("ppg_enclosurelegacy", "json"),
+        ("ppg_enclosuresecure", "json"),
+        ("media_content", "json"),
+    ],
+    "full_text_transcriptions": [
+        ("id", "string"),
+        ("full_text", "string"),
+    ],
+    # Transcripts are stored one row per segment rather than one per episode
+    "segmented_text_transcriptions": [
+        ("id", "string"),
+        ("segment_index", "int32"),
+        ("start", "float64"),
+        ("end", "float64"),
+        ("text", "string"),
+    ],
+}
+
+
+def _json_default(obj: Any) -> Any:
+    """Converts values the fast JSON libraries don't handle natively.
+
+    feedparser's `struct_time` values are tuple subclasses, which the stdlib
+    writes as lists, so the other backends do the same. `SegmentList`s are
+    written as lists of segment dictionaries.
+    """
+    if isinstance(obj, SegmentList):
+        return obj.to_list()
+    if isinstance(obj, tuple):
+        return list(obj)
+    if isinstance(obj, dict):
+        return dict(obj)
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+
+def dumps_json(
+    data: Any, backend: Optional[str] = None, compact: Optional[bool] = None
+) -> bytes:
+    """Encodes data to UTF-8 JSON bytes.
+
+    Parameters
+    ----------
+    data : any
+        The data to encode.
+    backend : str, optional
+        The JSON library to use. Defaults to `JSON_BACKEND`.
+    compact : bool, optional
+        Whether to skip indentation. Defaults to `JSON_COMPACT`.
+
+    Returns
+    -------
+    bytes
+        The encoded JSON.
+    """
+    backend = backend or JSON_BACKEND
+    compact = JSON_COMPACT if compact is None else compact
+
+    if backend == "orjson":
+        import orjson
+
+        # orjson only supports two-space indentation
+        option = 0 if compact else orjson.OPT_INDENT_2
+        return orjson.dumps(data, default=_json_default, option=option)
+
+    if backend == "msgspec":
+        import msgspec
+
+        raw = msgspec.json.encode(data, enc_hook=_json_default)
+        return raw if compact else msgspec.json.format(raw, indent=4)
+
+    if backend == "json":
+        if compact:
+            text = json.dumps(
+                data,
+                ensure_ascii=False,
+                separators=(",", ":"),
+                default=_json_default,
+            )
+        else:
+            text = json.dumps(data, ensure_ascii=False, indent=4, default=_json_default)
+        return text.encode("utf-8")
+
+    raise ValueError(f"Unknown JSON backend: {backend}")
+
+
+def get_json_encoder(backend: Optional[str] = None) -> Callable[[Any], bytes]:
+    """Returns a function that encodes single values to compact JSON bytes.
+
+    Unlike `dumps_json`, the backend is looked up once, so this suits code
+    that encodes many small values, like the loaders' JSONB columns.
+
+    Parameters
+    ----------
+    backend : str, optional
+        The JSON library to use. Defaults to `JSON_BACKEND`.
+
+    Returns
+    -------
+    callable
+        Encodes a value to UTF-8 JSON bytes.
+    """
+    backend = backend or JSON_BACKEND
+
+    if backend == "orjson":
+        import orjson
+
+        return partial(orjson.dumps, default=_json_default)
+
+    if backend == "msgspec":
+        import msgspec
+
+        return msgspec.json.Encoder(enc_hook=_json_default).encode
+
+    if backend == "json":
+        encoder = json.JSONEncoder(
+            ensure_ascii=False, separators=(",", ":"), default=_json_default
+        )
+        return lambda data: encoder.encode(data).encode("utf-8")
+
+    raise ValueError(f"Unknown JSON backend: {backend}")
+
+
+def loads_json(raw: bytes, backend: Optional[str] = None) -> Any:
+    """Decodes UTF-8 JSON bytes to data.
+
+    Parameters
+    ----------
+    raw : bytes
+        The JSON to decode.
+    backend : str, optional
+        The JSON library to use. Defaults to `JSON_BACKEND`.
+
+    Returns
+    -------
+    any
+        The decoded data.
+    """
+    backend = backend or JSON_BACKEND
+
+    if backend == "orjson":
+        import orjson
+
+        return orjson.loads(raw)
+
+    if backend == "msgspec":
+        import msgspec
+
+        return msgspec.json.decode(raw)
+
+    if backend == "json":
+        return json.loads(raw)
+
+    raise ValueError(f"Unknown JSON backend: {backend}")
 
 
 def save_data_to_json(data: List[Dict[str, Any]], filename: str):
     """Serializes data into JSON to save into a file.
 
+    Files ending in `.zst` are compressed with zstd.
+
     Parameters
     ----------
     data : list of dict
@@ -20,13 +276,22 @@ def save_data_to_json(data: List[Dict[str, Any]], filename: str):
     filename : str
         The file name to write the data to.
     """
-    with open(filename, "w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=4)
+    raw = dumps_json(data)
+
+    if filename.endswith(".zst"):
+        import zstandard
+
+        raw = zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(raw)
+
+    with open(filename, "wb") as f:
+        f.write(raw)
 
 
 def read_data_from_json(filename: str) -> List[Dict[str, Any]]:
     """Deserializes JSON from a file to data.
 
+    Files ending in `.zst` are decompressed with zstd.
+
     Parameters
     ----------
     path : str
@@ -37,7 +302,441 @@ def read_data_from_json(filename: str) -> List[Dict[str, Any]]:
     data : list of dict
         The data serialized from JSON.
     """
-    with open(filename, "r", encoding="utf-8") as f:
-        data = json.load(f)
+    with open(filename, "rb") as f:
+        raw = f.read()
+
+    if filename.endswith(".zst"):
+        import zstandard
+
+        raw = zstandard.ZstdDecompressor().decompressobj().decompress(raw)
+
+    data = loads_json(raw)
 
     return data
+
+
+def get_postgres_dsn(replica: bool = False) -> str:
+    """Builds the Postgres connection string from the settings in `config`.
+
+    Parameters
+    ----------
+    replica : bool, optional
+        Whether to connect to the read replica in `DB_READ_HOST`, for
+        read-only queries. Falls back to `DB_HOST` if it isn't set.
+
+    Returns
+    -------
+    str
+        A formatted string containing variables to make the Postgres
+        table connection.
+    """
+    return config.load().get_postgres_dsn(replica)
+
+
+def notify_changes(cur: Any, ids: Iterable[str]):
+    """Tells listeners on `CHANGES_CHANNEL` which episodes were changed.
+
+    Postgres only delivers the notifications if the transaction commits, and
+    delivers each distinct id once.
+
+    Parameters
+    ----------
+    cur : psycopg.Cursor
+        A cursor in the transaction that changed the episodes.
+    ids : iterable of str
+        The changed episodes' ids, or `ALL_EPISODES`.
+    """
+    ids = sorted(set(ids))
+    if ids:
+        cur.execute(
+            "SELECT pg_notify(%s, id) FROM unnest(%s::text[]) AS id",
+            (CHANGES_CHANNEL, ids),
+        )
+
+
+def get_row_hash(row: Dict[str, Any], columns: List[str]) -> str:
+    """Hashes the values a loader writes for a row.
+
+    The loaders store this in each table's `row_hash` column and only update
+    a row when it changes, so reloading unchanged data writes nothing.
+
+    Parameters
+    ----------
+    row : dict
+        The row as it's about to be written, with nested fields already
+        serialized.
+    columns : list of str
+        The columns to hash, in a fixed order.
+
+    Returns
+    -------
+    str
+        A hex digest of the row's values.
+    """
+    values = json.dumps([row.get(column) for column in columns], default=str)
+
+    return hashlib.blake2b(values.encode(), digest_size=16).hexdigest()
+
+
+def get_audio_url(episode: Dict[str, Any]) -> Optional[str]:
+    """Finds the MP3 URL in an episode's links.
+
+    Parameters
+    ----------
+    episode : dict
+        A dictionary containing metadata for a single episode.
+
+    Returns
+    -------
+    str or None
+        The URL of the episode's audio, if there is one.
+    """
+    for link in episode.get("links") or []:
+        if link.get("type") == "audio/mpeg":
+            return link.get("href")
+
+    return None
+
+
+def get_audio_length(episode: Dict[str, Any]) -> Optional[int]:
+    """Finds the MP3's size in bytes, as listed in the episode's enclosure.
+
+    Parameters
+    ----------
+    episode : dict
+        A dictionary containing metadata for a single episode.
+
+    Returns
+    -------
+    int or None
+        The listed size, if there is a positive one. Feeds often list 0.
+    """
+    for link in episode.get("links") or []:
+        if link.get("type") == "audio/mpeg":
+            try:
+                length = int(link.get("length") or 0)
+            except (TypeError, ValueError):
+                return None
+            return length if length > 0 else None
+
+    return None
+
+
+def get_duration_seconds(episode: Dict[str, Any]) -> Optional[float]:
+    """Converts an episode's `itunes_duration` value to seconds.
+
+    Parameters
+    ----------
+    episode : dict
+        A dictionary containing metadata for a single episode.
+
+    Returns
+    -------
+    float or None
+        The duration, if it's given as seconds, MM:SS or HH:MM:SS.
+    """
+    # Episodes extracted with `schema.project` have it converted already
+    if episode.get("duration_seconds") is not None:
+        return float(episode["duration_seconds"])
+
+    duration = str(episode.get("itunes_duration") or "").strip()
+    if not duration:
+        return None
+
+    seconds = 0.0
+    try:
+        for part in duration.split(":"):
+            seconds = seconds * 60 + float(part)
+    except ValueError:
+        return None
+
+    return seconds
+
+
+def get_published_at(episode: Dict[str, Any]) -> Optional[datetime]:
+    """Converts an episode's publication time to a UTC datetime.
+
+    Reads feedparser's `published_parsed` value, or the ISO 8601 `published`
+    value of episodes extracted with `schema.project`.
+
+    Parameters
+    ----------
+    episode : dict
+        A dictionary containing metadata for a single episode.
+
+    Returns
+    -------
+    datetime or None
+        The publication time, if the episode has one.
+    """
+    parsed = episode.get("published_parsed")
+    if parsed:
+        # feedparser normalizes parsed dates to UTC
+        return datetime(*parsed[:6], tzinfo=timezone.utc)
+
+    try:
+        published_at = datetime.fromisoformat(episode.get("published") or "")
+    except (TypeError, ValueError):
+        # Missing, or a date feedparser couldn't parse either
+        return None
+    if published_at.tzinfo is None:
+        return published_at.replace(tzinfo=timezone.utc)
+
+    return published_at.astimezone(timezone.utc)
+
+
+def _parquet_schema(stage: str):
+    """Builds the pyarrow schema for a stage's Parquet layout."""
+    import pyarrow as pa
+
+    types = {
+        "string": pa.string(),
+        "json": pa.string(),
+        "int32": pa.int32(),
+        "int64": pa.int64(),
+        "float64": pa.float64(),
+        "bool": pa.bool_(),
+        "timestamp": pa.timestamp("us", tz="UTC"),
+    }
+    fields = [pa.field(name, types[kind]) for name, kind in PARQUET_COLUMNS[stage]]
+
+    return pa.schema(fields, metadata={"csmap_stage": stage})
+
+
+def _to_parquet_rows(
+    data: List[Dict[str, Any]], stage: str
+) -> Iterator[Dict[str, Any]]:
+    """Flattens a stage's records into rows matching its Parquet layout."""
+    if stage == "segmented_text_transcriptions":
+        # Give each segment its own row, in the same order as the loader
+        for row in data:
+            for index, segment in enumerate(row.get("segmented_text") or [], start=1):
+                yield {
+                    "id": row.get("id"),
+                    "segment_index": index,
+                    "start": segment.get("start"),
+                    "end": segment.get("end"),
+                    "text": segment.get("text"),
+                }
+        return
+
+    encode = get_json_encoder()
+    for row in data:
+        flat_row = {}
+        for name, kind in PARQUET_COLUMNS[stage]:
+            value = row.get(name)
+            if kind == "json" and value is not None:
+                value = encode(value).decode("utf-8")
+            flat_row[name] = value
+
+        # Derived columns that make common analytical filters cheap
+        if stage == "episode_metadata":
+            flat_row["published_at"] = get_published_at(row)
+            flat_row["audio_url"] = get_audio_url(row)
+
+        yield flat_row
+
+
+def save_data_to_parquet(data: List[Dict[str, Any]], filename: str, stage: str):
+    """Writes a stage's data to a Parquet file.
+
+    Parameters
+    ----------
+    data : list of dict
+        The data to write, in the same shape that is saved to JSON.
+    filename : str
+        The file name to write the data to.
+    stage : str
+        The pipeline stage the data belongs to, a key of `PARQUET_COLUMNS`.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = _parquet_schema(stage)
+    table = pa.Table.from_pylist(list(_to_parquet_rows(data, stage)), schema=schema)
+    pq.write_table(table, filename, compression="zstd")
+
+
+def read_parquet_table(
+    filename: str,
+    columns: Optional[List[str]] = None,
+    filters: Optional[List[Any]] = None,
+):
+    """Reads a Parquet file into a pyarrow table for analytical scans.
+
+    Only the requested columns are read, and row groups that can't match the
+    filters are skipped without being decoded.
+
+    Parameters
+    ----------
+    filename : str
+        The Parquet file to read.
+    columns : list of str, optional
+        The columns to read. Reads every column if not given.
+    filters : list, optional
+        Predicates in pyarrow's DNF format, e.g.
+        `[("published_at", ">=", datetime(2024, 10, 22, tzinfo=timezone.utc))]`.
+
+    Returns
+    -------
+    pyarrow.Table
+        The matching rows and columns.
+    """
+    import pyarrow.parquet as pq
+
+    return pq.read_table(filename, columns=columns, filters=filters)
+
+
+def read_data_from_parquet(
+    filename: str, filters: Optional[List[Any]] = None
+) -> List[Dict[str, Any]]:
+    """Reads a stage's Parquet file back into the same shape as its JSON.
+
+    Parameters
+    ----------
+    filename : str
+        The Parquet file to read.
+    filters : list, optional
+        Predicates in pyarrow's DNF format to apply while reading.
+
+    Returns
+    -------
+    data : list of dict
+        The stage's records. Segments are regrouped under their episode ID
+        as `SegmentList`s.
+    """
+    table = read_parquet_table(filename, filters=filters)
+    stage = table.schema.metadata[b"csmap_stage"].decode()
+    rows = table.to_pylist()
+
+    if stage == "segmented_text_transcriptions":
+        # Regroup segment rows into one record per episode
+        episodes = {}
+        for row in rows:
+            starts, ends, texts = episodes.setdefault(row["id"], ([], [], []))
+            starts.append(row["start"])
+            ends.append(row["end"])
+            texts.append(row["text"])
+        return [
+            {"id": episode_id, "segmented_text": SegmentList(*columns)}
+            for episode_id, columns in episodes.items()
+        ]
+
+    # Nested fields are stored as JSON text, encoded with `JSON_BACKEND`
+    json_columns = [name for name, kind in PARQUET_COLUMNS[stage] if kind == "json"]
+    for row in rows:
+        for name in json_columns:
+            if row[name] is not None:
+                row[name] = loads_json(row[name])
+
+    return rows
+
+
+def get_stage_path(stage: str, data_dir: str = DATA_DIR) -> str:
+    """Builds the path to a stage's output file in its configured format.
+
+    Parameters
+    ----------
+    stage : str
+        The pipeline stage, a key of `STAGE_FORMATS`.
+    data_dir : str, optional
+        The directory the stage's output lives in.
+
+    Returns
+    -------
+    str
+        The path to the stage's output file.
+    """
+    data_format = os.getenv(f"{stage.upper()}_FORMAT", STAGE_FORMATS[stage])
+
+    return os.path.join(data_dir, f"{stage}.{data_format}")
+
+
+def save_data(data: List[Dict[str, Any]], filename: str, stage: str):
+    """Saves data as JSON or Parquet based on the file extension.
+
+    Parameters
+    ----------
+    data : list of dict
+        The data to save.
+    filename : str
+        The file name to write the data to.
+    stage : str
+        The pipeline stage the data belongs to, which sets the Parquet layout.
+    """
+    with metrics.timer("save_data"):
+        if filename.endswith(".parquet"):
+            save_data_to_parquet(data, filename, stage)
+        else:
+            save_data_to_json(data, filename)
+
+
+def read_data(filename: str) -> List[Dict[str, Any]]:
+    """Reads data from JSON or Parquet based on the file extension.
+
+    Parameters
+    ----------
+    filename : str
+        The file name to read the data from.
+
+    Returns
+    -------
+    data : list of dict
+        The deserialized data.
+    """
+    with metrics.timer("read_data"):
+        if filename.endswith(".parquet"):
+            return read_data_from_parquet(filename)
+
+        return read_data_from_json(filename)
+
+
+def save_data_stream(records: Iterable[Dict[str, Any]], filename: str, stage: str):
+    """Saves records as JSON or Parquet without holding them all in memory.
+
+    The output can be read back with `read_data` just like a file written by
+    `save_data`.
+
+    Parameters
+    ----------
+    records : iterable of dict
+        The records to save. They are consumed in batches of
+        `STREAM_BATCH_SIZE`.
+    filename : str
+        The file name to write the data to.
+    stage : str
+        The pipeline stage the records belong to, which sets the Parquet
+        layout.
+    """
+    records = iter(records)
+
+    if filename.endswith(".parquet"):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        schema = _parquet_schema(stage)
+        with pq.ParquetWriter(filename, schema, compression="zstd") as writer:
+            while batch := list(islice(records, STREAM_BATCH_SIZE)):
+                rows = list(_to_parquet_rows(batch, stage))
+                writer.write_table(pa.Table.from_pylist(rows, schema=schema))
+        return
+
+    with open(filename, "wb") as f:
+        if filename.endswith(".zst"):
+            import zstandard
+
+            compressor = zstandard.ZstdCompressor(level=ZSTD_LEVEL)
+            out = compressor.stream_writer(f, closefd=False)
+        else:
+            out = f
+
+        # Write the JSON array one record at a time
+        separator = b"[\n"
+        for record in records:
+            out.write(separator)
+            out.write(dumps_json(record))
+            separator = b",\n"
+        out.write(b"[]" if separator == b"[\n" else b"\n]")
+
+        if out is not f:
+            out.close()
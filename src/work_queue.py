@@ -0,0 +1,269 @@
+"""
+work_queue.py
+=============
+
+This script contains a SQLite work queue that lets several machines share the
+transcription work.
+
+Each episode to transcribe is a row in the queue. A worker claims a row with
+a lease, keeps the lease alive with heartbeats while it works, and marks the
+row done (or failed) at the end. If a worker crashes, its leases run out and
+other workers claim the episodes again, up to `MAX_ATTEMPTS` times.
+
+Every claim happens in an immediate transaction, so two workers never get
+the same episode. For workers on several machines, the queue file has to be
+on a filesystem they all share with working file locks.
+
+"""
+
+import os
+import sqlite3
+import time
+from typing import Dict, Iterable, Optional, Tuple
+
+import utils as utils
+
+# The default location of the transcription queue
+QUEUE_PATH = os.path.join(utils.DATA_DIR, "transcription_queue.sqlite")
+# How long a claim lasts without a heartbeat, in seconds
+LEASE_SECONDS = 10 * 60
+# How often workers renew their leases, in seconds
+HEARTBEAT_SECONDS = 60
+# How many times an episode is tried before it's marked as failed
+MAX_ATTEMPTS = 3
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tasks (
+    episode_id TEXT PRIMARY KEY,
+    audio_path TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    worker TEXT,
+    lease_expires REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    updated_at REAL
+);
+CREATE INDEX IF NOT EXISTS tasks_status ON tasks (status, lease_expires);
+"""
+
+
+def connect(path: str = QUEUE_PATH) -> sqlite3.Connection:
+    """Opens the queue, creating it if it doesn't exist.
+
+    Parameters
+    ----------
+    path : str, optional
+        The path to the queue's SQLite file.
+
+    Returns
+    -------
+    sqlite3.Connection
+        A connection for use by one thread.
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+    # Transactions are managed explicitly, so claims can take the write lock
+    # before reading
+    conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript(SCHEMA)
+
+    return conn
+
+
+def enqueue(conn: sqlite3.Connection, tasks: Iterable[Tuple[str, str]]) -> int:
+    """Adds episodes to the queue.
+
+    Episodes already in the queue are left alone, except failed ones, which
+    are reset so they're tried again.
+
+    Parameters
+    ----------
+    conn : sqlite3.Connection
+        A connection to the queue.
+    tasks : iterable of tuple
+        The episode ID and audio file path of each episode.
+
+    Returns
+    -------
+    int
+        The number of episodes added or reset.
+    """
+    now = time.time()
+    with conn:
+        conn.execute("BEGIN IMMEDIATE")
+        cursor = conn.executemany(
+            """
+            INSERT INTO tasks (episode_id, audio_path, updated_at)
+            VALUES (?, ?, ?)
+            ON CONFLICT (episode_id) DO UPDATE SET
+                audio_path = excluded.audio_path,
+                status = 'pending',
+                attempts = 0,
+                error = NULL,
+                updated_at = excluded.updated_at
+            WHERE tasks.status = 'failed'
+            """,
+            ((episode_id, audio_path, now) for episode_id, audio_path in tasks),
+        )
+
+    return cursor.rowcount
+
+
+def claim(
+    conn: sqlite3.Connection, worker: str, lease_seconds: float = LEASE_SECONDS
+) -> Optional[sqlite3.Row]:
+    """Claims the next pending episode, or one whose lease has run out.
+
+    Parameters
+    ----------
+    conn : sqlite3.Connection
+        A connection to the queue.
+    worker : str
+        A name for the claiming worker, unique across machines.
+    lease_seconds : float, optional
+        How long the claim lasts without a heartbeat.
+
+    Returns
+    -------
+    sqlite3.Row or None
+        The claimed row, with `episode_id` and `audio_path`, or None if
+        nothing can be claimed right now.
+    """
+    now = time.time()
+    with conn:
+        conn.execute("BEGIN IMMEDIATE")
+
+        # Give up on episodes whose last allowed attempt was abandoned
+        conn.execute(
+            """
+            UPDATE tasks
+            SET status = 'failed', error = 'lease expired', updated_at = ?
+            WHERE status = 'claimed' AND lease_expires <= ? AND attempts >= ?
+            """,
+            (now, now, MAX_ATTEMPTS),
+        )
+
+        row = conn.execute(
+            """
+            SELECT episode_id, audio_path FROM tasks
+            WHERE status = 'pending' OR (status = 'claimed' AND lease_expires <= ?)
+            ORDER BY status DESC, updated_at
+            LIMIT 1
+            """,
+            (now,),
+        ).fetchone()
+        if row is None:
+            return None
+
+        conn.execute(
+            """
+            UPDATE tasks
+            SET status = 'claimed', worker = ?, lease_expires = ?,
+                attempts = attempts + 1, updated_at = ?
+            WHERE episode_id = ?
+            """,
+            (worker, now + lease_seconds, now, row["episode_id"]),
+        )
+
+    return row
+
+
+def heartbeat(
+    conn: sqlite3.Connection, worker: str, lease_seconds: float = LEASE_SECONDS
+) -> int:
+    """Renews the leases on every episode a worker has claimed.
+
+    Parameters
+    ----------
+    conn : sqlite3.Connection
+        A connection to the queue.
+    worker : str
+        The worker's name.
+    lease_seconds : float, optional
+        How long the renewed claims last without another heartbeat.
+
+    Returns
+    -------
+    int
+        The number of leases renewed.
+    """
+    now = time.time()
+    with conn:
+        cursor = conn.execute(
+            """
+            UPDATE tasks SET lease_expires = ?
+            WHERE worker = ? AND status = 'claimed'
+            """,
+            (now + lease_seconds, worker),
+        )
+
+    return cursor.rowcount
+
+
+def complete(conn: sqlite3.Connection, episode_id: str, worker: str):
+    """Marks a claimed episode as done.
+
+    Parameters
+    ----------
+    conn : sqlite3.Connection
+        A connection to the queue.
+    episode_id : str
+        The episode's ID.
+    worker : str
+        The worker's name. The episode is only updated if this worker still
+        holds the claim.
+    """
+    with conn:
+        conn.execute(
+            """
+            UPDATE tasks SET status = 'done', error = NULL, updated_at = ?
+            WHERE episode_id = ? AND worker = ? AND status = 'claimed'
+            """,
+            (time.time(), episode_id, worker),
+        )
+
+
+def fail(conn: sqlite3.Connection, episode_id: str, worker: str, error: str):
+    """Releases a claimed episode after an error, to be retried or given up on.
+
+    Parameters
+    ----------
+    conn : sqlite3.Connection
+        A connection to the queue.
+    episode_id : str
+        The episode's ID.
+    worker : str
+        The worker's name. The episode is only updated if this worker still
+        holds the claim.
+    error : str
+        A description of what went wrong.
+    """
+    with conn:
+        conn.execute(
+            """
+            UPDATE tasks
+            SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END,
+                worker = NULL, lease_expires = NULL, error = ?, updated_at = ?
+            WHERE episode_id = ? AND worker = ? AND status = 'claimed'
+            """,
+            (MAX_ATTEMPTS, error, time.time(), episode_id, worker),
+        )
+
+
+def get_counts(conn: sqlite3.Connection) -> Dict[str, int]:
+    """Counts the episodes in the queue by status.
+
+    Parameters
+    ----------
+    conn : sqlite3.Connection
+        A connection to the queue.
+
+    Returns
+    -------
+    dict
+        A dictionary mapping each status to its number of episodes.
+    """
+    rows = conn.execute("SELECT status, COUNT(*) FROM tasks GROUP BY status")
+    return {status: count for status, count in rows}
@@ -0,0 +1,34 @@
+import sys
+
+import src.cli as cli
+
+
+def test_parse_arguments_leaves_command_arguments():
+    """Test that everything after the command is left for its script."""
+    args = cli.parse_arguments(["pipeline", "--from", "transcribe", "--help"])
+
+    assert args.command == "pipeline"
+    assert args.arguments == ["--from", "transcribe", "--help"]
+
+
+def test_main_runs_only_the_commands_module(monkeypatch):
+    """Test that a command imports and runs its own module with its arguments."""
+    calls = []
+
+    class FakeModule:
+        @staticmethod
+        def main():
+            calls.append(list(sys.argv))
+
+    imported = []
+    monkeypatch.setattr(
+        cli.importlib,
+        "import_module",
+        lambda name: imported.append(name) or FakeModule,
+    )
+    monkeypatch.setattr(sys, "argv", ["cli.py"])
+
+    cli.main(["load-show", "--profile"])
+
+    assert imported == ["insert_data_into_postgres_show"]
+    assert calls == [["cli.py load-show", "--profile"]]
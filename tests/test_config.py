@@ -0,0 +1,27 @@
+from src.config import Config
+
+
+def test_config_from_environ():
+    """Test that settings are parsed from strings, with defaults for the rest."""
+    config = Config.from_environ(
+        {
+            "DB_HOST": "primary",
+            "DB_READ_HOST": "replica",
+            "JSON_COMPACT": "True",
+            "PROGRESS_EVERY": "50",
+            "MAX_BACKLOG_FILES": "0",
+            "MIN_FREE_DISK_BYTES": "1024",
+            "METRICS_TEXTFILE": "",
+        }
+    )
+
+    assert config.json_compact is True
+    assert config.progress_every == 50
+    # 0 and empty values leave a setting off
+    assert config.max_backlog_files is None
+    assert config.metrics_textfile is None
+    assert config.min_free_disk_bytes == 1024
+    assert config.json_backend == "json"
+    assert "host=primary " in config.get_postgres_dsn()
+    assert "host=replica " in config.get_postgres_dsn(replica=True)
+    assert "host=primary " in Config(db_host="primary").get_postgres_dsn(True)
@@ -1,4 +1,20 @@
-from src.download_audio import download_audio
+import os
+import shutil
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+import src.download_audio as download_audio_module
+from src.download_audio import (
+    AdmissionController,
+    download_audio,
+    find_downloaded,
+    normalize_audio_url,
+    order_episodes,
+    record_download,
+)
 
 
 def test_download_audio_no_links(tmp_path):
@@ -22,3 +38,207 @@ def test_download_audio_existing_file(tmp_path):
     result = download_audio(episode, str(tmp_path))
 
     assert "Skipping existing file" in result
+
+
+class FakeResponse:
+    """A streamed download with the given final URL and ETag."""
+
+    def __init__(self, url, etag):
+        self.url = url
+        self.headers = {"ETag": etag, "Content-Length": "5"}
+        self.body_read = False
+
+    def raise_for_status(self):
+        pass
+
+    def iter_content(self, chunk_size):
+        self.body_read = True
+        yield b"audio"
+
+    def close(self):
+        pass
+
+
+def test_normalize_audio_url():
+    """Test that analytics prefixes, the scheme and the host's case are dropped."""
+    url = (
+        "https://dts.podtrac.com/redirect.mp3/chrt.fm/track/ABC/"
+        "Traffic.Megaphone.fm/EP1.mp3?updated=1"
+    )
+
+    assert normalize_audio_url(url) == "traffic.megaphone.fm/EP1.mp3?updated=1"
+    assert normalize_audio_url("http://traffic.megaphone.fm/EP1.mp3?updated=1") == (
+        "traffic.megaphone.fm/EP1.mp3?updated=1"
+    )
+
+
+def test_download_audio_deduplicates(tmp_path, monkeypatch):
+    """Test that repeated audio is hard-linked instead of downloaded again."""
+    responses = []
+
+    def get(url, **kwargs):
+        # Every URL redirects to its own file, but they all share an ETag
+        response = FakeResponse(url.replace("dts.podtrac.com/redirect.mp3/", ""), "abc")
+        responses.append(response)
+        return response
+
+    monkeypatch.setattr(requests, "get", get)
+
+    def episode(episode_id, url):
+        return {"id": episode_id, "links": [{"href": url, "type": "audio/mpeg"}]}
+
+    download_audio(episode("1", "http://example.com/a.mp3"), str(tmp_path))
+    # The same URL behind an analytics prefix isn't requested at all
+    download_audio(
+        episode("2", "https://dts.podtrac.com/redirect.mp3/example.com/a.mp3"),
+        str(tmp_path),
+    )
+    # A different URL on the same host with the same ETag and length is
+    # requested but not read
+    result = download_audio(episode("3", "http://example.com/b.mp3"), str(tmp_path))
+    # Another host's ETag says nothing about this one's files
+    download_audio(episode("4", "http://example.org/a.mp3"), str(tmp_path))
+
+    assert "Linked" in result
+    assert len(responses) == 3
+    assert [response.body_read for response in responses] == [True, False, True]
+    assert os.path.samefile(tmp_path / "1.mp3", tmp_path / "3.mp3")
+    assert not os.path.samefile(tmp_path / "1.mp3", tmp_path / "4.mp3")
+    assert (tmp_path / "2.mp3").read_bytes() == b"audio"
+
+
+class NotFoundHandler(BaseHTTPRequestHandler):
+    """Answers every request with a 404 error page."""
+
+    def do_GET(self):
+        self.send_response(404)
+        self.send_header("Content-Length", "9")
+        self.end_headers()
+        self.wfile.write(b"not found")
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.mark.skipif(shutil.which("curl") is None, reason="curl isn't installed")
+def test_download_audio_curl_fails_on_http_errors(tmp_path):
+    """Test that the curl fallback doesn't save or index an error page."""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), NotFoundHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}/a.mp3"
+
+    try:
+        result = download_audio(
+            {"id": "1", "links": [{"href": url, "type": "audio/mpeg"}]},
+            str(tmp_path),
+        )
+    finally:
+        server.shutdown()
+
+    assert "Failed to download" in result
+    assert not (tmp_path / "1.mp3").exists()
+    assert find_downloaded(str(tmp_path), [normalize_audio_url(url)]) is None
+
+
+def test_download_index_appends(tmp_path):
+    """Test that each download appends a line and the index reloads from them."""
+    (tmp_path / "1.mp3").write_bytes(b"a")
+    (tmp_path / "2.mp3").write_bytes(b"b")
+    record_download(str(tmp_path), str(tmp_path / "1.mp3"), ["example.com/a.mp3"])
+    record_download(
+        str(tmp_path), str(tmp_path / "2.mp3"), ["example.com/b.mp3"], "abc|1"
+    )
+
+    index_path = tmp_path / download_audio_module.DOWNLOAD_INDEX_FILE
+    assert len(index_path.read_bytes().splitlines()) == 2
+
+    # A partial line from an interrupted append is dropped on reload
+    with open(index_path, "ab") as f:
+        f.write(b'{"name": "3.mp3", "ur')
+    del download_audio_module._indexes[str(tmp_path)]
+
+    assert find_downloaded(str(tmp_path), ["example.com/c.mp3"]) is None
+    assert len(index_path.read_bytes().splitlines()) == 2
+    assert find_downloaded(str(tmp_path), ["example.com/a.mp3"]) == str(
+        tmp_path / "1.mp3"
+    )
+    assert find_downloaded(str(tmp_path), [], "abc|1") == str(tmp_path / "2.mp3")
+
+
+def test_admission_controller(tmp_path, monkeypatch):
+    """Test that downloads wait while in-flight bytes or the backlog are full."""
+    monkeypatch.setattr(download_audio_module, "MAX_IN_FLIGHT_BYTES", 150)
+    monkeypatch.setattr(download_audio_module, "MAX_BACKLOG_FILES", 3)
+    transcript_dir = tmp_path / "transcripts"
+    transcript_dir.mkdir()
+    controller = AdmissionController(str(tmp_path), str(transcript_dir))
+
+    def episode(episode_id, length):
+        link = {"href": "http://example.com/a.mp3", "type": "audio/mpeg"}
+        return {"id": episode_id, "links": [dict(link, length=str(length))]}
+
+    assert controller.try_admit(episode("1", 100)) == 100
+    # Too many bytes in flight, but the one large download was let through
+    assert controller.try_admit(episode("2", 100)) is None
+    controller.release(100)
+    assert controller.try_admit(episode("2", 100)) == 100
+    controller.release(100)
+
+    # Two untranscribed MP3s on disk plus one downloading fill the backlog
+    (tmp_path / "1.mp3").write_bytes(b"a")
+    (tmp_path / "2.mp3").write_bytes(b"b")
+    controller.refresh_backlog()
+    assert controller.try_admit(episode("3", 10)) == 10
+    assert controller.try_admit(episode("4", 10)) is None
+    assert controller.paused_reason == "backlog_files"
+
+    # Existing MP3s are never held back
+    assert controller.try_admit(episode("1", 10)) == 0
+
+    # Once an episode is transcribed, there's room again
+    (transcript_dir / "1.json").write_text("{}")
+    controller.refresh_backlog()
+    assert controller.try_admit(episode("4", 10)) == 10
+
+
+def test_admission_controller_stalls(tmp_path, monkeypatch):
+    """Test that a pause fails once the backlog stops moving for too long."""
+    monkeypatch.setattr(download_audio_module, "MAX_ADMISSION_WAIT_SECONDS", 0)
+    controller = AdmissionController(str(tmp_path), str(tmp_path))
+
+    # The first check starts the wait, and a changed backlog restarts it
+    controller.check_stalled()
+    controller.backlog_files = 1
+    controller.check_stalled()
+
+    with pytest.raises(RuntimeError):
+        controller.check_stalled()
+
+
+def test_order_episodes():
+    """Test that episodes can be ordered newest first or shortest first."""
+    episodes = [
+        {
+            "id": "old",
+            "published_parsed": (2024, 1, 1, 0, 0, 0),
+            "itunes_duration": "5",
+        },
+        {
+            "id": "new",
+            "published_parsed": (2024, 6, 1, 0, 0, 0),
+            "itunes_duration": "1:00",
+        },
+        {"id": "undated"},
+    ]
+
+    assert [e["id"] for e in order_episodes(episodes, "recency")] == [
+        "new",
+        "old",
+        "undated",
+    ]
+    assert [e["id"] for e in order_episodes(episodes, "duration")] == [
+        "old",
+        "new",
+        "undated",
+    ]
+    assert order_episodes(episodes) == episodes
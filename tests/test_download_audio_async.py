@@ -0,0 +1,108 @@
+import asyncio
+import os
+import threading
+from functools import partial
+from http.server import (
+    BaseHTTPRequestHandler,
+    SimpleHTTPRequestHandler,
+    ThreadingHTTPServer,
+)
+
+import pytest
+
+pytest.importorskip("aiohttp")
+
+from src.download_audio_async import (  # noqa: E402
+    AdaptiveLimit,
+    download_audio_parallel,
+)
+
+
+class QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+class TruncatedHandler(BaseHTTPRequestHandler):
+    """Promises 1000 bytes but closes the connection after 10."""
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header("Content-Length", "1000")
+        self.end_headers()
+        self.wfile.write(b"a" * 10)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def test_download_audio_parallel(tmp_path):
+    """Test that the async engine saves each episode and links repeated audio."""
+    served = tmp_path / "served"
+    served.mkdir()
+    for name in ("a", "b"):
+        (served / f"{name}.mp3").write_bytes(name.encode() * 1000)
+
+    server = ThreadingHTTPServer(
+        ("127.0.0.1", 0), partial(QuietHandler, directory=str(served))
+    )
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+
+    def episode(episode_id, name):
+        url = f"{base_url}/{name}.mp3"
+        return {"id": episode_id, "links": [{"href": url, "type": "audio/mpeg"}]}
+
+    download_dir = tmp_path / "audio"
+    download_dir.mkdir()
+    try:
+        download_audio_parallel(
+            [episode("1", "a"), episode("2", "b"), episode("3", "a")],
+            str(download_dir),
+        )
+    finally:
+        server.shutdown()
+
+    assert (download_dir / "1.mp3").read_bytes() == b"a" * 1000
+    assert (download_dir / "2.mp3").read_bytes() == b"b" * 1000
+    assert os.path.samefile(download_dir / "1.mp3", download_dir / "3.mp3")
+    assert not list(download_dir.glob("*.part"))
+
+
+def test_download_audio_parallel_removes_partial_files(tmp_path):
+    """Test that a download cut off mid-stream leaves no partial file behind."""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), TruncatedHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}/a.mp3"
+
+    try:
+        download_audio_parallel(
+            [{"id": "1", "links": [{"href": url, "type": "audio/mpeg"}]}],
+            str(tmp_path),
+        )
+    finally:
+        server.shutdown()
+
+    # Both aiohttp and the curl fallback fail, and neither leaves a file
+    assert not list(tmp_path.glob("*.mp3*"))
+
+
+def test_adaptive_limit():
+    """Test that the limit keeps its direction while throughput improves."""
+
+    async def run():
+        limit = AdaptiveLimit(initial=8, maximum=100)
+        limit.waiting = 1
+
+        for rate, expected in [(100, 10), (200, 12), (50, 9), (40, 11)]:
+            limit.add_bytes(rate)
+            await limit.adjust(1.0)
+            assert limit.limit == expected
+
+        # The limit only grows when downloads are waiting for a slot
+        limit.waiting = 0
+        limit.add_bytes(100)
+        await limit.adjust(1.0)
+        assert limit.limit == 11
+
+    asyncio.run(run())
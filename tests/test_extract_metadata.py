@@ -1,8 +1,25 @@
 import csv
+import multiprocessing
+from datetime import date
 
 import pytest
 
-from src.extract_metadata import load_rss_urls
+import src.extract_metadata as extract_metadata
+from src.extract_metadata import (
+    extract_all_metadata,
+    filter_feed_items,
+    get_date_range,
+    load_rss_urls,
+    parse_feed,
+)
+
+FEED = b"""<?xml version="1.0"?>
+<rss version="2.0"><channel><title>Show</title>
+<item><guid isPermaLink="false">new</guid><pubDate>Fri, 01 Nov 2024 12:00:00 GMT</pubDate></item>
+<item><guid isPermaLink="false">edge</guid><pubDate>Mon, 30 Sep 2024 23:00:00 -0400</pubDate></item>
+<item><guid isPermaLink="false">old</guid><pubDate>Mon, 01 Jan 2018 12:00:00 GMT</pubDate></item>
+<item><guid isPermaLink="false">undated</guid></item>
+</channel></rss>"""
 
 
 def test_load_rss_urls(tmp_path):
@@ -31,3 +48,73 @@ def test_load_rss_urls_missing_column(tmp_path):
 
     with pytest.raises(ValueError):
         load_rss_urls(str(csv_path))
+
+
+def test_get_date_range():
+    """Test that the year and date filters combine into one UTC range."""
+    start, end = get_date_range(2024, start_date=date(2024, 10, 1))
+
+    assert start.isoformat() == "2024-10-01T00:00:00+00:00"
+    assert end.isoformat() == "2025-01-01T00:00:00+00:00"
+    assert get_date_range() == (None, None)
+
+
+def test_filter_feed_items():
+    """Test that only clearly out-of-range items are cut from the raw XML."""
+    start, end = get_date_range(start_date=date(2024, 10, 1))
+    filtered = filter_feed_items(FEED, start, end)
+
+    assert b">old<" not in filtered
+    assert b">new<" in filtered
+    # Near the boundary or undated items are left for feedparser to check
+    assert b">edge<" in filtered
+    assert b">undated<" in filtered
+    assert filter_feed_items(FEED, None, None) is FEED
+
+
+def test_parse_feed_filters_by_date_range():
+    """Test that parsing keeps exactly the episodes published in the range."""
+    _, episodes = parse_feed(
+        FEED, "http://example.com/feed", start_date=date(2024, 10, 1)
+    )
+    assert [episode["id"] for episode in episodes] == ["new", "edge"]
+
+    _, episodes = parse_feed(FEED, "http://example.com/feed", target_year=2018)
+    assert [episode["id"] for episode in episodes] == ["old"]
+
+    _, episodes = parse_feed(FEED, "http://example.com/feed")
+    assert len(episodes) == 4
+
+
+def test_extract_all_metadata_keeps_feed_order(monkeypatch):
+    """Test that feeds parsed in worker processes come back in input order."""
+
+    def fetch_feed(url):
+        if url.endswith("broken"):
+            raise ValueError("not found")
+        return (
+            FEED.replace(b"<title>Show</title>", f"<title>{url}</title>".encode()),
+            url,
+        )
+
+    monkeypatch.setattr(extract_metadata, "fetch_feed", fetch_feed)
+
+    urls = [f"http://example.com/{name}" for name in ("a", "broken", "b")]
+    shows, episodes = extract_all_metadata(urls, target_year=2024)
+
+    assert [show.get("title") for show in shows] == [urls[0], None, urls[2]]
+    assert [episode["id"] for episode in episodes] == ["new", "edge"] * 2
+
+
+def test_extract_all_metadata_with_spawned_workers(monkeypatch):
+    """Test that feeds can be parsed in spawned workers, as the pipeline does."""
+    monkeypatch.setattr(extract_metadata, "fetch_feed", lambda url: (FEED, url))
+
+    shows, episodes = extract_all_metadata(
+        ["http://example.com/a"],
+        target_year=2024,
+        mp_context=multiprocessing.get_context("spawn"),
+    )
+
+    assert shows[0]["title"] == "Show"
+    assert [episode["id"] for episode in episodes] == ["new", "edge"]
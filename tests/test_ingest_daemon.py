@@ -0,0 +1,209 @@
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+import insert_data_into_postgres_episode as insert_data_into_postgres_episode
+import src.ingest_daemon as ingest_daemon
+from src.ingest_daemon import (
+    Ingester,
+    compute_poll_interval,
+    poll_feed,
+    record_failed,
+    record_ingested,
+    run,
+)
+
+FEED = b"""<?xml version="1.0"?>
+<rss version="2.0"><channel>
+<title>Show</title><ttl>60</ttl>
+<item><guid isPermaLink="false">ep-2</guid><pubDate>Tue, 08 Oct 2024 12:00:00 GMT</pubDate></item>
+<item><guid isPermaLink="false">ep-1</guid><pubDate>Tue, 01 Oct 2024 12:00:00 GMT</pubDate></item>
+</channel></rss>"""
+
+
+def test_compute_poll_interval():
+    """Test that the interval follows the cadence, ttl and backoff, within bounds."""
+    day = 24 * 60 * 60
+    daily = [i * day for i in range(10)]
+
+    assert compute_poll_interval(daily) == day / ingest_daemon.POLLS_PER_EPISODE_GAP
+    assert compute_poll_interval(daily, ttl_minutes="600") == 600 * 60
+    assert compute_poll_interval(daily, unchanged_polls=2) == (
+        day / ingest_daemon.POLLS_PER_EPISODE_GAP * ingest_daemon.BACKOFF_FACTOR**2
+    )
+    assert compute_poll_interval([]) == ingest_daemon.MAX_POLL_SECONDS
+    assert compute_poll_interval([0, 60]) == ingest_daemon.MIN_POLL_SECONDS
+
+
+def test_poll_feed_returns_only_unseen_episodes(monkeypatch):
+    """Test that the first poll marks episodes as seen and later ones find new ones."""
+    response = SimpleNamespace(content=FEED, url="http://example.com/feed")
+    monkeypatch.setattr(ingest_daemon, "fetch_feed", lambda url, state: response)
+
+    feed_state = {}
+    show_metadata, new_episodes = poll_feed(response.url, feed_state, since=None)
+    assert show_metadata["title"] == "Show"
+    assert new_episodes == []
+    assert feed_state["seen_ids"] == ["ep-1", "ep-2"]
+    assert feed_state["unchanged_polls"] == 1
+
+    response.content = FEED.replace(
+        b"<item>",
+        b'<item><guid isPermaLink="false">ep-3</guid>'
+        b"<pubDate>Tue, 15 Oct 2024 12:00:00 GMT</pubDate></item><item>",
+        1,
+    )
+    _, new_episodes = poll_feed(response.url, feed_state, since=None)
+    assert [episode["id"] for episode in new_episodes] == ["ep-3"]
+    assert feed_state["unchanged_polls"] == 0
+
+    # Not seen until it's ingested, but not new again either
+    assert feed_state["seen_ids"] == ["ep-1", "ep-2"]
+    assert list(feed_state["pending"]) == ["ep-3"]
+    _, new_episodes = poll_feed(response.url, feed_state, since=None)
+    assert new_episodes == []
+    assert list(feed_state["pending"]) == ["ep-3"]
+
+    record_ingested({response.url: feed_state}, [(response.url, "ep-3")])
+    assert feed_state["seen_ids"] == ["ep-1", "ep-2", "ep-3"]
+    assert feed_state["pending"] == {}
+
+
+def test_poll_feed_ingests_since_date_on_first_poll(monkeypatch):
+    """Test that --since picks which existing episodes the first poll returns."""
+    response = SimpleNamespace(content=FEED, url="http://example.com/feed")
+    monkeypatch.setattr(ingest_daemon, "fetch_feed", lambda url, state: response)
+
+    since = datetime(2024, 10, 5, tzinfo=timezone.utc)
+    _, new_episodes = poll_feed(response.url, {}, since=since)
+
+    assert [episode["id"] for episode in new_episodes] == ["ep-2"]
+
+
+def test_poll_feed_keeps_most_recent_times(monkeypatch):
+    """Test that the cadence uses the newest episodes of an oldest-first feed."""
+    items = b"".join(
+        b'<item><guid isPermaLink="false">ep-%d</guid>'
+        b"<pubDate>%02d Oct 2024 12:00:00 GMT</pubDate></item>" % (day, day)
+        for day in range(1, 31)
+    )
+    feed = b'<?xml version="1.0"?><rss version="2.0"><channel>%s</channel></rss>'
+    response = SimpleNamespace(content=feed % items, url="http://example.com/feed")
+    monkeypatch.setattr(ingest_daemon, "fetch_feed", lambda url, state: response)
+
+    feed_state = {}
+    poll_feed(response.url, feed_state, since=None)
+
+    times = feed_state["published_times"]
+    assert len(times) == ingest_daemon.CADENCE_WINDOW
+    assert times[0] == datetime(2024, 10, 30, 12, tzinfo=timezone.utc).timestamp()
+    assert times == sorted(times, reverse=True)
+
+
+def test_poll_feed_skips_unchanged_feed(monkeypatch):
+    """Test that an unchanged feed returns nothing and backs off."""
+    monkeypatch.setattr(ingest_daemon, "fetch_feed", lambda url, state: None)
+
+    feed_state = {"seen_ids": ["ep-1"], "unchanged_polls": 2}
+    show_metadata, new_episodes = poll_feed("http://example.com/feed", feed_state, None)
+
+    assert show_metadata is None
+    assert new_episodes == []
+    assert feed_state["unchanged_polls"] == 3
+
+
+def test_ingester_keeps_failed_episodes_pending(monkeypatch, tmp_path):
+    """Test that a failed episode isn't reported as ingested or kept in flight."""
+    # The modules the daemon imported, rather than their `src.` copies
+    transcribe_audio = ingest_daemon.transcribe_audio
+    monkeypatch.setattr(transcribe_audio, "AUDIO_DIR", str(tmp_path / "audio"))
+    monkeypatch.setattr(transcribe_audio, "TRANSCRIPT_DIR", str(tmp_path / "text"))
+
+    def fail(dsn, rows):
+        attempts.append(rows[0]["id"])
+        raise RuntimeError("database is down")
+
+    attempts = []
+
+    monkeypatch.setattr(insert_data_into_postgres_episode, "write_to_postgres", fail)
+
+    ingester = Ingester("dsn")
+    try:
+        ingester.submit("http://example.com/feed", {"id": "ep-1"})
+        ingester.wait()
+
+        assert attempts == ["ep-1"]
+        assert ingester.in_flight == {}
+        assert ingester.collect_ingested() == []
+
+        # Not retried until its failure has been collected
+        ingester.submit("http://example.com/feed", {"id": "ep-1"})
+        ingester.wait()
+        assert attempts == ["ep-1"]
+        assert ingester.collect_failed() == [("http://example.com/feed", "ep-1")]
+    finally:
+        ingester.close()
+
+
+def test_record_failed_abandons_after_max_attempts():
+    """Test that an episode is retried until it has failed `MAX_ATTEMPTS` times."""
+    url = "http://example.com/feed"
+    state = {url: {"seen_ids": [], "pending": {"ep-1": {"id": "ep-1"}}}}
+
+    for _ in range(ingest_daemon.MAX_ATTEMPTS - 1):
+        record_failed(state, [(url, "ep-1")])
+    assert list(state[url]["pending"]) == ["ep-1"]
+    assert state[url]["attempts"] == {"ep-1": ingest_daemon.MAX_ATTEMPTS - 1}
+
+    record_failed(state, [(url, "ep-1")])
+    assert state[url]["pending"] == {}
+    assert state[url]["attempts"] == {}
+    assert state[url]["seen_ids"] == ["ep-1"]
+
+
+class FakeIngester:
+    """Records submitted episodes, ingesting them as soon as they're submitted."""
+
+    def __init__(self):
+        self.submitted = []
+        self.ingested = []
+
+    def load_show(self, show_metadata):
+        raise RuntimeError("database is down")
+
+    def submit(self, url, episode):
+        self.submitted.append(episode["id"])
+        self.ingested.append((url, episode["id"]))
+
+    def wait(self):
+        pass
+
+    def collect_ingested(self):
+        ingested, self.ingested = self.ingested, []
+        return ingested
+
+    def collect_failed(self):
+        return []
+
+
+def test_run_survives_show_load_errors(monkeypatch, tmp_path):
+    """Test that a failed show load doesn't stop its episodes or later polls."""
+    url = "http://example.com/feed"
+    new_episode = {"id": "ep-2"}
+
+    def poll(url, feed_state, since):
+        feed_state["pending"]["ep-2"] = new_episode
+        feed_state["content_hash"] = "abc"
+        feed_state["next_poll"] = 0
+        return {"title": "Show"}, [new_episode]
+
+    monkeypatch.setattr(ingest_daemon, "poll_feed", poll)
+    monkeypatch.setattr(ingest_daemon, "STATE_PATH", str(tmp_path / "state.json"))
+    ingester = FakeIngester()
+    state = {url: {"pending": {"ep-1": {"id": "ep-1"}}}}
+
+    run([url], ingester, state, once=True)
+
+    # The pending episode isn't resubmitted once it has been ingested
+    assert ingester.submitted == ["ep-1", "ep-2"]
+    assert "content_hash" not in state[url]
+    assert state[url]["seen_ids"] == ["ep-1", "ep-2"]
@@ -0,0 +1,22 @@
+from src.insert_data_into_postgres_segmented_text import get_segment_rows
+
+
+def test_get_segment_rows():
+    """Test that segments are flattened into indexed rows with a hash each."""
+    transcript = {
+        "id": "a",
+        "segmented_text": [
+            {"start": 0.0, "end": 1.0, "text": "hi"},
+            {"start": 1.0, "end": 2.0, "text": "hi"},
+        ],
+    }
+
+    rows = list(get_segment_rows(transcript))
+
+    assert [row[:5] for row in rows] == [
+        ("a", 1, "hi", 0.0, 1.0),
+        ("a", 2, "hi", 1.0, 2.0),
+    ]
+    # The index and times are part of the hash, not just the text
+    assert rows[0][5] != rows[1][5]
+    assert list(get_segment_rows({"id": "b", "segmented_text": None})) == []
@@ -0,0 +1,25 @@
+from src.keywords import KeywordMatcher, get_keyword_pattern, soundex
+
+
+def test_soundex():
+    """Test that words that sound alike get the same code."""
+    assert soundex("Trump") == soundex("Tromp") == "T651"
+    assert soundex("Biden") == soundex("Byden") == "B350"
+    assert soundex("Ashcraft") == "A261"
+    assert soundex("42") == ""
+
+
+def test_keyword_matcher():
+    """Test that misheard names match but other words that sound alike don't."""
+    matcher = KeywordMatcher(["Trump", "Biden"])
+
+    assert matcher.matches("President Trump's speech")
+    assert matcher.matches("and then Bidon said")
+    assert not matcher.matches("the bottom of the button")
+    assert not KeywordMatcher(["Trump"], fuzzy=False).matches("Tromp")
+
+
+def test_get_keyword_pattern():
+    """Test that keywords are matched as whole words, with symbols escaped."""
+    assert get_keyword_pattern(["biden", "trump"]) == r"\m(biden|trump)\M"
+    assert get_keyword_pattern(["c++"]) == r"\m(c\+\+)\M"
@@ -0,0 +1,96 @@
+import json
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import src.metrics as metrics
+
+
+def test_counters_and_timers():
+    """Test that counters add up and timers record each duration."""
+    metrics.reset()
+    metrics.increment("db_rows")
+    metrics.increment("db_rows", 2)
+    metrics.record_time("fetch", 0.5)
+    metrics.record_time("fetch", 1.5)
+
+    data = metrics.snapshot()
+
+    assert data["counters"] == {"db_rows": 3}
+    assert data["timers"] == {"fetch": {"count": 2, "sum": 2.0, "max": 1.5}}
+
+
+def test_drain_and_merge():
+    """Test that metrics drained in a worker can be merged in the parent."""
+    metrics.reset()
+    metrics.increment("segments", 10)
+    metrics.record_time("inference", 2.0)
+    worker_metrics = metrics.drain()
+
+    assert metrics.snapshot() == {"counters": {}, "timers": {}}
+
+    metrics.merge(worker_metrics)
+    metrics.merge(worker_metrics)
+
+    data = metrics.snapshot()
+    assert data["counters"] == {"segments": 20}
+    assert data["timers"]["inference"] == {"count": 2, "sum": 4.0, "max": 2.0}
+
+
+def count_in_worker(value: int):
+    """Counts in a pool worker and sends the metrics back, like the scripts do."""
+    metrics.increment("fetch_bytes", value)
+    return metrics.drain()
+
+
+def test_forked_workers_start_empty():
+    """Test that forked workers don't send the parent's metrics back to it."""
+    metrics.reset()
+    metrics.increment("fetch_bytes", 1000)
+
+    context = multiprocessing.get_context("fork")
+    with ProcessPoolExecutor(max_workers=4, mp_context=context) as pool:
+        for worker_metrics in pool.map(count_in_worker, [1] * 8):
+            metrics.merge(worker_metrics)
+
+    assert metrics.snapshot()["counters"] == {"fetch_bytes": 1008}
+
+
+def test_log_progress_batched(monkeypatch):
+    """Test that progress is logged once per multiple a batched counter passes."""
+    events = []
+    monkeypatch.setattr(
+        metrics, "log_event", lambda event, **fields: events.append(fields)
+    )
+    metrics.reset()
+
+    for batch in [400, 400, 400, 1500, 10]:
+        metrics.increment("db_rows", batch)
+        metrics.log_progress("db_rows", every=1000)
+
+    assert [fields["db_rows"] for fields in events] == [1200, 2700]
+
+
+def test_format_prometheus():
+    """Test that metrics are exported in the Prometheus text format."""
+    metrics.reset()
+    metrics.increment("download_bytes", 1024)
+    metrics.record_time("download", 0.25)
+
+    text = metrics.format_prometheus()
+
+    assert "# TYPE csmap_download_bytes_total counter" in text
+    assert 'csmap_download_bytes_total{script="csmap"} 1024' in text
+    assert 'csmap_download_seconds_count{script="csmap"} 1' in text
+    assert 'csmap_download_seconds_sum{script="csmap"} 0.25' in text
+
+
+def test_json_formatter():
+    """Test that log events are formatted as JSON with their fields."""
+    record = logging.LogRecord("csmap", logging.INFO, "", 0, "feed_failed", (), None)
+    record.fields = {"url": "http://example.com/feed"}
+
+    entry = json.loads(metrics.JsonFormatter().format(record))
+
+    assert entry["event"] == "feed_failed"
+    assert entry["url"] == "http://example.com/feed"
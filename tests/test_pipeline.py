@@ -0,0 +1,70 @@
+import argparse
+import threading
+
+from src.pipeline import describe_plan, get_descendants, run_pipeline
+
+
+def test_get_descendants():
+    """Test that --from selects a stage and everything downstream of it."""
+    assert get_descendants("download") == {
+        "download",
+        "transcribe",
+        "load_full_text",
+        "load_segmented_text",
+    }
+
+
+def test_run_pipeline_runs_independent_stages_concurrently():
+    """Test that sibling stages overlap and receive their dependency's output."""
+    barrier = threading.Barrier(2, timeout=5)
+
+    def sibling(args, outputs):
+        # Both siblings must be running at once to get past the barrier
+        barrier.wait()
+        return outputs["first"] + 1
+
+    stages = {
+        "first": {"func": lambda args, outputs: 1, "depends_on": []},
+        "left": {"func": sibling, "depends_on": ["first"]},
+        "right": {"func": sibling, "depends_on": ["first"]},
+    }
+
+    outputs, failed = run_pipeline(argparse.Namespace(), set(stages), stages)
+
+    assert outputs == {"first": 1, "left": 2, "right": 2}
+    assert failed == set()
+
+
+def test_run_pipeline_skips_dependents_of_failed_stages():
+    """Test that a failed stage's dependents are skipped but others still run."""
+
+    def fail(args, outputs):
+        raise RuntimeError("boom")
+
+    stages = {
+        "broken": {"func": fail, "depends_on": []},
+        "after_broken": {"func": lambda args, outputs: "ran", "depends_on": ["broken"]},
+        "independent": {"func": lambda args, outputs: "ran", "depends_on": []},
+    }
+
+    outputs, failed = run_pipeline(argparse.Namespace(), set(stages), stages)
+
+    assert outputs == {"independent": "ran"}
+    assert failed == {"broken", "after_broken"}
+
+
+def test_describe_plan(tmp_path, monkeypatch):
+    """Test that a dry run lists the stages and the files they'd read."""
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "data").mkdir()
+    (tmp_path / "data" / "episode_metadata.json").write_text("[]")
+
+    assert describe_plan({"load_episode", "download", "transcribe"}) == [
+        "load_episode: now, reads data/episode_metadata.json (found)",
+        "download: now, reads data/episode_metadata.json (found)",
+        "transcribe: after download",
+    ]
+    assert describe_plan({"extract", "load_show"}) == [
+        "extract: now",
+        "load_show: after extract",
+    ]
@@ -0,0 +1,48 @@
+from datetime import date, datetime, timezone
+
+import src.query_service as query_service
+from src.query_service import ResultCache, get_window, is_affected
+
+
+def test_result_cache_evicts_and_expires(monkeypatch):
+    """Test that the least recently used and expired entries are dropped."""
+    now = [0.0]
+    monkeypatch.setattr(query_service.time, "monotonic", lambda: now[0])
+    cache = ResultCache(max_size=2, ttl=10)
+
+    cache.put("a", 1, cache.generation)
+    cache.put("b", 2, cache.generation)
+    assert cache.get("a") == 1
+    cache.put("c", 3, cache.generation)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    now[0] = 10.0
+    assert cache.get("c") is None
+
+
+def test_result_cache_skips_results_read_before_invalidation():
+    """Test that a result read before an invalidation isn't cached after it."""
+    cache = ResultCache()
+    cache.put("a", 1, cache.generation)
+    cache.put("b", 2, cache.generation)
+
+    generation = cache.generation
+    assert cache.invalidate(lambda key, value: value == 1) == 1
+
+    assert not cache.put("c", 3, generation)
+    assert cache.get("a") is None
+    assert cache.get("b") == 2
+
+
+def test_is_affected():
+    """Test that a change affects searches that found it or could find it."""
+    start, end = get_window(date(2024, 11, 5), 14)
+    key = (("trump",), start, end)
+    results = [{"id": "a", "episode_title": "A", "podcast_title": "Show"}]
+    inside = datetime(2024, 11, 1, tzinfo=timezone.utc)
+    outside = datetime(2020, 1, 1, tzinfo=timezone.utc)
+
+    assert is_affected(key, results, ["a"], [outside])
+    assert is_affected(key, results, ["b"], [inside])
+    assert not is_affected(key, results, ["b"], [outside])
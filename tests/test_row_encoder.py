@@ -0,0 +1,28 @@
+import json
+
+from src.row_encoder import compile_row_encoder, get_placeholders
+
+
+def test_compile_row_encoder():
+    """Test that a record becomes its row's parameters without being modified."""
+    encode_row = compile_row_encoder(["id", "links", "title"], ["links"])
+    record = {"id": "a", "links": [{"href": "x"}], "extra": 1}
+
+    row_id, links, title, row_hash = encode_row(record)
+
+    assert (row_id, title) == ("a", None)
+    assert json.loads(links.obj) == [{"href": "x"}]
+    assert record == {"id": "a", "links": [{"href": "x"}], "extra": 1}
+
+    # The hash only changes with the written columns
+    assert encode_row({**record, "extra": 2})[-1] == row_hash
+    assert encode_row({**record, "links": []})[-1] != row_hash
+    assert encode_row({**record, "links": None})[-1] != row_hash
+
+
+def test_compile_row_encoder_edge_cases():
+    """Test encoders with no JSON columns, only JSON columns and no hash."""
+    assert compile_row_encoder(["id"], with_hash=False)({"id": "a"}) == ("a",)
+    assert len(compile_row_encoder(["id"])({"id": "a"})) == 2
+    assert compile_row_encoder(["links"], ["links"])({})[0] is None
+    assert get_placeholders(["id", "links"]) == "%s, %s"
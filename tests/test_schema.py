@@ -0,0 +1,47 @@
+import feedparser
+
+from src.schema import (
+    EPISODE_FIELDS,
+    SHOW_FIELDS,
+    get_columns,
+    get_json_columns,
+    project,
+)
+
+FEED = b"""<?xml version="1.0"?>
+<rss version="2.0" xmlns:itunes="http://www.itunes.com/dtds/podcast-1.0.dtd">
+<channel><title>Show</title><ttl>60</ttl><docs>http://example.com/docs</docs>
+<item><guid isPermaLink="false">one</guid><title>Episode</title>
+<pubDate>Fri, 01 Nov 2024 08:00:00 -0400</pubDate>
+<itunes:duration>1:02:03</itunes:duration><comments>http://example.com</comments>
+</item>
+<item><guid isPermaLink="false">two</guid><pubDate>not a date</pubDate></item>
+</channel></rss>"""
+
+
+def test_project_keeps_declared_fields_normalized():
+    """Test that only declared fields are kept, with dates and durations converted."""
+    feed = feedparser.parse(FEED, response_headers={"content-location": "http://x"})
+    show = project(feed.feed, SHOW_FIELDS)
+    episode, undated = [project(entry, EPISODE_FIELDS) for entry in feed.entries]
+
+    assert "docs" not in show
+    assert show["ttl"] == "60"
+    assert "comments" not in episode
+    assert "published_parsed" not in episode
+    assert episode["published"] == "2024-11-01T12:00:00+00:00"
+    assert episode["duration_seconds"] == 3723.0
+    # The detail keeps its metadata, but not a second copy of the title
+    assert episode["title_detail"]["base"] == "http://x"
+    assert "value" not in episode["title_detail"]
+    # Dates feedparser can't parse are kept as written
+    assert undated["published"] == "not a date"
+    assert "duration_seconds" not in undated
+
+
+def test_columns_leave_out_internal_fields():
+    """Test that the loaders' columns skip fields only the pipeline uses."""
+    assert "ttl" not in get_columns(SHOW_FIELDS)
+    assert "duration_seconds" in get_columns(EPISODE_FIELDS)
+    assert "title_detail" in get_json_columns(EPISODE_FIELDS)
+    assert "title" not in get_json_columns(EPISODE_FIELDS)
@@ -0,0 +1,38 @@
+import pickle
+
+from src.segments import SegmentList
+
+SEGMENTS = [
+    {"start": 0.0, "end": 2.0, "text": " Hello"},
+    {"start": 2.0, "end": 5.5, "text": " and welcome"},
+    {"start": 5.5, "end": 9.0, "text": " to the show."},
+]
+
+
+def test_segment_list_round_trip():
+    """Test that segments convert to compact form and back unchanged."""
+    segments = SegmentList.from_dicts(SEGMENTS)
+
+    assert len(segments) == 3
+    assert segments.to_list() == SEGMENTS
+    assert segments.text == " Hello and welcome to the show."
+    assert segments[-1] == SEGMENTS[2]
+
+
+def test_segment_list_between():
+    """Test that slicing by time returns only the overlapping segments."""
+    segments = SegmentList.from_dicts(SEGMENTS)
+
+    assert segments.between(2.5, 6.0) == SEGMENTS[1:3]
+    assert segments.between(0.0, 2.0) == SEGMENTS[:1]
+    assert len(segments.between(10.0, 20.0)) == 0
+
+
+def test_segment_list_pickle():
+    """Test that a pickled SegmentList is restored unchanged."""
+    segments = SegmentList.from_dicts(SEGMENTS)[1:]
+
+    restored = pickle.loads(pickle.dumps(segments))
+
+    assert restored == segments
+    assert restored.get_text(0) == " and welcome"
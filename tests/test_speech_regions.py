@@ -0,0 +1,63 @@
+import pytest
+
+from src.segments import SegmentList
+from src.speech_regions import OffsetMap, find_speech_regions, remove_non_speech
+
+SAMPLE_RATE = 1000
+
+
+def make_audio(pattern):
+    """Builds audio from (seconds, is_speech) pairs, with speech as a loud tone."""
+    np = pytest.importorskip("numpy")
+
+    parts = []
+    for seconds, is_speech in pattern:
+        t = np.arange(int(seconds * SAMPLE_RATE)) / SAMPLE_RATE
+        amplitude = 0.5 if is_speech else 0.0001
+        parts.append(amplitude * np.sin(2 * np.pi * 100 * t))
+
+    return np.concatenate(parts).astype(np.float32)
+
+
+def test_offset_map_restores_original_times():
+    """Test that segment times move back past the silences that were cut."""
+    offset_map = OffsetMap([(2.0, 5.0), (10.0, 12.0)])
+    segments = SegmentList([0.5, 2.5, 3.0], [2.5, 3.0, 4.5], ["a", "b", "c"])
+
+    restored = offset_map.restore(segments).to_list()
+
+    assert restored == [
+        {"start": 2.5, "end": 4.5, "text": "a"},
+        {"start": 4.5, "end": 5.0, "text": "b"},
+        {"start": 10.0, "end": 11.5, "text": "c"},
+    ]
+
+
+def test_find_speech_regions_drops_long_silences():
+    """Test that long silences are dropped and short pauses are kept."""
+    audio = make_audio([(3, False), (2, True), (0.5, False), (2, True), (4, False)])
+
+    regions = find_speech_regions(audio, SAMPLE_RATE)
+
+    assert len(regions) == 1
+    start, end = regions[0]
+    assert start == pytest.approx(2.8 * SAMPLE_RATE, abs=0.05 * SAMPLE_RATE)
+    assert end == pytest.approx(7.7 * SAMPLE_RATE, abs=0.05 * SAMPLE_RATE)
+
+
+def test_remove_non_speech():
+    """Test that the shortened audio maps back onto the original timeline."""
+    audio = make_audio([(2, True), (5, False), (2, True)])
+
+    shortened, offset_map = remove_non_speech(audio, SAMPLE_RATE)
+
+    assert len(shortened) == pytest.approx(4.4 * SAMPLE_RATE, abs=0.1 * SAMPLE_RATE)
+    assert offset_map.to_original(1.0) == pytest.approx(1.0)
+    assert offset_map.to_original(3.5) == pytest.approx(8.1, abs=0.05)
+
+
+def test_remove_non_speech_silent_file():
+    """Test that a silent file leaves nothing to transcribe."""
+    shortened, _ = remove_non_speech(make_audio([(3, False)]), SAMPLE_RATE)
+
+    assert len(shortened) == 0
@@ -0,0 +1,31 @@
+import os
+
+import src.stage_profiler as stage_profiler
+
+
+def test_stage_is_noop_when_disabled(monkeypatch):
+    """Test that stages share one no-op context manager when profiling is off."""
+    monkeypatch.setattr(stage_profiler, "_profile_dir", None)
+
+    assert not stage_profiler.is_enabled()
+    assert stage_profiler.stage("inference") is stage_profiler.stage("decode")
+
+
+def test_write_reports(tmp_path, monkeypatch):
+    """Test that stage profiles are merged into a report per stage."""
+    monkeypatch.setattr(stage_profiler, "_profilers", {})
+    monkeypatch.setenv(stage_profiler.PROFILE_DIR_ENV, "")
+    stage_profiler.enable(str(tmp_path))
+
+    try:
+        with stage_profiler.stage("parse"):
+            sorted(range(1000), reverse=True)
+        with stage_profiler.stage("parse"):
+            sum(range(1000))
+
+        stage_profiler.write_reports()
+    finally:
+        monkeypatch.setattr(stage_profiler, "_profile_dir", None)
+
+    assert sorted(os.listdir(tmp_path)) == ["parse.prof", "parse.txt"]
+    assert "sorted" in (tmp_path / "parse.txt").read_text()
@@ -1,4 +1,25 @@
-from src.transcribe_audio import create_full_text_dict, create_segmented_text_dict
+import json
+import socket
+import sys
+
+import pytest
+
+import src.transcribe_audio as transcribe_audio
+from src.keywords import KeywordMatcher
+from src.segments import SegmentList
+from src.transcribe_audio import (
+    calibrate,
+    configure,
+    create_full_text_dict,
+    create_segmented_text_dict,
+    get_calibration_candidates,
+    get_refine_windows,
+    load_settings,
+    read_transcribed_ids,
+    refine_segments,
+    save_transcript,
+    save_transcriptions,
+)
 
 
 def test_create_full_text_dict():
@@ -13,3 +34,162 @@ def test_create_segmented_text_dict():
     segments = [{"start": 0.0, "end": 1.0, "text": "hi friend!"}]
     result = create_segmented_text_dict(segments, "test_id")
     assert result == {"id": "test_id", "segmented_text": segments}
+
+
+def test_create_full_text_dict_segment_list():
+    """Test that the full text comes straight from a SegmentList's text."""
+    segments = SegmentList.from_dicts(
+        [
+            {"start": 0.0, "end": 1.0, "text": "hi "},
+            {"start": 1.0, "end": 2.0, "text": "friend!"},
+        ]
+    )
+    result = create_full_text_dict(segments, "test_id")
+    assert result == {"id": "test_id", "full_text": "hi friend!"}
+
+
+def test_save_transcriptions_from_store(tmp_path, monkeypatch):
+    """Test that the output JSONs are built from per-episode transcripts."""
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "data").mkdir()
+    transcript_dir = str(tmp_path / "data" / "transcripts")
+    segments = [{"start": 0.0, "end": 1.0, "text": "hi "}]
+
+    # An episode transcribed before per-episode files existed
+    with open("data/segmented_text_transcriptions.json", "w") as f:
+        json.dump([{"id": "old", "segmented_text": segments}], f)
+
+    assert read_transcribed_ids(transcript_dir) == {"old"}
+
+    # The combined output is only read the first time
+    with open("data/segmented_text_transcriptions.json", "w") as f:
+        json.dump([{"id": "older", "segmented_text": segments}], f)
+    assert read_transcribed_ids(transcript_dir) == {"old"}
+
+    save_transcript({"id": "new", "segmented_text": segments}, transcript_dir)
+    save_transcriptions(transcript_dir)
+
+    with open("data/full_text_transcriptions.json") as f:
+        assert json.load(f) == [
+            {"id": "new", "full_text": "hi "},
+            {"id": "old", "full_text": "hi "},
+        ]
+    with open("data/segmented_text_transcriptions.json") as f:
+        assert json.load(f) == [
+            {"id": "new", "segmented_text": segments},
+            {"id": "old", "segmented_text": segments},
+        ]
+
+
+def test_load_settings_and_configure(tmp_path, monkeypatch):
+    """Test that this machine's saved settings override the constants."""
+    for constant in transcribe_audio.SETTINGS.values():
+        monkeypatch.setattr(
+            transcribe_audio, constant, getattr(transcribe_audio, constant)
+        )
+
+    config_path = tmp_path / "transcribe_config.json"
+    config_path.write_text(
+        json.dumps(
+            {
+                socket.gethostname(): {"num_workers": 16, "cpu_threads": 2},
+                "other-host": {"num_workers": 64},
+            }
+        )
+    )
+
+    settings = load_settings(str(config_path))
+    assert settings["num_workers"] == 16
+    assert settings["cpu_threads"] == 2
+    assert settings["model_size"] == transcribe_audio.MODEL_SIZE
+
+    # Flags left unset don't override anything
+    configure(settings)
+    configure({"num_workers": None, "compute_type": "float32"})
+    assert transcribe_audio.NUM_WORKERS == 16
+    assert transcribe_audio.COMPUTE_TYPE == "float32"
+
+
+def test_get_calibration_candidates():
+    """Test that process counts and threads are spread across the cores."""
+    candidates = get_calibration_candidates("cpu", cpu_count=6)
+    combos = {(c["num_workers"], c["cpu_threads"]) for c in candidates}
+
+    assert combos == {(1, 6), (1, 3), (2, 3), (2, 1), (4, 1), (6, 1)}
+    assert len(candidates) == len(combos) * 2
+
+
+def test_calibrate_saves_fastest(tmp_path, monkeypatch):
+    """Test that the fastest configuration is saved alongside other machines'."""
+    config_path = tmp_path / "transcribe_config.json"
+    config_path.write_text(json.dumps({"other-host": {"num_workers": 64}}))
+    monkeypatch.setattr(
+        transcribe_audio,
+        "get_calibration_candidates",
+        lambda device: [{"num_workers": n, "cpu_threads": 8 // n} for n in (1, 2, 4)],
+    )
+    monkeypatch.setattr(
+        transcribe_audio,
+        "measure_throughput",
+        lambda settings, sample, seconds: {1: 10.0, 2: 30.0, 4: 20.0}[
+            settings["num_workers"]
+        ],
+    )
+
+    best = calibrate("sample.mp3", str(config_path))
+
+    assert best["num_workers"] == 2
+    assert best["audio_seconds_per_second"] == 30.0
+    saved = json.loads(config_path.read_text())
+    assert saved[socket.gethostname()] == best
+    assert saved["other-host"] == {"num_workers": 64}
+
+
+def test_get_refine_windows():
+    """Test that keyword segments and their neighbors are merged into runs."""
+    segments = SegmentList(
+        range(6), range(1, 7), ["a", "Trump", "b", "Bidon", "c", "d"]
+    )
+
+    windows = get_refine_windows(segments, KeywordMatcher(["Trump", "Biden"]))
+
+    assert windows == [(0, 5)]
+    assert get_refine_windows(segments, KeywordMatcher(["Trump"]), 0) == [(1, 2)]
+
+
+def test_refine_segments(monkeypatch):
+    """Test that re-transcribed segments replace the originals at the same times."""
+
+    class RefineModel:
+        def transcribe(self, audio, language):
+            # The clip runs from the segment before the keyword to the one
+            # after it, at one sample per second
+            assert audio == [1, 2, 3]
+            return {"segments": [{"start": 0.5, "end": 2.0, "text": "Biden"}]}
+
+    monkeypatch.setattr(transcribe_audio, "SAMPLE_RATE", 1)
+    monkeypatch.setattr(transcribe_audio, "refine_model", RefineModel())
+    monkeypatch.setattr(transcribe_audio, "refine_matcher", KeywordMatcher(["Biden"]))
+    segments = SegmentList(range(5), range(1, 6), ["a", "b", "Bidon", "c", "d"])
+
+    refined = refine_segments(segments, list(range(5)))
+
+    assert refined.to_list() == [
+        {"start": 0.0, "end": 1.0, "text": "a"},
+        {"start": 1.5, "end": 3.0, "text": "Biden"},
+        {"start": 4.0, "end": 5.0, "text": "d"},
+    ]
+
+
+def test_calibrate_without_audio_exits(tmp_path, monkeypatch):
+    """Test that --calibrate explains what's missing when nothing is downloaded."""
+    monkeypatch.setattr(transcribe_audio, "AUDIO_DIR", str(tmp_path / "audio"))
+    monkeypatch.setattr(transcribe_audio.metrics, "configure", lambda script: None)
+    monkeypatch.setattr(
+        sys,
+        "argv",
+        ["transcribe_audio.py", "--calibrate", "--config", str(tmp_path / "c.json")],
+    )
+
+    with pytest.raises(SystemExit, match="No MP3s"):
+        transcribe_audio.main()
@@ -1,7 +1,22 @@
 import json
 import os
+import time
+from datetime import datetime, timezone
 
-from src.utils import read_data_from_json, save_data_to_json
+import pytest
+
+import src.utils as utils
+from src.utils import (
+    get_duration_seconds,
+    get_json_encoder,
+    get_row_hash,
+    get_stage_path,
+    read_data,
+    read_data_from_json,
+    read_parquet_table,
+    save_data,
+    save_data_to_json,
+)
 
 
 def test_save_data_to_json(tmp_path):
@@ -28,3 +43,169 @@ def test_read_data_from_json(tmp_path):
     result = read_data_from_json(str(filepath))
 
     assert result == data
+
+
+def test_parquet_segments_round_trip(tmp_path):
+    """Test that segments are stored one per row and regrouped on read."""
+    pytest.importorskip("pyarrow")
+    data = [
+        {
+            "id": "a",
+            "segmented_text": [
+                {"start": 0.0, "end": 1.5, "text": "hi"},
+                {"start": 1.5, "end": 3.0, "text": " friend!"},
+            ],
+        },
+        {"id": "b", "segmented_text": [{"start": 0.0, "end": 2.0, "text": "bye"}]},
+    ]
+    filepath = tmp_path / "segmented_text_transcriptions.parquet"
+
+    save_data(data, str(filepath), "segmented_text_transcriptions")
+
+    assert read_parquet_table(str(filepath)).num_rows == 3
+    assert read_data(str(filepath)) == data
+
+
+def test_parquet_episode_projection_and_filters(tmp_path):
+    """Test that episode columns can be projected and filtered on read."""
+    pytest.importorskip("pyarrow")
+    data = [
+        {
+            "id": "old",
+            "published": "2023-01-01T00:00:00+00:00",
+            "links": [{"href": "http://example.com/old.mp3", "type": "audio/mpeg"}],
+        },
+        {
+            "id": "new",
+            "published": "2024-11-01T12:00:00+00:00",
+            "links": [{"href": "http://example.com/new.mp3", "type": "audio/mpeg"}],
+        },
+    ]
+    filepath = tmp_path / "episode_metadata.parquet"
+    save_data(data, str(filepath), "episode_metadata")
+
+    table = read_parquet_table(
+        str(filepath),
+        columns=["id", "audio_url"],
+        filters=[("published_at", ">=", datetime(2024, 1, 1, tzinfo=timezone.utc))],
+    )
+
+    assert table.to_pylist() == [
+        {"id": "new", "audio_url": "http://example.com/new.mp3"}
+    ]
+    assert read_data(str(filepath))[0]["links"] == data[0]["links"]
+
+
+@pytest.mark.parametrize("backend", ["json", "orjson", "msgspec"])
+def test_parquet_json_columns_use_backend(tmp_path, monkeypatch, backend):
+    """Test that nested Parquet fields are encoded with the configured backend."""
+    pytest.importorskip("pyarrow")
+    pytest.importorskip(backend)
+    monkeypatch.setattr(utils, "JSON_BACKEND", backend)
+    data = [
+        {
+            "id": "1",
+            "title_detail": {"type": "text/plain", "value": "Olá"},
+        }
+    ]
+    filepath = tmp_path / "episode_metadata.parquet"
+
+    save_data(data, str(filepath), "episode_metadata")
+
+    stored = read_parquet_table(str(filepath), columns=["title_detail"])
+    assert stored.column("title_detail")[0].as_py() == get_json_encoder(backend)(
+        data[0]["title_detail"]
+    ).decode("utf-8")
+    assert read_data(str(filepath))[0]["title_detail"] == data[0]["title_detail"]
+
+
+def test_parquet_show_keeps_ttl(tmp_path):
+    """Test that a show's internal `ttl` field survives a Parquet round trip."""
+    pytest.importorskip("pyarrow")
+    data = [{"title": "Show", "ttl": "60"}]
+    filepath = tmp_path / "show_metadata.parquet"
+
+    save_data(data, str(filepath), "show_metadata")
+
+    assert read_data(str(filepath))[0]["ttl"] == "60"
+
+
+def test_get_stage_path_env_override(monkeypatch):
+    """Test that a stage's format can be switched with an environment variable."""
+    assert get_stage_path("show_metadata") == os.path.join("data", "show_metadata.json")
+
+    monkeypatch.setenv("SHOW_METADATA_FORMAT", "parquet")
+
+    assert get_stage_path("show_metadata") == os.path.join(
+        "data", "show_metadata.parquet"
+    )
+
+
+@pytest.mark.parametrize("backend", ["json", "orjson", "msgspec"])
+@pytest.mark.parametrize("compact", [True, False])
+def test_json_backends_round_trip(tmp_path, monkeypatch, backend, compact):
+    """Test that every JSON backend reads back exactly what it wrote."""
+    pytest.importorskip(backend)
+    monkeypatch.setattr(utils, "JSON_BACKEND", backend)
+    monkeypatch.setattr(utils, "JSON_COMPACT", compact)
+    data = [
+        {
+            "id": "é1",
+            "published_parsed": time.gmtime(0),
+            "segmented_text": [{"start": 0.1, "end": 2.25, "text": " Olá"}],
+            "guidislink": False,
+            "image": None,
+        }
+    ]
+    filepath = tmp_path / "data.json"
+
+    save_data_to_json(data, str(filepath))
+
+    expected = json.loads(json.dumps(data))
+    assert read_data_from_json(str(filepath)) == expected
+    # Files written by any backend can be read by the stdlib
+    with open(filepath, "r", encoding="utf-8") as f:
+        assert json.load(f) == expected
+
+
+@pytest.mark.parametrize("backend", ["json", "orjson", "msgspec"])
+def test_get_json_encoder(backend):
+    """Test that every backend's compact encoder writes the same JSON."""
+    pytest.importorskip(backend)
+    value = {"title": "Olá", "published_parsed": time.gmtime(0), "links": [None]}
+
+    raw = get_json_encoder(backend)(value)
+
+    assert b" " not in raw
+    assert json.loads(raw) == json.loads(json.dumps(value))
+
+
+def test_zstd_json_round_trip(tmp_path):
+    """Test that `.json.zst` files are compressed and read back."""
+    pytest.importorskip("zstandard")
+    data = [{"id": "1", "full_text": "hello " * 1000}]
+    filepath = tmp_path / "full_text_transcriptions.json.zst"
+
+    save_data(data, str(filepath), "full_text_transcriptions")
+
+    assert os.path.getsize(filepath) < 1000
+    assert read_data(str(filepath)) == data
+
+
+def test_get_duration_seconds():
+    """Test that iTunes durations in seconds, MM:SS or HH:MM:SS are converted."""
+    assert get_duration_seconds({"itunes_duration": "3723"}) == 3723
+    assert get_duration_seconds({"itunes_duration": "62:03"}) == 3723
+    assert get_duration_seconds({"itunes_duration": "1:02:03"}) == 3723
+    assert get_duration_seconds({"itunes_duration": "about an hour"}) is None
+    assert get_duration_seconds({}) is None
+
+
+def test_get_row_hash():
+    """Test that the hash covers only the loaded columns, in a fixed order."""
+    columns = ["id", "text"]
+    row = {"id": "a", "text": "hi"}
+
+    assert get_row_hash(row, columns) == get_row_hash({**row, "extra": 1}, columns)
+    assert get_row_hash(row, columns) != get_row_hash({**row, "text": "bye"}, columns)
+    assert get_row_hash(row, columns) != get_row_hash({"id": "a"}, columns)
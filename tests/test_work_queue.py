@@ -0,0 +1,57 @@
+import src.work_queue as work_queue
+
+
+def test_claim_complete(tmp_path):
+    """Test that each episode is claimed by one worker and then finished."""
+    conn = work_queue.connect(str(tmp_path / "queue.sqlite"))
+    assert work_queue.enqueue(conn, [("a", "a.mp3"), ("b", "b.mp3")]) == 2
+    # Queueing an episode again doesn't reset it
+    assert work_queue.enqueue(conn, [("a", "a.mp3")]) == 0
+
+    first = work_queue.claim(conn, "worker-1")
+    second = work_queue.claim(conn, "worker-2")
+    assert {first["episode_id"], second["episode_id"]} == {"a", "b"}
+    assert work_queue.claim(conn, "worker-3") is None
+
+    # Only the worker holding the claim can finish it
+    work_queue.complete(conn, first["episode_id"], "worker-2")
+    work_queue.complete(conn, first["episode_id"], "worker-1")
+    assert work_queue.get_counts(conn) == {"claimed": 1, "done": 1}
+
+
+def test_expired_leases_are_retried(tmp_path, monkeypatch):
+    """Test that a crashed worker's episode is claimed again, up to a limit."""
+    monkeypatch.setattr(work_queue, "MAX_ATTEMPTS", 2)
+    conn = work_queue.connect(str(tmp_path / "queue.sqlite"))
+    work_queue.enqueue(conn, [("a", "a.mp3")])
+
+    # A live lease can't be taken, but one that has run out can
+    work_queue.claim(conn, "worker-1", lease_seconds=60)
+    assert work_queue.claim(conn, "worker-2") is None
+    conn.execute("UPDATE tasks SET lease_expires = 0")
+    assert work_queue.claim(conn, "worker-2", lease_seconds=0)["episode_id"] == "a"
+
+    # Heartbeats keep the claim alive
+    assert work_queue.heartbeat(conn, "worker-2") == 1
+    assert work_queue.claim(conn, "worker-3") is None
+
+    # After the last attempt runs out, the episode is given up on
+    conn.execute("UPDATE tasks SET lease_expires = 0")
+    assert work_queue.claim(conn, "worker-3") is None
+    assert work_queue.get_counts(conn) == {"failed": 1}
+
+    # Queueing it again resets it
+    assert work_queue.enqueue(conn, [("a", "a.mp3")]) == 1
+    assert work_queue.get_counts(conn) == {"pending": 1}
+
+
+def test_failed_episodes_are_retried(tmp_path, monkeypatch):
+    """Test that an error releases the episode until it runs out of attempts."""
+    monkeypatch.setattr(work_queue, "MAX_ATTEMPTS", 2)
+    conn = work_queue.connect(str(tmp_path / "queue.sqlite"))
+    work_queue.enqueue(conn, [("a", "a.mp3")])
+
+    for status in ("pending", "failed"):
+        work_queue.claim(conn, "worker-1")
+        work_queue.fail(conn, "a", "worker-1", "decode error")
+        assert work_queue.get_counts(conn) == {status: 1}